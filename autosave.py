@@ -0,0 +1,393 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from logger import log_info, log_error, log_debug
+from metrics import counter, histogram
+from textdiff import common_affixes
+
+try:
+    import fcntl
+except ImportError:     # Windows 没有 fcntl，使用 msvcrt 的文件锁
+    fcntl = None
+    import msvcrt
+
+# 自动保存目录，与日志目录一样位于程序目录下
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUTOSAVE_DIR = os.path.join(BASE_DIR, 'autosave')
+
+# 收到修改后等待的秒数，期间的连续修改合并为一次写入
+DEFAULT_AUTOSAVE_INTERVAL = 2.0
+
+# 日志超过该字节数且大于快照时压缩为新的快照
+COMPACT_MIN_BYTES = 256 * 1024
+
+SNAPSHOT_SUFFIX = '.snapshot.json'
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+
+# 重放日志时文本分块的字符数，每条日志只复制所在的块
+_REPLAY_CHUNK = 4096
+
+# 性能指标：日志追加和快照写出的耗时与字符数
+_WRITE_SECONDS = {
+    kind: histogram('nextmd_autosave_write_seconds', '自动保存写入耗时（秒）', {'kind': kind})
+    for kind in ('journal', 'snapshot')
+}
+_WRITE_CHARS = {
+    kind: counter('nextmd_autosave_write_chars_total', '自动保存写入的字符数', {'kind': kind})
+    for kind in ('journal', 'snapshot')
+}
+
+
+def _try_lock(path):
+    """
+    以非阻塞方式独占锁定文件，锁随文件关闭或进程退出释放
+
+    Returns:
+        打开的锁文件对象，已被其他进程（或本进程的其他会话对象）锁定时返回None
+    """
+    f = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class _ReplayBuffer:
+    """
+    重放日志用的分块文本
+    每条日志只替换所在的块，而不是复制整篇文档；编辑位置通常相邻，从上一次的位置开始查找块
+    """
+
+    def __init__(self, text):
+        self.chunks = [text[i:i + _REPLAY_CHUNK] for i in range(0, len(text), _REPLAY_CHUNK)] or ['']
+        self._index = 0     # 上一次编辑所在的块
+        self._start = 0     # 该块在文本中的起始位置
+
+    def replace(self, start, end, text):
+        """把 [start, end) 替换为 text"""
+        chunks = self.chunks
+        last = len(chunks) - 1
+        index, offset = self._index, self._start
+        while start < offset:
+            index -= 1
+            offset -= len(chunks[index])
+        while index < last and start >= offset + len(chunks[index]):
+            offset += len(chunks[index])
+            index += 1
+        stop, stop_offset = index, offset
+        while stop < last and end > stop_offset + len(chunks[stop]):
+            stop_offset += len(chunks[stop])
+            stop += 1
+
+        piece = chunks[index][:start - offset] + text + chunks[stop][end - stop_offset:]
+        if len(piece) > 2 * _REPLAY_CHUNK:
+            chunks[index:stop + 1] = [piece[i:i + _REPLAY_CHUNK] for i in range(0, len(piece), _REPLAY_CHUNK)]
+        elif piece or len(chunks) == stop - index + 1:
+            chunks[index:stop + 1] = [piece]
+        else:
+            del chunks[index:stop + 1]
+            if index > 0:
+                index -= 1
+                offset -= len(chunks[index])
+        self._index, self._start = index, offset
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class AutosaveSession:
+    """
+    单个文档的自动保存会话
+    首次写入完整快照，之后只把编辑差异追加到日志；日志增长到与快照相当时再压缩为新快照，
+    因此平均写入量与编辑量成正比，而不是与文档大小成正比
+    快照和每条日志都带有代数，写出新快照后旧日志尚未清空时崩溃，恢复时跳过属于旧快照的日志
+    """
+
+    def __init__(self, directory, session_id=None):
+        """
+        初始化会话
+
+        Args:
+            directory (str): 自动保存目录
+            session_id (str, optional): 会话ID，默认随机生成
+        """
+        self.session_id = session_id or uuid.uuid4().hex
+        self.snapshot_path = os.path.join(directory, self.session_id + SNAPSHOT_SUFFIX)
+        self.journal_path = os.path.join(directory, self.session_id + JOURNAL_SUFFIX)
+        self.lock_path = os.path.join(directory, self.session_id + LOCK_SUFFIX)
+        self._lock = None
+        self.text = None
+        self.path = None
+        self._snapshot_bytes = 0
+        self._journal_bytes = 0
+        self._generation = 0
+
+    def write(self, path, text):
+        """
+        记录文档的当前内容
+
+        Args:
+            path (str): 文档的文件路径，未保存的新文档为None
+            text (str): 文档当前内容
+        """
+        if self.text is None:
+            self._write_snapshot(path, text)
+            return
+        if text == self.text and path == self.path:
+            return
+
+        entries = []
+        if path != self.path:
+            entries.append({'g': self._generation, 'path': path})
+        if text != self.text:
+            prefix, suffix = common_affixes(self.text, text)
+            entries.append({
+                'g': self._generation,
+                's': prefix,
+                'e': len(self.text) - suffix,
+                't': text[prefix:len(text) - suffix]
+            })
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        with _WRITE_SECONDS['journal'].time(), open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(data)
+        _WRITE_CHARS['journal'].inc(len(data))
+        self._journal_bytes += len(data)
+        self.text = text
+        self.path = path
+
+        if self._journal_bytes > max(COMPACT_MIN_BYTES, self._snapshot_bytes):
+            log_debug(f"自动保存日志压缩为快照: {self.session_id}")
+            self._write_snapshot(path, text)
+
+    def _write_snapshot(self, path, text):
+        """写出完整快照（先写临时文件再替换），并清空日志"""
+        generation = self._generation + 1
+        data = json.dumps({'path': path, 'text': text, 'time': time.time(), 'generation': generation},
+                          ensure_ascii=False)
+        temp_path = self.snapshot_path + '.tmp'
+        with _WRITE_SECONDS['snapshot'].time():
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.snapshot_path)
+            with open(self.journal_path, 'w', encoding='utf-8'):
+                pass
+        _WRITE_CHARS['snapshot'].inc(len(data))
+        self._snapshot_bytes = len(data)
+        self._journal_bytes = 0
+        self._generation = generation
+        self.text = text
+        self.path = path
+
+    def lock(self):
+        """
+        锁定会话，防止同时运行的其他窗口把它当作遗留会话恢复或删除
+
+        Returns:
+            bool: 是否成功锁定（会话正被其他窗口使用时返回False）
+        """
+        if self._lock is None:
+            self._lock = _try_lock(self.lock_path)
+        return self._lock is not None
+
+    def unlock(self):
+        """释放会话锁，会话文件保留"""
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def discard(self):
+        """删除会话文件并释放锁"""
+        for file_path in (self.snapshot_path, self.journal_path):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        if self._lock is not None:
+            self.unlock()
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                # 其他进程恰好打开了锁文件，留给下一次清理
+                pass
+
+    def load(self):
+        """
+        读取快照并重放日志，恢复会话内容
+
+        Returns:
+            tuple: (文件路径, 文本内容)
+        """
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        path, buffer = snapshot.get('path'), _ReplayBuffer(snapshot.get('text', ''))
+        generation = snapshot.get('generation')
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能不完整，忽略
+                        log_debug(f"跳过不完整的日志行: {self.session_id}")
+                        break
+                    if entry.get('g') != generation:
+                        # 替换快照后、清空日志前崩溃时遗留的旧日志，其内容已包含在快照中
+                        continue
+                    if 'path' in entry:
+                        path = entry['path']
+                    else:
+                        buffer.replace(entry['s'], entry['e'], entry['t'])
+        return path, buffer.getvalue()
+
+
+class AutosaveManager:
+    """
+    后台自动保存
+    Tk线程只把 (文档, 内容) 放入队列，差异计算、文件写入和遗留会话的读取都在后台线程完成；
+    每个会话在使用期间持有文件锁，同时运行的其他窗口不会把它当作遗留会话
+    """
+
+    def __init__(self, directory=AUTOSAVE_DIR, interval=DEFAULT_AUTOSAVE_INTERVAL):
+        """
+        启动自动保存线程
+
+        Args:
+            directory (str): 自动保存目录
+            interval (float): 合并连续修改的等待秒数
+        """
+        self.directory = directory
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._sessions = {}     # 标签页ID -> AutosaveSession，只在后台线程访问
+        self._orphans = {}      # 会话ID -> 已锁定、等待恢复或删除的遗留会话，只在后台线程访问
+        self._thread = threading.Thread(target=self._run, name="Autosave", daemon=True)
+        os.makedirs(directory, exist_ok=True)
+        self._thread.start()
+
+    def record(self, tab_id, path, text):
+        """记录标签页的当前内容（不阻塞）"""
+        self._queue.put(('record', tab_id, path, text))
+
+    def discard(self, tab_id):
+        """丢弃标签页的自动保存内容，例如文件已保存或用户放弃修改"""
+        self._queue.put(('discard', tab_id, None, None))
+
+    def find_sessions(self, results):
+        """
+        在后台线程中查找并读取上次未正常结束时遗留的会话（不阻塞）
+        其他正在运行的窗口锁定的会话被跳过；找到的会话保持锁定，直到调用 remove_session
+
+        Args:
+            results (queue.Queue): 读取完成后放入 (会话ID, 文件路径, 文本内容) 列表
+        """
+        self._queue.put(('find', None, None, results))
+
+    def remove_session(self, session_id):
+        """删除 find_sessions 找到的遗留会话（不阻塞）"""
+        self._queue.put(('remove', session_id, None, None))
+
+    def stop(self, discard_all=False, timeout=5.0):
+        """
+        停止自动保存线程，写完队列中剩余的内容
+
+        Args:
+            discard_all (bool): 是否同时删除所有会话（正常退出时）
+            timeout (float): 等待后台线程结束的秒数
+        """
+        self._queue.put(('stop', None, None, discard_all))
+        self._thread.join(timeout)
+
+    def _run(self):
+        pending = {}    # 标签页ID -> (路径, 内容)，只保留最新一次
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                action, tab_id, path, text = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush(pending)
+                deadline = None
+                continue
+
+            if action == 'record':
+                pending[tab_id] = (path, text)
+                if deadline is None:
+                    deadline = time.monotonic() + self.interval
+            elif action == 'discard':
+                pending.pop(tab_id, None)
+                session = self._sessions.pop(tab_id, None)
+                if session is not None:
+                    self._safe(session.discard)
+            elif action == 'find':
+                text.put(self._load_orphans())
+            elif action == 'remove':
+                session = self._orphans.pop(tab_id, None)
+                if session is not None:
+                    self._safe(session.discard)
+            elif action == 'stop':
+                self._flush(pending)
+                for session in self._sessions.values():
+                    self._safe(session.discard if text else session.unlock)
+                self._sessions.clear()
+                for session in self._orphans.values():
+                    session.unlock()
+                self._orphans.clear()
+                return
+
+    def _flush(self, pending):
+        """写出所有待保存的内容"""
+        for tab_id, (path, text) in pending.items():
+            session = self._sessions.get(tab_id)
+            if session is None:
+                session = self._sessions[tab_id] = AutosaveSession(self.directory)
+                session.lock()
+            self._safe(session.write, path, text)
+        pending.clear()
+
+    @staticmethod
+    def _safe(func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            log_error(f"自动保存失败: {str(e)}")
+
+    def _load_orphans(self):
+        """
+        锁定并读取遗留的会话
+
+        Returns:
+            list: (会话ID, 文件路径, 文本内容) 列表
+        """
+        sessions = []
+        if not os.path.isdir(self.directory):
+            return sessions
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            session_id = name[:-len(SNAPSHOT_SUFFIX)]
+            if session_id in self._orphans:
+                continue
+            session = AutosaveSession(self.directory, session_id)
+            try:
+                if not session.lock():
+                    log_debug(f"会话正被其他窗口使用，跳过: {session_id}")
+                    continue
+                path, text = session.load()
+            except Exception as e:
+                session.unlock()
+                log_error(f"读取自动保存会话失败: {session_id} - {str(e)}")
+                continue
+            self._orphans[session_id] = session
+            sessions.append((session_id, path, text))
+        if sessions:
+            log_info(f"发现 {len(sessions)} 个未保存的会话")
+        return sessions
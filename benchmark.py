@@ -0,0 +1,256 @@
+"""
+NextMD 性能基准脚本
+
+用法:
+    python benchmark.py templates [--pages N]
+    python benchmark.py memory [--sections N] [--max-ratio R]
+    python benchmark.py tables [--rows N] [--cols N]
+    python benchmark.py render [--docs N] [--sections N]
+    python benchmark.py ir [--sections N]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from converter import MarkdownConverter
+from docir import DocumentIR
+
+# 流式写入文件时内存峰值相对输入大小（UTF-8字节）的上限；流式转换逐段释放解析树和IR，
+# 峰值约为输入的60倍，几乎全部是解析HTML得到的解析树
+MAX_MEMORY_RATIO = 62
+
+
+def sample_markdown(sections=5):
+    """生成用于基准测试的典型Markdown文档"""
+    parts = []
+    for i in range(sections):
+        parts.append(f"## 第{i + 1}节 Section {i + 1}\n")
+        parts.append("这是一段包含 **粗体**、*斜体* 和 `行内代码` 的正文，"
+                     "用于模拟普通文档页面。Lorem ipsum dolor sit amet.\n")
+        parts.append("- 列表项一\n- 列表项二\n- [链接](other.md)\n")
+        parts.append("```python\ndef hello():\n    print('hello')\n```\n")
+        parts.append("| 名称 | 数值 |\n| --- | --- |\n| a | 1 |\n| b | 2 |\n")
+    return '\n'.join(parts)
+
+
+def bench_templates(pages=200):
+    """比较各模板模式的输出大小和渲染耗时"""
+    md_content = sample_markdown()
+    modes = [
+        ("内联样式", dict(css='inline', minify=False)),
+        ("内联样式+压缩", dict(css='inline', minify=True)),
+        ("外部样式表", dict(css='external', minify=False)),
+        ("外部样式表+压缩", dict(css='external', minify=True)),
+    ]
+    print(f"{'模式':<16}{'单页字节':>10}{'总字节':>12}{'单页耗时(ms)':>14}")
+    for label, options in modes:
+        # 预热，确保模板已编译
+        html_content = MarkdownConverter.md_to_html(md_content, **options)
+        start = time.perf_counter()
+        for _ in range(pages):
+            html_content = MarkdownConverter.md_to_html(md_content, **options)
+        elapsed = (time.perf_counter() - start) / pages * 1000
+        size = len(html_content.encode('utf-8'))
+        print(f"{label:<16}{size:>10}{size * pages:>12}{elapsed:>14.3f}")
+
+
+def _traced_peak(func):
+    """执行func并返回 (tracemalloc峰值字节数, 耗时秒)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, elapsed
+
+
+def bench_memory(sections=2000, max_ratio=MAX_MEMORY_RATIO):
+    """
+    比较HTML转Markdown时字符串输出与流式写文件的内存峰值
+
+    Args:
+        sections (int): 文档小节数
+        max_ratio (float): 流式写入的峰值相对输入大小允许的最大倍数
+
+    Returns:
+        bool: 流式写入的峰值未超过 max_ratio 倍输入，且不高于字符串输出时返回True
+    """
+    html_content = MarkdownConverter.md_to_html(sample_markdown(sections))
+    input_size = len(html_content.encode('utf-8'))
+    print(f"输入大小: {input_size / 1024:.1f} KB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'out.md')
+
+        def to_file():
+            with open(path, 'w', encoding='utf-8') as f:
+                MarkdownConverter.html_to_md_stream(html_content, f)
+
+        cases = [
+            ("html_to_md", lambda: MarkdownConverter.html_to_md(html_content)),
+            ("流式写入StringIO", lambda: MarkdownConverter.html_to_md_stream(html_content, io.StringIO())),
+            ("流式写入文件", to_file),
+        ]
+        peaks = {}
+        for label, func in cases:
+            MarkdownConverter.ir_cache.clear()     # 每种方式都从解析开始
+            peak, elapsed = _traced_peak(func)
+            peaks[label] = peak
+            print(f"{label:<20}峰值 {peak / 1024:>10.1f} KB  输入的 {peak / input_size:>5.2f} 倍  耗时 {elapsed:.3f}s")
+
+    ok = True
+    ratio = peaks["流式写入文件"] / input_size
+    if ratio > max_ratio:
+        print(f"失败: 流式写入文件的峰值为输入的 {ratio:.2f} 倍，超过上限 {max_ratio:.2f} 倍")
+        ok = False
+    if peaks["流式写入文件"] > peaks["html_to_md"]:
+        print("失败: 流式写入文件的峰值高于字符串输出")
+        ok = False
+    return ok
+
+
+def sample_table(rows, cols=5, nested_every=0):
+    """生成大型HTML表格，nested_every>0 时每隔若干行在单元格中嵌套一个小表格"""
+    parts = ['<table><thead><tr>']
+    parts.extend(f'<th>列{c}</th>' for c in range(cols))
+    parts.append('</tr></thead><tbody>')
+    for r in range(rows):
+        parts.append('<tr>')
+        for c in range(cols):
+            if nested_every and c == 0 and r % nested_every == 0:
+                parts.append('<td><table><tr><th>内</th></tr><tr><td>x</td></tr></table></td>')
+            else:
+                parts.append(f'<td>r{r}c{c} <b>v</b></td>')
+        parts.append('</tr>')
+    parts.append('</tbody></table>')
+    return ''.join(parts)
+
+
+def bench_tables(rows=50000, cols=5):
+    """大型表格的HTML转Markdown耗时，分别统计解析、建立IR和表格写出"""
+    from bs4 import BeautifulSoup
+
+    for label, nested_every in (("普通表格", 0), ("含嵌套表格", 100)):
+        html_content = sample_table(rows, cols, nested_every)
+        start = time.perf_counter()
+        soup = BeautifulSoup(html_content, 'html.parser')
+        parsed = time.perf_counter()
+        ir = DocumentIR.from_soup(soup)
+        built = time.perf_counter()
+        out = io.StringIO()
+        MarkdownConverter._write_table(ir.root.find('table'), out)
+        written = time.perf_counter()
+        print(f"{label}: {rows}行x{cols}列，输入 {len(html_content) / 1024:.0f} KB，"
+              f"解析 {parsed - start:.2f}s，建立IR {built - parsed:.2f}s，表格写出 {written - built:.2f}s，"
+              f"输出 {len(out.getvalue()) / 1024:.0f} KB")
+
+
+def bench_render(docs=50, sections=40):
+    """同时需要HTML、纯文本、大纲和统计时，分别调用各转换方法与一次 render 的耗时对比"""
+    md_content = sample_markdown(sections)
+    outputs = ('html', 'text', 'outline', 'stats')
+
+    def separate():
+        MarkdownConverter.md_to_html_with_outline(md_content)
+        MarkdownConverter.md_to_preview(md_content)
+
+    cases = [
+        ("分别转换", separate),
+        ("render 一次解析", lambda: MarkdownConverter.render(md_content, outputs)),
+    ]
+    print(f"{docs} 篇文档，每篇 {len(md_content)} 字符，输出: {', '.join(outputs)}")
+    # 同一文档反复渲染，关闭IR缓存以比较解析次数的差别
+    budget = MarkdownConverter.ir_cache.budget
+    MarkdownConverter.ir_cache.set_budget(0)
+    try:
+        for label, func in cases:
+            func()
+            start = time.perf_counter()
+            for _ in range(docs):
+                func()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<16}总耗时 {elapsed:>7.2f}s  单篇 {elapsed / docs * 1000:>8.2f} ms")
+    finally:
+        MarkdownConverter.ir_cache.set_budget(budget)
+
+
+def _traced_size(func):
+    """执行func并返回 (结果, 执行后仍被占用的tracemalloc字节数)"""
+    tracemalloc.start()
+    try:
+        result = func()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def bench_ir(sections=500):
+    """解析得到的文档树与文档IR的内存占用、IR的序列化大小，以及首次转换与命中IR缓存的耗时"""
+    from bs4 import BeautifulSoup
+
+    md_content = sample_markdown(sections)
+    html_content = MarkdownConverter.md_to_html(md_content)
+    (md, root), tree_size = _traced_size(lambda: MarkdownConverter._parse_tree(md_content))
+    md_ir, md_ir_size = _traced_size(lambda: DocumentIR.from_etree(md, root))
+    soup, soup_size = _traced_size(lambda: BeautifulSoup(html_content, 'html.parser'))
+    html_ir, html_ir_size = _traced_size(lambda: DocumentIR.from_soup(soup))
+    print(f"Markdown {len(md_content) / 1024:.0f} KB，HTML {len(html_content) / 1024:.0f} KB")
+    print(f"{'':<16}{'文档树(KB)':>12}{'IR(KB)':>10}{'节点数':>10}{'序列化(KB)':>12}")
+    for label, size, ir, ir_size in (("Markdown", tree_size, md_ir, md_ir_size),
+                                     ("HTML", soup_size, html_ir, html_ir_size)):
+        print(f"{label:<16}{size / 1024:>12.0f}{ir_size / 1024:>10.0f}{len(ir):>10}{len(ir.to_bytes()) / 1024:>12.0f}")
+
+    MarkdownConverter.ir_cache.clear()
+    for label in ("首次转换", "命中IR缓存"):
+        start = time.perf_counter()
+        MarkdownConverter.md_to_html(md_content)
+        md_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        MarkdownConverter.html_to_md(html_content)
+        html_seconds = time.perf_counter() - start
+        print(f"{label:<12}md_to_html {md_seconds * 1000:>8.1f} ms  html_to_md {html_seconds * 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NextMD 性能基准')
+    subparsers = parser.add_subparsers(dest='name')
+    templates_parser = subparsers.add_parser('templates', help='模板模式的输出大小与渲染耗时')
+    templates_parser.add_argument('--pages', type=int, default=200, help='渲染页数')
+    memory_parser = subparsers.add_parser('memory', help='HTML转Markdown的内存峰值')
+    memory_parser.add_argument('--sections', type=int, default=2000, help='文档小节数')
+    memory_parser.add_argument('--max-ratio', type=float, default=MAX_MEMORY_RATIO,
+                               help=f'流式写入的峰值相对输入大小的上限，超过时以非零状态退出（默认：{MAX_MEMORY_RATIO}）')
+    tables_parser = subparsers.add_parser('tables', help='大型表格的转换耗时')
+    tables_parser.add_argument('--rows', type=int, default=50000, help='表格行数')
+    tables_parser.add_argument('--cols', type=int, default=5, help='表格列数')
+    render_parser = subparsers.add_parser('render', help='一次解析产出多种结果的耗时')
+    render_parser.add_argument('--docs', type=int, default=50, help='文档数')
+    render_parser.add_argument('--sections', type=int, default=40, help='每篇文档的小节数')
+    ir_parser = subparsers.add_parser('ir', help='文档IR与解析树的内存占用和缓存效果')
+    ir_parser.add_argument('--sections', type=int, default=500, help='文档小节数')
+    args = parser.parse_args()
+
+    if args.name == 'templates':
+        bench_templates(args.pages)
+    elif args.name == 'memory':
+        if not bench_memory(args.sections, args.max_ratio):
+            sys.exit(1)
+    elif args.name == 'tables':
+        bench_tables(args.rows, args.cols)
+    elif args.name == 'render':
+        bench_render(args.docs, args.sections)
+    elif args.name == 'ir':
+        bench_ir(args.sections)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,17 @@
 import os
 import sys
-from dotenv import load_dotenv
+import importlib.util
+from collections import namedtuple
+from dotenv import load_dotenv, dotenv_values
 from logger import log_info, log_error, log_warning, log_debug
 
 # 确定.env文件的位置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ENV_FILE_PATH = os.path.join(BASE_DIR, '.env')
 
+# 进程启动时已有的环境变量优先于.env文件，重新加载时同样如此
+_PROCESS_ENV = dict(os.environ)
+
 # 加载.env文件中的配置
 load_dotenv(ENV_FILE_PATH)
 
@@ -15,25 +20,184 @@ DEFAULT_HOST = "localhost"
 DEFAULT_PORT = 3367
 DEFAULT_APP_NAME = "NextMD"
 DEFAULT_APP_VERSION = "1.0.0"
+DEFAULT_UNDO_MEMORY_MB = 8
+DEFAULT_WORKERS = 0
+DEFAULT_EXECUTOR = "process"
+DEFAULT_PREVIEW_CACHE_MB = 32
+DEFAULT_IR_CACHE_MB = 32
+DEFAULT_PREVIEW_DEBOUNCE_MS = 500
+DEFAULT_HTML_PARSER = "html.parser"
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_FILE_LOG_LEVEL = "DEBUG"
+DEFAULT_STREAM_THRESHOLD_KB = 256
+DEFAULT_WORKER_CPU_SECONDS = 30
+DEFAULT_WORKER_TIMEOUT = 60
+DEFAULT_WORKER_MEMORY_MB = 1024
+
+EXECUTORS = ("process", "thread", "isolated")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# HTML解析器及其所需的模块
+HTML_PARSERS = {"html.parser": None, "lxml": "lxml", "html5lib": "html5lib"}
+
+
+class ConfigError(ValueError):
+    """
+    配置值无效
+    errors 属性为每一项错误的说明，错误信息中包含配置项名称、取值和原因
+    """
+    
+    def __init__(self, errors):
+        if isinstance(errors, str):
+            errors = [errors]
+        self.errors = list(errors)
+        super().__init__("\n".join(self.errors))
+
+
+# 配置项：属性名、环境变量名、解析函数、默认值、说明
+Setting = namedtuple('Setting', ['attr', 'env', 'parse', 'default', 'description'])
+
+
+def _string(raw):
+    value = raw.strip()
+    if not value:
+        raise ValueError("不能为空")
+    return value
+
+def _integer(minimum=None, maximum=None):
+    """返回解析指定范围内整数的函数"""
+    def parse(raw):
+        try:
+            value = int(raw.strip())
+        except ValueError:
+            raise ValueError("必须是整数")
+        if minimum is not None and value < minimum:
+            raise ValueError(f"不能小于 {minimum}")
+        if maximum is not None and value > maximum:
+            raise ValueError(f"不能大于 {maximum}")
+        return value
+    return parse
+
+def _positive_number(raw):
+    try:
+        value = float(raw.strip())
+    except ValueError:
+        raise ValueError("必须是数字")
+    if not value > 0:
+        raise ValueError("必须大于0")
+    return value
+
+def _choice(choices, upper=False):
+    """返回解析枚举值的函数"""
+    def parse(raw):
+        value = raw.strip().upper() if upper else raw.strip()
+        if value not in choices:
+            raise ValueError(f"可选值为 {', '.join(choices)}")
+        return value
+    return parse
+
+def _html_parser(raw):
+    value = _choice(tuple(HTML_PARSERS))(raw)
+    module = HTML_PARSERS[value]
+    if module and importlib.util.find_spec(module) is None:
+        raise ValueError(f"需要先安装 {module}（pip install {module}）")
+    return value
+
+
+SETTINGS = (
+    Setting('host', 'HOST', _string, DEFAULT_HOST, "部署地址"),
+    Setting('port', 'PORT', _integer(0, 65535), DEFAULT_PORT, "部署端口"),
+    Setting('undo_memory_mb', 'UNDO_MEMORY_MB', _positive_number, DEFAULT_UNDO_MEMORY_MB,
+            "每个文档撤销历史的内存上限，单位MB"),
+    Setting('workers', 'WORKERS', _integer(0, 256), DEFAULT_WORKERS,
+            "批量转换、站点构建和链接检查的并行工作数，0 表示CPU核数"),
+    Setting('executor', 'EXECUTOR', _choice(EXECUTORS), DEFAULT_EXECUTOR,
+            "批量任务的并行方式：process（多进程）、thread（多线程）或 isolated（受资源限制的隔离进程）"),
+    Setting('preview_cache_mb', 'PREVIEW_CACHE_MB', _positive_number, DEFAULT_PREVIEW_CACHE_MB,
+            "预览缓存的内存上限，单位MB"),
+    Setting('ir_cache_mb', 'IR_CACHE_MB', _integer(0), DEFAULT_IR_CACHE_MB,
+            "已解析文档IR缓存的内存上限，单位MB，0 表示不缓存"),
+    Setting('preview_debounce_ms', 'PREVIEW_DEBOUNCE_MS', _integer(0, 10000), DEFAULT_PREVIEW_DEBOUNCE_MS,
+            "停止输入多少毫秒后刷新预览"),
+    Setting('html_parser', 'HTML_PARSER', _html_parser, DEFAULT_HTML_PARSER,
+            "HTML转Markdown使用的解析器：html.parser、lxml 或 html5lib"),
+    Setting('log_level', 'LOG_LEVEL', _choice(LOG_LEVELS, upper=True), DEFAULT_LOG_LEVEL,
+            "控制台日志级别"),
+    Setting('file_log_level', 'FILE_LOG_LEVEL', _choice(LOG_LEVELS, upper=True), DEFAULT_FILE_LOG_LEVEL,
+            "日志文件的日志级别"),
+    Setting('stream_threshold_kb', 'STREAM_THRESHOLD_KB', _integer(0), DEFAULT_STREAM_THRESHOLD_KB,
+            "HTML文件达到该大小（KB）时转换为Markdown的结果直接流式写入文件"),
+    Setting('worker_cpu_seconds', 'WORKER_CPU_SECONDS', _integer(0), DEFAULT_WORKER_CPU_SECONDS,
+            "isolated 方式下每个文档的CPU时间上限（秒），0 表示不限制"),
+    Setting('worker_timeout', 'WORKER_TIMEOUT', _integer(0), DEFAULT_WORKER_TIMEOUT,
+            "isolated 方式下每个文档的处理时间上限（秒），0 表示不限制"),
+    Setting('worker_memory_mb', 'WORKER_MEMORY_MB', _integer(0), DEFAULT_WORKER_MEMORY_MB,
+            "isolated 方式下工作进程处理文档时可额外使用的内存（MB），0 表示不限制"),
+)
+
+# 可以在运行中重新加载的配置项（部署地址和端口只在启动时生效）
+RELOADABLE = tuple(setting.attr for setting in SETTINGS if setting.attr not in ('host', 'port'))
+
+
+def _read_env(env_path=None):
+    """读取.env文件，并用进程启动时的环境变量覆盖其中的同名项"""
+    path = env_path or ENV_FILE_PATH
+    values = {}
+    if os.path.exists(path):
+        values.update((key, value) for key, value in dotenv_values(path).items() if value is not None)
+    values.update(_PROCESS_ENV)
+    return values
+
+def load_settings(env_path=None):
+    """
+    读取并校验所有配置项
+    
+    Args:
+        env_path (str, optional): .env文件路径，默认为程序目录下的.env
+    
+    Returns:
+        dict: 属性名 -> 取值
+    
+    Raises:
+        ConfigError: 存在无效的配置值，错误信息列出所有无效项
+    """
+    values = _read_env(env_path)
+    settings = {}
+    errors = []
+    for setting in SETTINGS:
+        try:
+            settings[setting.attr] = _parse_setting(setting, values)
+        except ConfigError as e:
+            errors.extend(e.errors)
+    if errors:
+        raise ConfigError(errors)
+    return settings
+
+def _parse_setting(setting, values):
+    """从配置值中取出并校验一项，未设置时返回默认值，无效时抛出 ConfigError"""
+    raw = values.get(setting.env)
+    if raw is None or raw.strip() == "":
+        return setting.default
+    try:
+        return setting.parse(raw)
+    except ValueError as e:
+        raise ConfigError(f"{setting.env}={raw!r} 无效（{setting.description}）: {e}")
+
+def _env_setting(attr):
+    """只读取并校验一项配置，其他配置项无效时不受影响"""
+    setting = next(setting for setting in SETTINGS if setting.attr == attr)
+    return _parse_setting(setting, _read_env())
 
 # 从环境变量中获取配置，如果没有则使用默认值
 def get_env_host():
     """获取主机地址配置"""
-    return os.getenv("HOST", DEFAULT_HOST)
+    return _env_setting('host')
 
 def get_env_port():
-    """获取端口配置，并确保是有效的整数"""
+    """获取端口配置，无效时使用默认端口"""
     try:
-        port_str = os.getenv("PORT", str(DEFAULT_PORT))
-        port = int(port_str)
-        # 验证端口号是否在有效范围内
-        if 0 <= port <= 65535:
-            return port
-        else:
-            print(f"警告: 无效的端口号 {port}，使用默认端口 {DEFAULT_PORT}")
-            return DEFAULT_PORT
-    except ValueError:
-        print(f"警告: 无法将 PORT={os.getenv('PORT')} 转换为整数，使用默认端口 {DEFAULT_PORT}")
+        return _env_setting('port')
+    except ConfigError as e:
+        log_warning(f"{e}，使用默认端口 {DEFAULT_PORT}")
         return DEFAULT_PORT
 
 # 应用程序设置
@@ -50,20 +214,33 @@ FILE_TYPES = {
 class Config:
     """
     应用程序配置类
-    负责管理和验证所有配置参数
+    负责管理和验证所有配置参数；.env文件修改后可以在运行中重新加载性能相关的配置项，
+    加载结果通过 add_listener 注册的回调通知各模块
     """
-    def __init__(self, host=None, port=None):
+    def __init__(self, host=None, port=None, env_path=None):
         """
         初始化配置
         
         Args:
             host (str, optional): 部署地址
             port (int, optional): 部署端口
+            env_path (str, optional): .env文件路径
+        
+        Raises:
+            ConfigError: .env文件或环境变量中存在无效的配置值
         """
-        self.host = host or get_env_host()
-        self.port = port or get_env_port()
+        self.env_path = env_path or ENV_FILE_PATH
+        for attr, value in load_settings(self.env_path).items():
+            setattr(self, attr, value)
+        if host:
+            self.host = host
+        if port:
+            self.port = port
         self.app_name = APP_NAME
         self.app_version = APP_VERSION
+        self._env_mtime = self._read_mtime()
+        self._reload_requested = False
+        self._listeners = []
         log_debug(f"配置初始化: 主机={self.host}, 端口={self.port}")
     
     def update_from_cli(self, args):
@@ -77,7 +254,7 @@ class Config:
             log_debug(f"从命令行更新host: {args.host}")
             self.host = args.host
             log_info(f"配置已更新: 主机地址 = {self.host}")
-            
+        
         if hasattr(args, 'port') and args.port:
             log_debug(f"从命令行更新port: {args.port}")
             try:
@@ -91,6 +268,70 @@ class Config:
             except ValueError:
                 log_error(f"无效的端口号 {args.port}，使用现有配置")
     
+    def add_listener(self, callback):
+        """
+        注册配置变化的回调，注册时立即以当前配置调用一次
+        
+        Args:
+            callback (callable): callback(config, changed)，changed 为发生变化的属性名集合
+        """
+        self._listeners.append(callback)
+        callback(self, set(RELOADABLE))
+    
+    def _read_mtime(self):
+        try:
+            return os.stat(self.env_path).st_mtime
+        except OSError:
+            return None
+    
+    def request_reload(self):
+        """请求在下一次 check_reload 时重新加载，可以在信号处理函数中调用"""
+        self._reload_requested = True
+    
+    def check_reload(self):
+        """
+        .env文件修改过或收到重新加载请求时重新加载配置
+        新的配置无效时记录错误并保留当前配置
+        
+        Returns:
+            set: 发生变化的属性名
+        """
+        mtime = self._read_mtime()
+        if mtime == self._env_mtime and not self._reload_requested:
+            return set()
+        self._env_mtime = mtime
+        self._reload_requested = False
+        try:
+            return self.reload()
+        except ConfigError as e:
+            log_warning(f"配置重新加载失败，继续使用当前配置:\n{e}")
+            return set()
+    
+    def reload(self):
+        """
+        重新读取.env文件和环境变量，更新可在运行中生效的配置项并通知回调
+        
+        Returns:
+            set: 发生变化的属性名
+        
+        Raises:
+            ConfigError: 存在无效的配置值，此时当前配置保持不变
+        """
+        settings = load_settings(self.env_path)
+        changed = set()
+        for attr in RELOADABLE:
+            if getattr(self, attr) != settings[attr]:
+                setattr(self, attr, settings[attr])
+                changed.add(attr)
+        if changed:
+            log_info(f"配置已重新加载: {', '.join(f'{attr}={getattr(self, attr)}' for attr in sorted(changed))}")
+            for callback in self._listeners:
+                try:
+                    callback(self, changed)
+                except Exception as e:
+                    log_error(f"应用新配置失败: {str(e)}")
+        return changed
+    
     def get_deployment_url(self):
         """
         获取完整的部署URL
@@ -109,12 +350,12 @@ class Config:
         """
         # 验证主机地址
         if not self.host or not isinstance(self.host, str):
-            print("错误: 主机地址无效")
+            log_error("主机地址无效")
             return False
         
         # 验证端口号
         if not isinstance(self.port, int) or self.port < 0 or self.port > 65535:
-            print("错误: 端口号无效")
+            log_error(f"端口号无效: {self.port}")
             return False
         
         return True
@@ -125,22 +366,26 @@ class Config:
         
         Args:
             env_path (str, optional): .env文件路径，如果未指定则使用默认路径
-            
+        
         Returns:
             bool: 保存是否成功
         """
         try:
-            path = env_path or ENV_FILE_PATH
+            path = env_path or self.env_path
             with open(path, 'w', encoding='utf-8') as f:
                 f.write(f"# NextMD 配置文件\n")
-                f.write(f"HOST={self.host}\n")
-                f.write(f"PORT={self.port}\n")
+                for setting in SETTINGS[:2]:
+                    f.write(f"{setting.env}={getattr(self, setting.attr)}\n")
                 f.write(f"APP_NAME={self.app_name}\n")
                 f.write(f"APP_VERSION={self.app_version}\n")
-            print(f"配置已保存到 {path}")
+                for setting in SETTINGS[2:]:
+                    value = getattr(self, setting.attr)
+                    f.write(f"\n# {setting.description}\n")
+                    f.write(f"{setting.env}={value:g}\n" if isinstance(value, float) else f"{setting.env}={value}\n")
+            log_info(f"配置已保存到 {path}")
             return True
         except Exception as e:
-            print(f"保存配置文件失败: {str(e)}")
+            log_error(f"保存配置文件失败: {str(e)}")
             return False
     
     def __str__(self):
@@ -153,7 +398,17 @@ class Config:
             f"  应用版本: {self.app_version}\n"
             f"  部署地址: {self.host}\n"
             f"  部署端口: {self.port}\n"
-            f"  部署URL: {self.get_deployment_url()}"
+            f"  部署URL: {self.get_deployment_url()}\n"
+            f"  撤销内存上限: {self.undo_memory_mb:g}MB\n"
+            f"  并行工作数: {self.workers or 'CPU核数'} ({self.executor})\n"
+            f"  预览缓存上限: {self.preview_cache_mb:g}MB\n"
+            f"  文档IR缓存上限: {self.ir_cache_mb}MB\n"
+            f"  预览刷新延迟: {self.preview_debounce_ms}ms\n"
+            f"  HTML解析器: {self.html_parser}\n"
+            f"  日志级别: 控制台 {self.log_level}，文件 {self.file_log_level}\n"
+            f"  流式写出阈值: {self.stream_threshold_kb}KB\n"
+            f"  隔离工作进程限制: CPU {self.worker_cpu_seconds}s，"
+            f"时间 {self.worker_timeout}s，内存 {self.worker_memory_mb}MB"
         )
 
 # 配置验证函数
@@ -163,7 +418,7 @@ def validate_config(config):
     
     Args:
         config: 配置对象
-        
+    
     Returns:
         bool: 配置是否有效
     """
@@ -172,4 +427,4 @@ def validate_config(config):
         return False
     
     log_debug("开始验证配置")
-    return config.validate()
\ No newline at end of file
+    return config.validate()
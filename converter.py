@@ -1,25 +1,335 @@
 import markdown
-from bs4 import BeautifulSoup
+import bz2
+import gzip
+import functools
+import html
+import io
+import lzma
 import os
+import re
+import unicodedata
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import chain, islice
+from markdown.util import HTML_PLACEHOLDER_RE
+from outline import OutlineIndex, Heading
+from sourcemap import SourceMap
+from docir import DocumentIR, IRCache, cache_key, TEXT, COMMENT, RAW_BLOCK
+from templates import get_template, minify_html, DEFAULT_STYLESHEET
+from metrics import counter, gauge, histogram, timed
+from isolation import IsolatedExecutor, WorkerLimitError, DEFAULT_LIMITS, worker_context
 from logger import log_info, log_error, log_warning, log_debug
 
+# Markdown转HTML可选的引擎：Python-Markdown（默认，带标题id和代码高亮），mistune（更快，输出更简单）
+MD_ENGINES = ('markdown', 'mistune')
+
+# 预压缩副本支持的编码：名称 -> (文件后缀, 压缩函数)
+COMPRESSION_CODECS = {
+    'gzip': ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+    'bz2': ('.bz2', lambda data: bz2.compress(data, compresslevel=9)),
+    'xz': ('.xz', lambda data: lzma.compress(data, preset=6)),
+}
+
+# 小于该字节数的输出不生成压缩副本
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+
+# HTML文件达到该字节数时，转换为Markdown的结果直接流式写入文件
+DEFAULT_STREAM_THRESHOLD = 256 * 1024
+
+# HTML标题标签对应的Markdown前缀
+_HEADING_PREFIXES = {f'h{level}': '#' * level + ' ' for level in range(1, 7)}
+
+
+# 性能指标：各转换方法的调用次数、耗时、错误数和输入字符数
+# （进程池中的转换记录在工作进程内，父进程只记录批量转换的条目数和在途块数）
+_CONVERSION_METHODS = ('md_to_html', 'md_to_html_stream', 'md_to_html_with_outline', 'md_to_fragment',
+                       'md_to_preview', 'render', 'html_to_md', 'html_to_md_stream', 'convert_file',
+                       'extract_links')
+_CONVERSION_ERRORS = {
+    method: counter('nextmd_conversion_errors_total', '转换失败次数', {'method': method})
+    for method in _CONVERSION_METHODS
+}
+_IO_SECONDS = {op: histogram('nextmd_file_io_seconds', '文件读写耗时（秒）', {'op': op}) for op in ('read', 'write')}
+_IO_CHARS = {op: counter('nextmd_file_io_chars_total', '文件读写的字符数', {'op': op}) for op in ('read', 'write')}
+_BATCH_ITEMS = counter('nextmd_batch_items_total', '批量转换完成的输入数')
+_BATCH_IN_FLIGHT = gauge('nextmd_batch_in_flight_chunks', '批量转换中已提交尚未产出的块数')
+
+
+def _measured(method, failure=..., text_input=True):
+    """
+    记录转换方法的调用次数、耗时和输入字符数
+    
+    Args:
+        method (str): 转换方法名，作为指标的标签
+        failure: 表示失败的返回值（如 False），返回该值时累加错误计数
+        text_input (bool): 第一个参数是否为输入文本（而不是文件路径）
+    """
+    timer = timed(
+        histogram('nextmd_conversion_seconds', '转换耗时（秒）', {'method': method}),
+        counter('nextmd_conversions_total', '转换次数', {'method': method})
+    )
+    errors = _CONVERSION_ERRORS[method]
+    chars = counter('nextmd_conversion_input_chars_total', '转换的输入字符数', {'method': method})
+    
+    def decorator(func):
+        measured = timer(func)
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if text_input and args and args[0]:
+                chars.inc(len(args[0]))
+            result = measured(*args, **kwargs)
+            if result is failure:
+                errors.inc()
+            return result
+        return wrapper
+    return decorator
+
+
+# render 可以产出的结果：完整HTML文档、HTML片段、纯文本、标题大纲、统计信息
+RENDER_OUTPUTS = ('html', 'fragment', 'text', 'outline', 'stats')
+DEFAULT_RENDER_OUTPUTS = ('html',)
+
+# render 的结果，未请求的项为None
+Rendered = namedtuple('Rendered', RENDER_OUTPUTS)
+
+# 文档统计：词数（中日韩文字按字计）、非空白字符数、源码行数、标题数、链接数、图片数
+DocumentStats = namedtuple('DocumentStats', ['words', 'characters', 'lines', 'headings', 'links', 'images'])
+
+# 词：连续的字母数字，或单个中日韩文字
+_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_WORD_RE = re.compile(f'[{_CJK_CHARS}]|[^\\W{_CJK_CHARS}]+')
+# 纯文本中的空白和排版符号（列表符号、表格线），不计入字符数
+_LAYOUT_CHARS_RE = re.compile('[\\s\u2022\u2500-\u257f]+')
+
+# 预览的文本片段：文本内容及其样式标签（元组）
+PreviewToken = namedtuple('PreviewToken', ['text', 'tags'])
+
+# 文档中的一个链接：类型（'link' 或 'image'）、目标地址、源码行号（从1开始，未知时为None）
+LinkRef = namedtuple('LinkRef', ['kind', 'target', 'line'])
+
+# 原始HTML块中的链接和锚点属性
+_RAW_LINK_RE = re.compile(r"""\b(href|src)\s*=\s*["']([^"']+)["']""", re.I)
+_RAW_ANCHOR_RE = re.compile(r"""\b(?:id|name)\s*=\s*["']([^"']+)["']""", re.I)
+
+# 块起点记录的关键文本长度，用于在源码中定位该块
+_MARK_KEY_LENGTH = 24
+
+# 预览中块级元素对应的样式标签
+_BLOCK_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'pre',
+               'blockquote', 'hr', 'table', 'div'}
+_INLINE_STYLES = {'strong': 'bold', 'b': 'bold', 'em': 'italic', 'i': 'italic',
+                  'code': 'code', 'a': 'link', 'del': 'strike', 's': 'strike'}
+_MAX_LIST_DEPTH = 6
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+# colspan/rowspan 的上限，防止异常输入展开出超大表格
+_MAX_CELL_SPAN = 1000
+
+# HTML中的空白字符（不含不换行空格），连续的空白在渲染时等同于一个空格
+_HTML_SPACE_RE = re.compile(r'[ \t\n\r\f]+')
+_LIST_TAGS = ('ul', 'ol')
+_BACKTICKS_RE = re.compile(r'`+')
+
+
+class _PrefixedWriter:
+    """
+    在每一行开头加上前缀的输出包装，用于流式写出引用块和列表项
+    first_prefix 为第一行的前缀，列表项的第一行紧跟在列表标记之后，不需要缩进
+    """
+    
+    def __init__(self, out, prefix, first_prefix=None):
+        self._out = out
+        self._prefix = prefix
+        self._first_prefix = prefix if first_prefix is None else first_prefix
+        self._started = False
+        self.in_cell = getattr(out, 'in_cell', False)
+    
+    def write(self, text):
+        if not self._started:
+            self._out.write(self._first_prefix)
+            self._started = True
+        self._out.write(text.replace('\n', '\n' + self._prefix))
+    
+    def close(self):
+        """确保即使没有内容也写出前缀"""
+        self.write('')
+
+
+class _CellWriter:
+    """表格单元格的输出包装：转义竖线，并把换行转换为 <br>"""
+    
+    in_cell = True
+    
+    def __init__(self, out):
+        self._out = out
+    
+    def write(self, text):
+        self._out.write(text.replace('|', '\\|').replace('\n', '<br>'))
+
+class _TokenWriter:
+    """
+    收集预览片段
+    相邻且样式相同的文本合并为一个片段，但不跨越块的结尾，
+    这样刷新预览时可以按块比较差异；同时记录每个块的起始偏移，用于建立源码映射
+    """
+    
+    def __init__(self, stash):
+        self.tokens = []
+        self.marks = []         # (关键文本, 预览偏移, 预览行, 预览列)
+        self.length = 0
+        self.row = 1
+        self.col = 0
+        self._stash = stash
+        self._block_start = None
+    
+    def _resolve(self, match):
+        """把原始HTML占位符替换为其中的文本"""
+        return html.unescape(_TAG_RE.sub('', str(self._stash[int(match.group(1))])))
+    
+    def text(self, text, tags, preformatted=False):
+        """
+        写入一段文本
+        
+        Args:
+            text (str): 文本内容
+            tags (tuple): 样式标签
+            preformatted (bool): 是否保留换行（代码块）
+        """
+        if not preformatted:
+            text = HTML_PLACEHOLDER_RE.sub(self._resolve, text.replace('\n', ' '))
+        if not text:
+            return
+        if self._block_start is not None and text.strip():
+            # 块中第一段非空文本作为在源码中定位该块的关键文本
+            self.mark(text.strip(), self._block_start)
+            self._block_start = None
+        self._advance(text)
+        tokens = self.tokens
+        if tokens and tokens[-1].tags == tags and not tokens[-1].text.endswith('\n'):
+            tokens[-1] = PreviewToken(tokens[-1].text + text, tags)
+        else:
+            tokens.append(PreviewToken(text, tags))
+    
+    def end_block(self, tags):
+        """结束当前块，确保以换行结尾"""
+        tokens = self.tokens
+        if not tokens or tokens[-1].text.endswith('\n'):
+            return
+        self._advance('\n')
+        if tokens[-1].tags == tags:
+            tokens[-1] = PreviewToken(tokens[-1].text + '\n', tags)
+        else:
+            tokens.append(PreviewToken('\n', tags))
+    
+    def _advance(self, text):
+        """更新当前的字符偏移和行列位置"""
+        self.length += len(text)
+        newlines = text.count('\n')
+        if newlines:
+            self.row += newlines
+            self.col = len(text) - text.rfind('\n') - 1
+        else:
+            self.col += len(text)
+    
+    @property
+    def position(self):
+        """当前位置 (字符偏移, 行, 列)"""
+        return self.length, self.row, self.col
+    
+    def begin_block(self, position=None):
+        """开始一个新块，position 默认为当前位置"""
+        self._block_start = self.position if position is None else position
+    
+    def mark(self, key, position):
+        """记录一个块起点"""
+        self.marks.append((key[:_MARK_KEY_LENGTH],) + position)
+    
+    def mark_lines(self, text):
+        """为即将写入的多行文本（代码块）逐行记录起点，代码块总是从行首开始"""
+        self._block_start = None
+        offset, row = self.length, self.row
+        for line in text.split('\n'):
+            if line.strip():
+                self.mark(line.strip(), (offset, row, 0))
+            offset += len(line) + 1
+            row += 1
+    
+    def raw_block(self, element):
+        """
+        段落只包含一个原始HTML占位符时返回对应的HTML（代码块等），否则返回None
+        """
+        if len(element) or not element.text:
+            return None
+        match = HTML_PLACEHOLDER_RE.fullmatch(element.text.strip())
+        if match is None:
+            return None
+        return str(self._stash[int(match.group(1))])
+    
+    def plain_text(self):
+        return ''.join(token.text for token in self.tokens)
+
+
 class MarkdownConverter:
     """
     Markdown和HTML之间的转换工具类
     提供MD转HTML和HTML转MD的功能
     """
     
+    # HTML转Markdown使用的BeautifulSoup解析器，由配置设置
+    # （链接提取需要源码行号，始终使用 html.parser）
+    html_parser = 'html.parser'
+    # 达到该字节数的HTML文件在 convert_file 中流式写出，较小的文件在内存中转换后一次写出
+    stream_threshold = DEFAULT_STREAM_THRESHOLD
+    # executor='isolated' 时每个文档的资源限制
+    worker_limits = DEFAULT_LIMITS
+    # 按源文本缓存的文档IR，相同内容再次转换时不重新解析；预算由配置设置
+    ir_cache = IRCache()
+    # engine='mistune' 时使用的转换函数，首次使用时创建
+    _mistune = None
+    
+    # convert_many 支持的转换方法
+    BATCH_MODES = ('md_to_html', 'html_to_md', 'md_to_html_with_outline', 'md_to_fragment',
+                   'render', 'convert_file', 'extract_links')
+    
     def __init__(self):
         """初始化转换器"""
         log_info("Markdown转换器初始化完成")
     
     @staticmethod
-    def md_to_html(md_content):
+    def _create_markdown():
+        """创建启用常用扩展的Markdown实例，以支持更多特性"""
+        # 扩展在用到时才导入（codehilite 会加载 pygments），并直接传入实例：
+        # 按名称加载时 Python-Markdown 会先扫描已安装包的入口点，拖慢命令行的启动
+        from markdown.extensions.codehilite import CodeHiliteExtension
+        from markdown.extensions.fenced_code import FencedCodeExtension
+        from markdown.extensions.tables import TableExtension
+        from markdown.extensions.toc import TocExtension
+        return markdown.Markdown(
+            extensions=[FencedCodeExtension(), TableExtension(), TocExtension(), CodeHiliteExtension()]
+        )
+    
+    @staticmethod
+    def _wrap_html(html_content, template='default', css='inline',
+                   stylesheet_href=DEFAULT_STYLESHEET, minify=False):
+        """使用预编译的文档模板将HTML片段包装成完整的HTML文档"""
+        compiled = get_template(template, css, stylesheet_href, minify)
+        return compiled.render(html_content)
+    
+    @staticmethod
+    @_measured('md_to_html')
+    def md_to_html(md_content, template='default', css='inline',
+                   stylesheet_href=DEFAULT_STYLESHEET, minify=False):
         """
         将Markdown内容转换为HTML
         
         Args:
             md_content (str): Markdown格式的文本内容
+            template (str): 'default' 或模板文件路径
+            css (str): 'inline' 内联样式表，'external' 引用共享样式表
+            stylesheet_href (str): 共享样式表的地址
+            minify (bool): 是否输出压缩后的HTML
             
         Returns:
             str: 转换后的HTML内容
@@ -28,42 +338,509 @@ class MarkdownConverter:
             return ""
             
         try:
-            # 使用markdown库进行转换，启用扩展以支持更多特性
-            html_content = markdown.markdown(
-                md_content, 
-                extensions=['fenced_code', 'tables', 'toc', 'codehilite']
+            ir = MarkdownConverter.md_to_ir(md_content)
+            full_html = MarkdownConverter._wrap_html(
+                ir.to_html(), template, css, stylesheet_href, minify
             )
             
-            # 包装成完整的HTML文档
-            full_html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Converted from Markdown</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; padding: 20px; max-width: 800px; margin: 0 auto; }}
-        h1, h2, h3, h4, h5, h6 {{ color: #333; }}
-        pre {{ background-color: #f5f5f5; padding: 10px; border-radius: 5px; overflow-x: auto; }}
-        code {{ font-family: 'Courier New', Courier, monospace; background-color: #f5f5f5; padding: 2px 4px; border-radius: 3px; }}
-        blockquote {{ border-left: 4px solid #ddd; padding-left: 16px; margin-left: 0; color: #666; }}
-        table {{ border-collapse: collapse; width: 100%; }}
-        th, td {{ border: 1px solid #ddd; padding: 8px 12px; text-align: left; }}
-        th {{ background-color: #f2f2f2; }}
-    </style>
-</head>
-<body>
-{html_content}
-</body>
-</html>"""
-            
             log_debug(f"Markdown转HTML成功，输入长度: {len(md_content)} 字符")
             return full_html
         except Exception as e:
             error_msg = f"Markdown转HTML错误: {str(e)}"
             log_error(error_msg)
+            _CONVERSION_ERRORS['md_to_html'].inc()
             return f"<p>转换错误: {str(e)}</p>"
     
     @staticmethod
+    @_measured('md_to_html_stream')
+    def md_to_html_stream(md_content, out, template='default', css='inline',
+                          stylesheet_href=DEFAULT_STYLESHEET, minify=False, engine='markdown'):
+        """
+        将Markdown内容转换为HTML，并把文档模板的各片段依次写入输出，不拼接完整的文档
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            out: 任何带有 write(str) 方法的对象，例如文本文件或标准输出
+            template (str): 'default'、模板文件路径，None 表示只输出HTML片段
+            css (str): 'inline' 内联样式表，'external' 引用共享样式表
+            stylesheet_href (str): 共享样式表的地址
+            minify (bool): 是否输出压缩后的HTML
+            engine (str): 转换引擎，取值见 MD_ENGINES
+            
+        Returns:
+            bool: 转换是否成功（失败时out中可能已写入部分内容）
+        """
+        if not md_content:
+            return True
+            
+        try:
+            if engine == 'markdown':
+                fragment = MarkdownConverter.md_to_ir(md_content).to_html()
+            elif engine == 'mistune':
+                fragment = MarkdownConverter._mistune_fragment(md_content)
+            else:
+                raise ValueError(f"不支持的转换引擎: {engine}")
+            if template is None:
+                out.write(minify_html(fragment) if minify else fragment)
+                out.write('\n')
+            else:
+                get_template(template, css, stylesheet_href, minify).write(out, fragment)
+            log_debug(f"Markdown转HTML（流式，{engine}）成功，输入长度: {len(md_content)} 字符")
+            return True
+        except Exception as e:
+            error_msg = f"Markdown转HTML错误: {str(e)}"
+            log_error(error_msg)
+            _CONVERSION_ERRORS['md_to_html_stream'].inc()
+            return False
+    
+    @staticmethod
+    def _mistune_fragment(md_content):
+        """使用 mistune 转换为HTML片段，支持表格和删除线，不生成标题id和代码高亮"""
+        if MarkdownConverter._mistune is None:
+            import mistune
+            MarkdownConverter._mistune = mistune.create_markdown(escape=False, plugins=['table', 'strikethrough'])
+        return MarkdownConverter._mistune(md_content).strip()
+    
+    @staticmethod
+    @_measured('md_to_html_with_outline')
+    def md_to_html_with_outline(md_content, template='default', css='inline',
+                                stylesheet_href=DEFAULT_STYLESHEET, minify=False):
+        """
+        将Markdown内容转换为HTML，同时返回文档大纲
+        HTML和大纲取自同一份文档IR，无需再次完整解析
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            template, css, stylesheet_href, minify: 同 md_to_html
+            
+        Returns:
+            tuple: (转换后的HTML内容, Heading列表)
+        """
+        if not md_content:
+            return "", []
+            
+        try:
+            ir = MarkdownConverter.md_to_ir(md_content)
+            full_html = MarkdownConverter._wrap_html(
+                ir.to_html(), template, css, stylesheet_href, minify
+            )
+            headings = MarkdownConverter._outline_from_ir(ir, md_content)
+            
+            log_debug(f"Markdown转HTML成功，输入长度: {len(md_content)} 字符，标题数: {len(headings)}")
+            return full_html, headings
+        except Exception as e:
+            error_msg = f"Markdown转HTML错误: {str(e)}"
+            log_error(error_msg)
+            _CONVERSION_ERRORS['md_to_html_with_outline'].inc()
+            return f"<p>转换错误: {str(e)}</p>", []
+    
+    @staticmethod
+    @_measured('md_to_fragment')
+    def md_to_fragment(md_content):
+        """
+        将Markdown内容转换为不含文档模板的HTML片段，同时返回文档大纲
+        供需要自行包装页面的调用方使用（例如静态站点生成）
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            
+        Returns:
+            tuple: (HTML片段, Heading列表)
+        """
+        if not md_content:
+            return "", []
+            
+        try:
+            ir = MarkdownConverter.md_to_ir(md_content)
+            return ir.to_html(), MarkdownConverter._outline_from_ir(ir, md_content)
+        except Exception as e:
+            error_msg = f"Markdown转HTML错误: {str(e)}"
+            log_error(error_msg)
+            _CONVERSION_ERRORS['md_to_fragment'].inc()
+            return f"<p>转换错误: {str(e)}</p>", []
+    
+    @staticmethod
+    @_measured('render')
+    def render(md_content, outputs=DEFAULT_RENDER_OUTPUTS, template='default', css='inline',
+               stylesheet_href=DEFAULT_STYLESHEET, minify=False):
+        """
+        解析一次Markdown，从同一份文档IR产出所需的各种结果
+        同时需要HTML、检索用的纯文本、大纲和统计信息时，比分别调用各转换方法少做重复的解析
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            outputs (tuple): 需要的结果，取值见 RENDER_OUTPUTS
+            template, css, stylesheet_href, minify: 同 md_to_html，只影响 'html'
+            
+        Returns:
+            Rendered: 各项结果，未请求的项为None；
+                html/fragment 为字符串，text 为纯文本，outline 为Heading列表，stats 为DocumentStats
+        """
+        unknown = set(outputs) - set(RENDER_OUTPUTS)
+        if unknown:
+            raise ValueError(f"不支持的输出: {', '.join(sorted(unknown))}")
+        
+        results = dict.fromkeys(RENDER_OUTPUTS)
+        try:
+            if md_content and md_content.strip():
+                ir = MarkdownConverter.md_to_ir(md_content)
+                if 'html' in outputs or 'fragment' in outputs:
+                    body = ir.to_html()
+                    if 'fragment' in outputs:
+                        results['fragment'] = body
+                    if 'html' in outputs:
+                        results['html'] = MarkdownConverter._wrap_html(body, template, css, stylesheet_href, minify)
+                if 'text' in outputs or 'stats' in outputs:
+                    text = ir.plain_text()
+                    results['text'] = text
+                if 'outline' in outputs or 'stats' in outputs:
+                    results['outline'] = MarkdownConverter._outline_from_ir(ir, md_content)
+                if 'stats' in outputs:
+                    results['stats'] = DocumentStats(
+                        words=len(_WORD_RE.findall(text)),
+                        characters=len(_LAYOUT_CHARS_RE.sub('', text)),
+                        lines=len(md_content.splitlines()),
+                        headings=len(results['outline']),
+                        links=sum(1 for _ in ir.iter('a')),
+                        images=sum(1 for _ in ir.iter('img')),
+                    )
+                log_debug(f"Markdown渲染成功，输入长度: {len(md_content)} 字符，输出: {', '.join(outputs)}")
+            else:
+                results.update(html='', fragment='', text='', outline=[],
+                               stats=DocumentStats(0, 0, len((md_content or '').splitlines()), 0, 0, 0))
+        except Exception as e:
+            error_msg = f"Markdown渲染错误: {str(e)}"
+            log_error(error_msg)
+            _CONVERSION_ERRORS['render'].inc()
+            return _failure_result('render', str(e), outputs)
+        return Rendered(**{name: results[name] if name in outputs else None for name in RENDER_OUTPUTS})
+    
+    @staticmethod
+    def _outline_from_ir(ir, md_content):
+        """
+        把文档IR中的标题转为Heading列表
+        源码行号由轻量的逐行扫描补充，两者数量不一致时行号为None
+        """
+        found = ir.headings()
+        scanned = OutlineIndex(md_content).headings
+        aligned = len(scanned) == len(found)
+        return [
+            Heading(level, text, anchor, scanned[i].line if aligned else None)
+            for i, (level, text, anchor) in enumerate(found)
+        ]
+    
+    @staticmethod
+    def md_to_ir(md_content):
+        """
+        解析Markdown得到文档IR，内容相同的文档直接取缓存，不再解析
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            
+        Returns:
+            DocumentIR: 文档IR（与缓存共享，调用方不应修改）
+        """
+        key = cache_key('md', md_content)
+        ir = MarkdownConverter.ir_cache.get(key)
+        if ir is None:
+            md, root = MarkdownConverter._parse_tree(md_content)
+            ir = DocumentIR.from_etree(md, root)
+            MarkdownConverter.ir_cache.put(key, ir)
+        return ir
+    
+    @staticmethod
+    def html_to_ir(html_content):
+        """
+        解析HTML得到文档IR（不含script和style），内容和解析器相同的文档直接取缓存
+        
+        Args:
+            html_content (str): HTML格式的文本内容
+            
+        Returns:
+            DocumentIR: 文档IR（与缓存共享，调用方不应修改）
+        """
+        parser = MarkdownConverter.html_parser
+        key = cache_key('html', html_content, parser)
+        ir = MarkdownConverter.ir_cache.get(key)
+        if ir is None:
+            ir = DocumentIR.from_soup(MarkdownConverter._parse_html(html_content, parser))
+            MarkdownConverter.ir_cache.put(key, ir)
+        return ir
+    
+    @staticmethod
+    def _parse_html(html_content, parser):
+        """用指定的解析器解析HTML，去掉script和style"""
+        # 在用到时才导入，只转换Markdown的进程（如命令行管道）无需加载 bs4
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html_content, parser)
+        for script in soup(['script', 'style']):
+            script.decompose()
+        return soup
+    
+    @staticmethod
+    def _parse_tree(md_content):
+        """
+        解析Markdown并运行所有树处理器，返回 (Markdown实例, 文档树根节点)
+        与 md.convert 的前半部分相同，但不序列化为HTML
+        """
+        md = MarkdownConverter._create_markdown()
+        lines = md_content.split('\n')
+        for preprocessor in md.preprocessors:
+            lines = preprocessor.run(lines)
+        root = md.parser.parseDocument(lines).getroot()
+        for treeprocessor in md.treeprocessors:
+            new_root = treeprocessor.run(root)
+            if new_root is not None:
+                root = new_root
+        return md, root
+    
+    @staticmethod
+    @_measured('extract_links', failure=None, text_input=False)
+    def extract_links(path):
+        """
+        读取Markdown或HTML文件，提取其中的所有链接和可以作为 #锚点 的ID
+        Markdown文件复用转换时的解析过程，标题ID与转换输出中toc扩展生成的一致
+        
+        Args:
+            path (str): 文件路径
+            
+        Returns:
+            tuple: (锚点列表, LinkRef列表)，读取或解析失败时返回None
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if os.path.splitext(path)[1].lower() in ('.html', '.htm'):
+                return MarkdownConverter._extract_html_links(content)
+            return MarkdownConverter._extract_md_links(content)
+        except Exception as e:
+            log_error(f"提取链接失败: {path} - {str(e)}")
+            return None
+    
+    @staticmethod
+    def _extract_md_links(md_content):
+        """
+        从Markdown文档树中提取锚点和链接
+        行号通过在源码中按顺序查找链接地址得到，找不到时再从文档开头查找
+        """
+        md, root = MarkdownConverter._parse_tree(md_content)
+        anchors = [element.get('id') for element in root.iter() if element.get('id')]
+        found = []
+        for element in root.iter():
+            if element.tag == 'a' and element.get('href'):
+                found.append(('link', element.get('href')))
+            elif element.tag == 'img' and element.get('src'):
+                found.append(('image', element.get('src')))
+        # 原始HTML中的链接和锚点，代码块也以HTML形式暂存，需要跳过
+        for raw in md.htmlStash.rawHtmlBlocks:
+            raw = str(raw)
+            if raw.lstrip().startswith(('<pre', '<div class="codehilite"')):
+                continue
+            anchors.extend(html.unescape(anchor) for anchor in _RAW_ANCHOR_RE.findall(raw))
+            for attr, target in _RAW_LINK_RE.findall(raw):
+                found.append(('image' if attr.lower() == 'src' else 'link', html.unescape(target)))
+        
+        lines = md_content.split('\n')
+        links = []
+        cursor = 0
+        for kind, target in found:
+            line = None
+            for i in chain(range(cursor, len(lines)), range(cursor)):
+                if target in lines[i]:
+                    line = i + 1
+                    cursor = i
+                    break
+            links.append(LinkRef(kind, target, line))
+        return anchors, links
+    
+    @staticmethod
+    def _extract_html_links(html_content):
+        """从HTML中提取锚点（id属性和 <a name>）和链接，行号取自解析器"""
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html_content, 'html.parser')
+        anchors = [tag['id'] for tag in soup.find_all(id=True)]
+        anchors.extend(tag['name'] for tag in soup.find_all('a', attrs={'name': True}))
+        links = []
+        for tag in soup.find_all(['a', 'link', 'img', 'script', 'source']):
+            is_link = tag.name in ('a', 'link')
+            target = tag.get('href' if is_link else 'src')
+            if target:
+                links.append(LinkRef('link' if is_link else 'image', target, tag.sourceline))
+        return anchors, links
+    
+    @staticmethod
+    def md_to_tokens(md_content):
+        """
+        将Markdown内容转换为预览用的片段序列
+        每个片段是带样式标签的一段文本（块、行内强调、代码、链接、表格行等），
+        由预览区域映射为Text控件的标签
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            
+        Returns:
+            list: PreviewToken 列表
+        """
+        return MarkdownConverter.md_to_preview(md_content)[0]
+    
+    @staticmethod
+    @_measured('md_to_preview')
+    def md_to_preview(md_content):
+        """
+        将Markdown内容转换为预览片段序列，同时生成源码行与预览偏移的映射
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            
+        Returns:
+            tuple: (PreviewToken 列表, SourceMap)
+        """
+        if not md_content:
+            return [], SourceMap()
+            
+        try:
+            md, root = MarkdownConverter._parse_tree(md_content)
+            out = _TokenWriter(md.htmlStash.rawHtmlBlocks)
+            MarkdownConverter._emit_mixed(root, (), out, 0)
+            source_map = SourceMap.build(md_content, out.marks)
+            log_debug(f"Markdown转预览片段成功，输入长度: {len(md_content)} 字符，"
+                      f"片段数: {len(out.tokens)}，映射锚点: {len(source_map)}")
+            return out.tokens, source_map
+        except Exception as e:
+            error_msg = f"Markdown转预览错误: {str(e)}"
+            log_error(error_msg)
+            _CONVERSION_ERRORS['md_to_preview'].inc()
+            return [PreviewToken(f"转换错误: {str(e)}", ('error',))], SourceMap()
+    
+    @staticmethod
+    def _emit_mixed(element, tags, out, depth):
+        """写出可能同时包含行内内容和块级子元素的元素（文档根、列表项、div等）"""
+        if element.text and element.text.strip():
+            out.text(element.text.lstrip(), tags)
+        for child in element:
+            if child.tag in _BLOCK_TAGS:
+                out.end_block(tags)
+                MarkdownConverter._emit_block(child, tags, out, depth)
+                if child.tail and child.tail.strip():
+                    out.text(child.tail.lstrip(), tags)
+            else:
+                MarkdownConverter._emit_inline(child, tags, out)
+                if child.tail:
+                    out.text(child.tail, tags)
+        out.end_block(tags)
+    
+    @staticmethod
+    def _emit_block(element, tags, out, depth):
+        """写出块级元素"""
+        tag = element.tag
+        out.begin_block()
+        if tag in _HEADING_PREFIXES or tag == 'p':
+            raw = out.raw_block(element) if tag == 'p' else None
+            if raw is not None:
+                # 代码块和原始HTML块在解析时被替换成了占位符
+                text = html.unescape(_TAG_RE.sub('', raw))
+                if '<pre' in raw:
+                    text = text.rstrip('\n') + '\n'
+                    out.mark_lines(text)
+                    out.text(text, tags + ('code_block',), preformatted=True)
+                else:
+                    out.text(text.strip(), tags + ('p',))
+            else:
+                MarkdownConverter._emit_inline_children(element, tags + (tag,), out)
+            out.end_block(tags + (tag,))
+        elif tag in ('ul', 'ol'):
+            list_tags = tags + (f'list{min(depth + 1, _MAX_LIST_DEPTH)}',)
+            try:
+                number = int(element.get('start', 1))
+            except ValueError:
+                number = 1
+            for item in element:
+                marker = '\u2022 ' if tag == 'ul' else f'{number}. '
+                number += 1
+                start = out.position
+                out.text(marker, list_tags)
+                out.begin_block(start)
+                MarkdownConverter._emit_mixed(item, list_tags, out, depth + 1)
+        elif tag == 'pre':
+            text = html.unescape(''.join(element.itertext())).rstrip('\n') + '\n'
+            out.mark_lines(text)
+            out.text(text, tags + ('code_block',), preformatted=True)
+        elif tag == 'blockquote':
+            MarkdownConverter._emit_mixed(element, tags + ('quote',), out, depth)
+        elif tag == 'hr':
+            out.text('\u2500' * 30, tags + ('hr',))
+            out.end_block(tags + ('hr',))
+        elif tag == 'table':
+            MarkdownConverter._emit_table(element, tags, out)
+        else:
+            MarkdownConverter._emit_mixed(element, tags, out, depth)
+    
+    @staticmethod
+    def _emit_inline_children(element, tags, out):
+        """写出元素的文本和行内子元素"""
+        if element.text:
+            out.text(element.text, tags)
+        for child in element:
+            MarkdownConverter._emit_inline(child, tags, out)
+            if child.tail:
+                out.text(child.tail, tags)
+    
+    @staticmethod
+    def _emit_inline(element, tags, out):
+        """写出行内元素"""
+        tag = element.tag
+        if tag == 'br':
+            out.text('\n', tags, preformatted=True)
+        elif tag == 'img':
+            out.text(f"[{element.get('alt') or element.get('src', '')}]", tags + ('link',))
+        elif tag == 'code':
+            # 行内代码在解析时已被转义
+            out.text(html.unescape(''.join(element.itertext())), tags + ('code',))
+        else:
+            style = _INLINE_STYLES.get(tag)
+            MarkdownConverter._emit_inline_children(element, tags + (style,) if style else tags, out)
+    
+    @staticmethod
+    def _emit_table(table, tags, out):
+        """按列宽对齐写出表格，每行一个片段"""
+        rows = []
+        header_rows = 0
+        for section in table:
+            section_rows = section if section.tag in ('thead', 'tbody', 'tfoot') else [section]
+            for tr in section_rows:
+                cells = []
+                for cell in tr:
+                    cell_out = _TokenWriter(out._stash)
+                    MarkdownConverter._emit_inline_children(cell, (), cell_out)
+                    cells.append(' '.join(cell_out.plain_text().split()))
+                rows.append(cells)
+                if section.tag == 'thead':
+                    header_rows += 1
+        if not rows:
+            return
+        
+        def width(text):
+            return sum(2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1 for ch in text)
+        
+        columns = max(len(cells) for cells in rows)
+        widths = [0] * columns
+        for cells in rows:
+            for i, cell in enumerate(cells):
+                widths[i] = max(widths[i], width(cell))
+        for index, cells in enumerate(rows):
+            padded = [
+                cell + ' ' * (widths[i] - width(cell))
+                for i, cell in enumerate(cells + [''] * (columns - len(cells)))
+            ]
+            row_tags = tags + (('table_header',) if index < header_rows else ('table',))
+            out.mark(next((cell for cell in cells if cell), ''), out.position)
+            out.text(' \u2502 '.join(padded).rstrip() + '\n', row_tags, preformatted=True)
+            if index == header_rows - 1:
+                out.text('\u2500\u253c\u2500'.join('\u2500' * w for w in widths) + '\n',
+                         tags + ('table',), preformatted=True)
+    
+    @staticmethod
+    @_measured('html_to_md')
     def html_to_md(html_content):
         """
         将HTML内容转换为Markdown
@@ -78,118 +855,327 @@ class MarkdownConverter:
             return ""
             
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # 移除script和style标签
-            for script in soup(['script', 'style']):
-                script.decompose()
-            
-            md_content = []
-            
-            # 处理HTML标签，转换为Markdown格式
-            for element in soup.find('body', recursive=False).children if soup.body else soup.children:
-                md_content.append(MarkdownConverter._convert_element(element))
-            
-            result = '\n'.join(md_content)
+            out = io.StringIO()
+            MarkdownConverter._write_markdown(html_content, out)
+            result = out.getvalue()
             log_debug(f"HTML转Markdown成功，输入长度: {len(html_content)} 字符")
             return result
         except Exception as e:
             error_msg = f"HTML转Markdown错误: {str(e)}"
             log_error(error_msg)
+            _CONVERSION_ERRORS['html_to_md'].inc()
             return f"转换错误: {str(e)}"
     
     @staticmethod
-    def _convert_element(element):
-        """递归处理HTML元素，转换为Markdown格式"""
-        if element.name is None:
-            # 文本节点
-            return element.strip() if element.strip() else ''
+    @_measured('html_to_md_stream')
+    def html_to_md_stream(html_content, out):
+        """
+        将HTML内容转换为Markdown，并在遍历文档树的同时直接写入输出
+        不在内存中拼接完整的结果，适合大文档
+        
+        Args:
+            html_content (str): HTML格式的文本内容
+            out: 任何带有 write(str) 方法的对象，例如文本文件或 io.StringIO
+            
+        Returns:
+            bool: 转换是否成功（失败时out中可能已写入部分内容）
+        """
+        if not html_content:
+            return True
+            
+        try:
+            MarkdownConverter._write_markdown(html_content, out, stream=True)
+            log_debug(f"HTML转Markdown（流式）成功，输入长度: {len(html_content)} 字符")
+            return True
+        except Exception as e:
+            error_msg = f"HTML转Markdown错误: {str(e)}"
+            log_error(error_msg)
+            _CONVERSION_ERRORS['html_to_md_stream'].inc()
+            return False
+    
+    @staticmethod
+    def _write_markdown(html_content, out, stream=False):
+        """
+        解析HTML（或取缓存的文档IR）并把转换结果逐段写入out
+        stream 为True且没有缓存的IR时按顶层的块分段建立IR，写出一段即释放这一段的解析树和IR，结果不放入缓存
+        """
+        if stream:
+            parser = MarkdownConverter.html_parser
+            ir = MarkdownConverter.ir_cache.get(cache_key('html', html_content, parser))
+            if ir is None:
+                soup = MarkdownConverter._parse_html(html_content, parser)
+                written = False
+                for part in DocumentIR.iter_soup(soup, _BLOCK_TAGS):
+                    written = MarkdownConverter._write_children(part.root, out, written)
+                if written:
+                    out.write('\n')
+                return
+        else:
+            ir = MarkdownConverter.html_to_ir(html_content)
+        
+        # 处理HTML标签，转换为Markdown格式，顶层的块之间以空行分隔
+        if MarkdownConverter._write_children(ir.root, out):
+            out.write('\n')
+    
+    @staticmethod
+    def _write_element(element, out):
+        """递归处理文档IR中的元素，把对应的Markdown直接写入out"""
+        write = out.write
+        name = element.name
+        if name is None:
+            if element.kind == TEXT:
+                # 文本节点，与块相邻的首尾空白由 _write_children 去掉
+                write(_HTML_SPACE_RE.sub(' ', element.text))
+            elif element.kind != COMMENT:
+                # 原始HTML在Markdown中原样保留
+                write(element.text.strip('\n'))
+            return
         
         # 处理不同的HTML标签
-        if element.name == 'h1':
-            return '# ' + MarkdownConverter._get_text_content(element)
-        elif element.name == 'h2':
-            return '## ' + MarkdownConverter._get_text_content(element)
-        elif element.name == 'h3':
-            return '### ' + MarkdownConverter._get_text_content(element)
-        elif element.name == 'h4':
-            return '#### ' + MarkdownConverter._get_text_content(element)
-        elif element.name == 'h5':
-            return '##### ' + MarkdownConverter._get_text_content(element)
-        elif element.name == 'h6':
-            return '###### ' + MarkdownConverter._get_text_content(element)
-        elif element.name == 'p':
-            return MarkdownConverter._get_text_content(element)
-        elif element.name == 'strong' or element.name == 'b':
-            return '**' + MarkdownConverter._get_text_content(element) + '**'
-        elif element.name == 'em' or element.name == 'i':
-            return '*' + MarkdownConverter._get_text_content(element) + '*'
-        elif element.name == 'a':
+        if name in _HEADING_PREFIXES:
+            write(_HEADING_PREFIXES[name])
+            MarkdownConverter._write_children(element, out)
+        elif name == 'p':
+            MarkdownConverter._write_children(element, out)
+        elif name == 'strong' or name == 'b':
+            write('**')
+            MarkdownConverter._write_children(element, out)
+            write('**')
+        elif name == 'em' or name == 'i':
+            write('*')
+            MarkdownConverter._write_children(element, out)
+            write('*')
+        elif name == 'a':
             href = element.get('href', '')
-            text = MarkdownConverter._get_text_content(element)
-            return f'[{text}]({href})'
-        elif element.name == 'img':
+            write('[')
+            MarkdownConverter._write_children(element, out)
+            write(f']({href})')
+        elif name == 'img':
             src = element.get('src', '')
             alt = element.get('alt', 'Image')
-            return f'![{alt}]({src})'
-        elif element.name == 'code':
-            # 检查是否是代码块（在pre标签内）
-            if element.parent and element.parent.name == 'pre':
-                return '```\n' + element.get_text() + '\n```'
+            write(f'![{alt}]({src})')
+        elif name == 'code':
+            # 代码块中的code由pre处理，这里只有行内代码
+            text = element.get_text()
+            if '`' in text:
+                # 定界的反引号比内容中最长的连续反引号多一个
+                fence = '`' * (max(len(run) for run in _BACKTICKS_RE.findall(text)) + 1)
+                write(f'{fence} {text} {fence}')
             else:
-                return '`' + element.get_text() + '`'
-        elif element.name == 'pre':
-            # 已经在code标签处理中处理
-            return ''
-        elif element.name == 'blockquote':
-            content = MarkdownConverter._get_text_content(element)
-            return '> ' + '\n> '.join(content.split('\n'))
-        elif element.name == 'ul':
-            items = []
-            for li in element.find_all('li', recursive=False):
-                items.append('- ' + MarkdownConverter._get_text_content(li))
-            return '\n'.join(items)
-        elif element.name == 'ol':
-            items = []
+                write(f'`{text or " "}`')
+        elif name == 'pre':
+            MarkdownConverter._write_code_block(element, out)
+        elif name == 'blockquote':
+            quote = _PrefixedWriter(out, '> ')
+            MarkdownConverter._write_children(element, quote)
+            quote.close()
+        elif name == 'ul':
+            for i, li in enumerate(element.find_all('li', recursive=False)):
+                write('- ' if i == 0 else '\n- ')
+                MarkdownConverter._write_children(li, _PrefixedWriter(out, '    ', first_prefix=''))
+        elif name == 'ol':
             for i, li in enumerate(element.find_all('li', recursive=False), 1):
-                items.append(f'{i}. ' + MarkdownConverter._get_text_content(li))
-            return '\n'.join(items)
-        elif element.name == 'hr':
-            return '---'
-        elif element.name == 'table':
-            # 简单处理表格
-            rows = []
-            # 添加表头
-            headers = element.find_all('th')
-            if headers:
-                row_content = '| ' + ' | '.join([MarkdownConverter._get_text_content(h) for h in headers]) + ' |'
-                rows.append(row_content)
-                # 添加分隔行
-                rows.append('| ' + ' | '.join(['---'] * len(headers)) + ' |')
-            # 添加表体行
-            for tr in element.find_all('tr'):
-                cells = tr.find_all('td')
-                if cells:
-                    row_content = '| ' + ' | '.join([MarkdownConverter._get_text_content(cell) for cell in cells]) + ' |'
-                    rows.append(row_content)
-            return '\n'.join(rows)
-        
-        # 对于未专门处理的标签，递归处理其子元素
-        result = []
-        for child in element.children:
-            result.append(MarkdownConverter._convert_element(child))
-        return ''.join(result)
+                write(f'{i}. ' if i == 1 else f'\n{i}. ')
+                MarkdownConverter._write_children(li, _PrefixedWriter(out, '    ', first_prefix=''))
+        elif name == 'hr':
+            write('---')
+        elif name == 'table':
+            MarkdownConverter._write_table(element, out)
+        else:
+            # 对于未专门处理的标签，递归处理其子元素
+            MarkdownConverter._write_children(element, out)
+    
+    @staticmethod
+    def _write_table(table, out):
+        """
+        逐行写出表格
+        只遍历表格自身的 thead/tbody/tfoot/tr 各一次，嵌套表格不会混入外层，
+        colspan/rowspan 展开为空单元格，各行直接写入输出
+        """
+        if getattr(out, 'in_cell', False):
+            MarkdownConverter._write_inline_table(table, out)
+            return
+        
+        rows = MarkdownConverter._iter_table_rows(table)
+        first = next(rows, None)
+        if first is None:
+            return
+        
+        first_tr, in_head = first
+        cells = MarkdownConverter._row_cells(first_tr)
+        width = sum(MarkdownConverter._cell_span(cell, 'colspan') for cell in cells)
+        spans = {}  # 列号 -> 被上方rowspan占用的剩余行数
+        
+        if in_head or all(cell.name == 'th' for cell in cells):
+            MarkdownConverter._write_row(cells, width, spans, out)
+            out.write('\n|' + ' --- |' * width)
+        else:
+            # Markdown表格必须有表头，没有表头时写出空表头，数据行保持原样
+            out.write('|' + '  |' * width)
+            out.write('\n|' + ' --- |' * width + '\n')
+            MarkdownConverter._write_row(cells, width, spans, out)
+        
+        for tr, _ in rows:
+            cells = MarkdownConverter._row_cells(tr)
+            if cells or spans:
+                out.write('\n')
+                MarkdownConverter._write_row(cells, width, spans, out)
+    
+    @staticmethod
+    def _iter_table_rows(table):
+        """按文档顺序产出表格自身的行及其是否位于thead中"""
+        for child in table.children:
+            name = child.name
+            if name == 'tr':
+                yield child, False
+            elif name in ('thead', 'tbody', 'tfoot'):
+                for tr in child.children:
+                    if tr.name == 'tr':
+                        yield tr, name == 'thead'
+    
+    @staticmethod
+    def _row_cells(tr):
+        """获取行中的单元格（不进入嵌套表格）"""
+        return [cell for cell in tr.children if cell.name in ('th', 'td')]
+    
+    @staticmethod
+    def _cell_span(cell, attr):
+        """读取colspan/rowspan，非法值按1处理"""
+        try:
+            return min(max(int(cell.get(attr, 1)), 1), _MAX_CELL_SPAN)
+        except (TypeError, ValueError):
+            return 1
+    
+    @staticmethod
+    def _write_row(cells, width, spans, out):
+        """写出一行，跳过被rowspan占用的列，并补齐到表头宽度"""
+        write = out.write
+        cell_out = _CellWriter(out)
+        col = 0
+        write('|')
+        for cell in cells:
+            while spans.get(col):
+                spans[col] -= 1
+                write('  |')
+                col += 1
+            write(' ')
+            MarkdownConverter._write_children(cell, cell_out)
+            write(' |')
+            colspan = MarkdownConverter._cell_span(cell, 'colspan')
+            rowspan = MarkdownConverter._cell_span(cell, 'rowspan')
+            if rowspan > 1:
+                for span_col in range(col, col + colspan):
+                    spans[span_col] = rowspan - 1
+            if colspan > 1:
+                write('  |' * (colspan - 1))
+            col += colspan
+        while col < width:
+            if spans.get(col):
+                spans[col] -= 1
+            write('  |')
+            col += 1
+    
+    @staticmethod
+    def _write_inline_table(table, out):
+        """单元格内的嵌套表格：各行以换行分隔，单元格以竖线分隔，由单元格写出器转义"""
+        first_row = True
+        for tr, _ in MarkdownConverter._iter_table_rows(table):
+            if not first_row:
+                out.write('\n')
+            first_row = False
+            for i, cell in enumerate(MarkdownConverter._row_cells(tr)):
+                if i:
+                    out.write(' | ')
+                MarkdownConverter._write_children(cell, out)
+    
+    @staticmethod
+    def _write_code_block(pre, out):
+        """
+        写出代码块
+        顶层使用围栏代码块，保留 language-* 类名标注的语言，围栏长度避开内容中的反引号；
+        引用块和列表项中不支持围栏，改用缩进代码块
+        """
+        code = pre.find('code')
+        language = ''
+        if code is not None:
+            for cls in (code.get('class') or '').split():
+                if cls.startswith('language-'):
+                    language = cls[len('language-'):]
+                    break
+        text = (code if code is not None else pre).get_text()
+        if text.endswith('\n'):
+            text = text[:-1]
+        if pre.find_parent(('blockquote', 'li')) is not None:
+            out.write('\n'.join('    ' + line if line else '' for line in text.split('\n')))
+            return
+        fence = '```'
+        while fence in text:
+            fence += '`'
+        out.write(f'{fence}{language}\n{text}\n{fence}')
+    
+    @staticmethod
+    def _write_children(element, out, written=False):
+        """
+        依次写出元素的所有子节点
+        块级子元素与前后内容之间以空行分隔（列表项中的嵌套列表只换行），
+        与块相邻及位于首尾的空白不写出，行内元素之间的空白保留为一个空格
+        
+        Args:
+            element: 文档IR中的元素
+            out: 输出
+            written (bool): 之前是否已写出以块结束的内容，分段写出同一容器时传入上一段的返回值
+        
+        Returns:
+            bool: 是否写出了内容（包括之前写出的）
+        """
+        contents = element.contents
+        last = len(contents) - 1
+        after_block = True      # 容器开头与块之后一样，不需要前导空白
+        for index, child in enumerate(contents):
+            name = child.name
+            kind = child.kind
+            if kind == COMMENT:
+                continue
+            if kind == TEXT:
+                text = _HTML_SPACE_RE.sub(' ', child.text)
+                if after_block:
+                    text = text.lstrip(' ')
+                if index == last or contents[index + 1].name in _BLOCK_TAGS or contents[index + 1].kind == RAW_BLOCK:
+                    text = text.rstrip(' ')
+                if not text:
+                    continue
+                if written and after_block:
+                    out.write('\n\n')
+                out.write(text)
+                written = True
+                after_block = False
+                continue
+            is_block = name in _BLOCK_TAGS or kind == RAW_BLOCK
+            if written and (is_block or after_block):
+                out.write('\n' if name in _LIST_TAGS and element.name == 'li' else '\n\n')
+            MarkdownConverter._write_element(child, out)
+            written = True
+            after_block = is_block
+        return written
+    
+    @staticmethod
+    def _convert_element(element):
+        """递归处理HTML元素，转换为Markdown格式"""
+        out = io.StringIO()
+        MarkdownConverter._write_element(element, out)
+        return out.getvalue()
     
     @staticmethod
     def _get_text_content(element):
         """获取元素的文本内容，处理子元素"""
-        result = []
-        for child in element.children:
-            result.append(MarkdownConverter._convert_element(child))
-        return ''.join(result)
+        out = io.StringIO()
+        MarkdownConverter._write_children(element, out)
+        return out.getvalue()
     
     @staticmethod
-    def convert_file(input_path, output_path):
+    @_measured('convert_file', failure=False, text_input=False)
+    def convert_file(input_path, output_path, html_options=None, compress=None,
+                     compress_min_size=DEFAULT_COMPRESS_MIN_SIZE, incremental=False):
         """
         转换文件格式
         根据文件扩展名判断转换方向
@@ -197,12 +1183,21 @@ class MarkdownConverter:
         Args:
             input_path (str): 输入文件路径
             output_path (str): 输出文件路径
+            html_options (dict, optional): 传给 md_to_html 的模板参数（template、css、stylesheet_href、minify）
+            compress (iterable, optional): 同时写出的预压缩副本编码，取值见 COMPRESSION_CODECS
+            compress_min_size (int): 输出小于该字节数时不生成压缩副本
+            incremental (bool): 输出及其压缩副本都比输入新时跳过转换；
+                指定了 html_options 时不跳过，输出的修改时间无法反映模板参数是否变化
             
         Returns:
             bool: 转换是否成功
         """
         try:
-            log_info(f"开始转换文件: {input_path} -> {output_path}")
+            codecs = list(compress or [])
+            for codec in codecs:
+                if codec not in COMPRESSION_CODECS:
+                    log_error(f"不支持的压缩编码: {codec}")
+                    return False
             
             # 检查输入文件是否存在
             if not os.path.exists(input_path):
@@ -210,10 +1205,18 @@ class MarkdownConverter:
                 log_error(error_msg)
                 return False
             
+            if incremental and not html_options and MarkdownConverter._is_up_to_date(
+                    input_path, output_path, codecs, compress_min_size):
+                log_debug(f"输出已是最新，跳过转换: {output_path}")
+                return True
+            
+            log_info(f"开始转换文件: {input_path} -> {output_path}")
+            
             # 读取输入文件
             try:
-                with open(input_path, 'r', encoding='utf-8') as f:
+                with _IO_SECONDS['read'].time(), open(input_path, 'r', encoding='utf-8') as f:
                     content = f.read()
+                _IO_CHARS['read'].inc(len(content))
                 log_debug(f"成功读取输入文件，大小: {len(content)} 字符")
             except UnicodeDecodeError:
                 error_msg = f"无法解码文件: {input_path}，请检查文件编码"
@@ -230,9 +1233,15 @@ class MarkdownConverter:
             
             # 执行转换
             if input_ext in ['.md', '.markdown'] and output_ext in ['.html', '.htm']:
-                result = MarkdownConverter.md_to_html(content)
+                result = MarkdownConverter.md_to_html(content, **(html_options or {}))
             elif input_ext in ['.html', '.htm'] and output_ext in ['.md', '.markdown']:
-                result = MarkdownConverter.html_to_md(content)
+                # 大文件不需要压缩副本时在写出阶段直接流式转换，不保留完整结果
+                result = None
+                if codecs or len(content) < MarkdownConverter.stream_threshold:
+                    buffer = io.StringIO()
+                    if not MarkdownConverter.html_to_md_stream(content, buffer):
+                        return False
+                    result = buffer.getvalue()
             else:
                 error_msg = f"不支持的文件格式转换: {input_ext} -> {output_ext}"
                 log_error(error_msg)
@@ -249,10 +1258,19 @@ class MarkdownConverter:
                     log_error(error_msg)
                     return False
             
-            # 写入输出文件
+            # 写入输出文件，压缩副本直接复用内存中的输出
             try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(result)
+                if result is None:
+                    if not MarkdownConverter._stream_html_to_md_file(content, output_path):
+                        return False
+                    log_info(f"文件转换成功: {output_path}")
+                    return True
+                
+                data = result.encode('utf-8')
+                with _IO_SECONDS['write'].time(), open(output_path, 'wb') as f:
+                    f.write(data)
+                _IO_CHARS['write'].inc(len(result))
+                MarkdownConverter._write_sidecars(output_path, data, codecs, compress_min_size)
                 log_info(f"文件转换成功: {output_path}")
                 return True
             except Exception as e:
@@ -262,4 +1280,232 @@ class MarkdownConverter:
         except Exception as e:
             error_msg = f"文件转换错误: {str(e)}"
             log_error(error_msg)
-            return False
\ No newline at end of file
+            return False
+    
+    @staticmethod
+    def _stream_html_to_md_file(html_content, output_path):
+        """将HTML流式转换后写入临时文件，成功后再替换目标文件，避免留下不完整的输出"""
+        temp_path = output_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            success = MarkdownConverter.html_to_md_stream(html_content, f)
+        if success:
+            os.replace(temp_path, output_path)
+        else:
+            os.remove(temp_path)
+        return success
+    
+    @staticmethod
+    def _write_sidecars(output_path, data, codecs, min_size):
+        """
+        写出预压缩副本
+        输出小于阈值时不压缩，并删除之前遗留的副本，避免静态服务器返回过期内容
+        """
+        for codec in codecs:
+            suffix, compress = COMPRESSION_CODECS[codec]
+            sidecar_path = output_path + suffix
+            if len(data) < min_size:
+                if os.path.exists(sidecar_path):
+                    os.remove(sidecar_path)
+                    log_debug(f"输出小于压缩阈值，删除旧的压缩副本: {sidecar_path}")
+                continue
+            with open(sidecar_path, 'wb') as f:
+                f.write(compress(data))
+            log_debug(f"写出压缩副本: {sidecar_path}")
+    
+    @staticmethod
+    def _is_up_to_date(input_path, output_path, codecs, min_size):
+        """判断输出文件及所需的压缩副本是否都比输入文件新"""
+        if not os.path.exists(output_path):
+            return False
+        input_mtime = os.path.getmtime(input_path)
+        if os.path.getmtime(output_path) < input_mtime:
+            return False
+        if os.path.getsize(output_path) < min_size:
+            return True
+        for codec in codecs:
+            sidecar_path = output_path + COMPRESSION_CODECS[codec][0]
+            if not os.path.exists(sidecar_path) or os.path.getmtime(sidecar_path) < input_mtime:
+                return False
+        return True
+    
+    @staticmethod
+    async def md_to_html_async(md_content, executor=None):
+        """
+        md_to_html 的异步版本，在执行器中转换，不阻塞事件循环
+        
+        Args:
+            md_content (str): Markdown格式的文本内容
+            executor (Executor, optional): 执行器，默认使用事件循环的默认线程池
+            
+        Returns:
+            str: 转换后的HTML内容
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, MarkdownConverter.md_to_html, md_content)
+    
+    @staticmethod
+    async def html_to_md_async(html_content, executor=None):
+        """
+        html_to_md 的异步版本，在执行器中转换，不阻塞事件循环
+        
+        Args:
+            html_content (str): HTML格式的文本内容
+            executor (Executor, optional): 执行器，默认使用事件循环的默认线程池
+            
+        Returns:
+            str: 转换后的Markdown内容
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, MarkdownConverter.html_to_md, html_content)
+    
+    @staticmethod
+    def convert_many(inputs, mode='md_to_html', executor='thread', max_workers=None,
+                     chunk_size=16, ordered=True):
+        """
+        批量转换
+        输入按chunk_size分块提交到执行器，同时在途的块数受限，
+        因此输入可以是任意长的迭代器，内存占用保持有界
+        
+        Args:
+            inputs (iterable): 输入迭代器；元素为元组时展开为多个参数（如convert_file的路径对）
+            mode (str): 转换方法名，取值见 BATCH_MODES
+            executor: 'thread'、'process'、'isolated' 或已有的 Executor 实例（由调用方负责关闭）；
+                CPU密集的大批量转换建议使用 'process' 以利用全部核心；
+                'isolated' 在预先启动的工作进程中逐个转换，每个文档受 worker_limits 限制，
+                超出限制的文档得到与该方法出错时相同形式的结果，其余文档照常转换
+            max_workers (int, optional): 工作线程/进程数，默认为CPU核数
+            chunk_size (int): 每次提交给工作者的输入个数
+            ordered (bool): 是否按输入顺序产出结果
+            
+        Yields:
+            tuple: (输入序号, 转换结果)
+        """
+        if mode not in MarkdownConverter.BATCH_MODES:
+            raise ValueError(f"不支持的批量转换方法: {mode}")
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size 必须为正整数: {chunk_size}")
+        
+        workers = max_workers or os.cpu_count() or 1
+        own_executor = isinstance(executor, str)
+        if executor == 'thread':
+            pool = ThreadPoolExecutor(max_workers=workers)
+        elif executor == 'process':
+            # 界面进程中运行着多个后台线程，不能直接 fork
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=worker_context())
+        elif executor == 'isolated':
+            pool = IsolatedExecutor(max_workers=workers, limits=MarkdownConverter.worker_limits)
+        elif own_executor:
+            raise ValueError(f"不支持的执行器类型: {executor}")
+        else:
+            pool = executor
+        
+        if isinstance(pool, IsolatedExecutor):
+            # 资源限制按任务生效，每个任务只包含一个文档
+            chunk_size = 1
+        
+        log_info(f"开始批量转换: 方法={mode}, 工作者={workers}, 分块={chunk_size}")
+        max_in_flight = workers * 2
+        # 随每个块发送运行时配置：工作进程（forkserver、spawn 或调用方提供的进程池）
+        # 看不到父进程中修改过的类属性；线程与父进程共享配置，不需要发送
+        settings = None if isinstance(pool, ThreadPoolExecutor) else _worker_settings()
+        source = iter(inputs)
+        pending = {}    # future -> (该块第一个输入的序号, 该块的输入)
+        ready = {}      # 有序模式下已完成但尚未产出的块
+        next_index = 0
+        next_yield = 0
+        try:
+            while True:
+                # 补充任务，保持在途块数有上限
+                while len(pending) + len(ready) < max_in_flight:
+                    chunk = list(islice(source, chunk_size))
+                    if not chunk:
+                        break
+                    future = pool.submit(_convert_chunk, mode, chunk, settings)
+                    pending[future] = (next_index, chunk)
+                    next_index += len(chunk)
+                _BATCH_IN_FLIGHT.set(len(pending) + len(ready))
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, chunk = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except WorkerLimitError as e:
+                        log_warning(f"批量转换中输入 {start} 失败（{e.reason}）: {str(e)}")
+                        _CONVERSION_ERRORS[mode].inc()
+                        results = [_failure_result(mode, str(e), _requested_outputs(item)) for item in chunk]
+                    except Exception as e:
+                        log_error(f"批量转换失败，输入序号 {start} 起: {str(e)}")
+                        raise
+                    _BATCH_ITEMS.inc(len(results))
+                    if ordered:
+                        ready[start] = results
+                    else:
+                        for offset, result in enumerate(results):
+                            yield start + offset, result
+                
+                while next_yield in ready:
+                    results = ready.pop(next_yield)
+                    for offset, result in enumerate(results):
+                        yield next_yield + offset, result
+                    next_yield += len(results)
+            
+            log_info(f"批量转换完成，共 {next_index} 个输入")
+        finally:
+            for future in pending:
+                future.cancel()
+            _BATCH_IN_FLIGHT.set(0)
+            if own_executor:
+                pool.shutdown(wait=True)
+
+
+def _failure_result(mode, message, outputs=RENDER_OUTPUTS):
+    """无法得到结果的输入：返回与该转换方法自身出错时相同形式的值，调用方无需区分"""
+    if mode == 'render':
+        html_content = f"<p>转换错误: {html.escape(message)}</p>"
+        values = {'html': html_content, 'fragment': html_content, 'text': f"转换错误: {message}",
+                  'outline': [], 'stats': DocumentStats(0, 0, 0, 0, 0, 0)}
+        return Rendered(**{name: values[name] if name in outputs else None for name in RENDER_OUTPUTS})
+    if mode == 'convert_file':
+        return False
+    if mode == 'extract_links':
+        return None
+    if mode == 'html_to_md':
+        return f"转换错误: {message}"
+    html_content = f"<p>转换错误: {html.escape(message)}</p>"
+    return (html_content, []) if mode in ('md_to_html_with_outline', 'md_to_fragment') else html_content
+
+
+def _requested_outputs(item):
+    """批量 render 的一个输入请求的结果，与直接调用 render 时的默认值一致"""
+    if isinstance(item, tuple) and len(item) > 1:
+        return item[1]
+    return DEFAULT_RENDER_OUTPUTS
+
+
+def _worker_settings():
+    """需要传给工作进程的运行时配置：(HTML解析器, 流式写出阈值, IR缓存上限)"""
+    return (MarkdownConverter.html_parser, MarkdownConverter.stream_threshold,
+            MarkdownConverter.ir_cache.budget)
+
+
+def _apply_worker_settings(settings):
+    """在工作进程中应用父进程的运行时配置，取值未变时不做任何事"""
+    html_parser, stream_threshold, ir_cache_budget = settings
+    MarkdownConverter.html_parser = html_parser
+    MarkdownConverter.stream_threshold = stream_threshold
+    if MarkdownConverter.ir_cache.budget != ir_cache_budget:
+        MarkdownConverter.ir_cache.set_budget(ir_cache_budget)
+
+
+def _convert_chunk(mode, chunk, settings=None):
+    """在工作线程或进程中转换一个输入块（模块级函数，便于进程池序列化）"""
+    if settings is not None:
+        _apply_worker_settings(settings)
+    method = getattr(MarkdownConverter, mode)
+    return [method(*item) if isinstance(item, tuple) else method(item) for item in chunk]
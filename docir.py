@@ -0,0 +1,794 @@
+import hashlib
+import html
+import json
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from markdown.util import HTML_PLACEHOLDER_RE, AMP_SUBSTITUTE
+from metrics import counter, gauge
+from logger import log_debug
+
+# 节点类型；元素节点的类型为 ELEMENT 加上标签在 TAGS（之后是文档自己的额外标签表）中的序号
+DOCUMENT = 0        # 根节点，对应文档内容（Markdown的文档树根或HTML的body）
+TEXT = 1            # 文本，保存解码后的纯文本
+COMMENT = 2         # HTML注释
+RAW_INLINE = 3      # 行内的原始HTML，保存HTML源码
+RAW_BLOCK = 4       # 独立成块的原始HTML（包括语法高亮后的代码块）
+ELEMENT = 5
+
+# 常见标签，出现在其中的标签不需要在每个文档中保存名称
+TAGS = ('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'blockquote', 'pre', 'code', 'hr', 'br',
+        'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td', 'a', 'img', 'strong', 'em', 'b', 'i', 'del', 's',
+        'span', 'div', 'sup', 'sub', 'dl', 'dt', 'dd', 'script', 'style')
+_TAG_KINDS = {tag: ELEMENT + index for index, tag in enumerate(TAGS)}
+
+# 没有结束标签的元素，与 Python-Markdown 的序列化器一致
+_VOID_TAGS = frozenset(('area', 'base', 'basefont', 'br', 'col', 'frame', 'hr', 'img', 'input', 'isindex',
+                        'link', 'meta', 'param', 'embed', 'source', 'track', 'wbr'))
+# 内容按原样输出、不转义的元素
+_RAW_TEXT_TAGS = frozenset(('script', 'style'))
+# 纯文本中单独成行的元素
+_TEXT_BLOCK_TAGS = frozenset(('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'pre', 'blockquote',
+                              'hr', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'div', 'dl', 'dt', 'dd'))
+_HEADING_LEVELS = {f'h{level}': level for level in range(1, 7)}
+
+# 属性值中不属于实体引用的 &，与 Python-Markdown 的属性转义一致
+_ATTR_AMP_RE = re.compile(r'&(?!(?:\#[0-9]+|\#x[0-9a-f]+|[0-9a-z]+);)', re.I)
+# Python-Markdown 为保护实体引用把 & 替换为 AMP_SUBSTITUTE（例如混淆后的邮件地址），连续的实体引用作为一段
+_AMP_ENTITY_RUN_RE = re.compile('(?:' + re.escape(AMP_SUBSTITUTE) + r'(?:\#[0-9]+|\#x[0-9a-f]+|[0-9a-z]+);)+', re.I)
+_TAG_RE = re.compile(r'<[^>]*>')
+
+# 序列化格式：魔数、版本号、头部长度；头部为JSON，其后依次为各数组和UTF-8文本池
+_MAGIC = b'NMIR'
+_FORMAT_VERSION = 1
+_PREFIX = struct.Struct('<4sBI')
+_ARRAYS = (('kinds', 'H'), ('ends', 'I'), ('parents', 'i'), ('starts', 'I'), ('lengths', 'I'))
+
+# 进程内IR缓存的默认预算（字节）
+DEFAULT_CACHE_BUDGET = 32 * 1024 * 1024
+
+_CACHE_LOOKUPS = {
+    result: counter('nextmd_ir_cache_lookups_total', '文档IR缓存查询次数', {'result': result})
+    for result in ('hit', 'miss')
+}
+_CACHE_BYTES = gauge('nextmd_ir_cache_bytes', '文档IR缓存占用的字节数')
+_CACHE_EVICTIONS = counter('nextmd_ir_cache_evictions_total', '文档IR缓存淘汰的条目数')
+
+
+def _restore_amp(value):
+    """
+    还原属性值中 Python-Markdown 保护的 &，实体引用保持原样，
+    序列化时与 Python-Markdown 一样不再转义（如混淆后的 mailto 链接）
+    """
+    return value.replace(AMP_SUBSTITUTE, '&') if AMP_SUBSTITUTE in value else value
+
+
+def _unescape_code(text):
+    """代码文本在 Python-Markdown 中已转义了 & < >，还原为纯文本"""
+    if '&' not in text:
+        return text
+    return text.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+
+
+def _escape_text(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _escape_attr(value):
+    if '&' in value:
+        value = _ATTR_AMP_RE.sub('&amp;', value)
+    return value.replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def _raw_to_text(raw):
+    """原始HTML中的文本"""
+    return html.unescape(_TAG_RE.sub('', raw))
+
+
+class Node:
+    """
+    文档IR中一个节点的轻量视图
+    只保存文档和节点序号，访问时从数组中读取，遍历时按需创建；
+    接口与 BeautifulSoup 的常用部分相同（name、contents、get、find 等）
+    """
+
+    __slots__ = ('ir', 'index')
+
+    def __init__(self, ir, index):
+        self.ir = ir
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and other.ir is self.ir and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.ir), self.index))
+
+    def __repr__(self):
+        return f"<Node {self.index} {self.name or self.kind}>"
+
+    @property
+    def kind(self):
+        return self.ir.kinds[self.index]
+
+    @property
+    def name(self):
+        """元素的标签名，其他节点为None"""
+        ir = self.ir
+        return ir.names[ir.kinds[self.index]]
+
+    @property
+    def text(self):
+        """文本、注释和原始HTML节点的内容，元素为空字符串"""
+        return self.ir.node_text(self.index)
+
+    @property
+    def attrs(self):
+        return dict(self.ir.attrs.get(self.index, ()))
+
+    def get(self, key, default=None):
+        for name, value in self.ir.attrs.get(self.index, ()):
+            if name == key:
+                return value
+        return default
+
+    @property
+    def parent(self):
+        parent = self.ir.parents[self.index]
+        return Node(self.ir, parent) if parent >= 0 else None
+
+    @property
+    def children(self):
+        ir = self.ir
+        ends = ir.ends
+        child = self.index + 1
+        end = ends[self.index]
+        while child < end:
+            yield Node(ir, child)
+            child = ends[child]
+
+    @property
+    def contents(self):
+        ir = self.ir
+        ends = ir.ends
+        result = []
+        child = self.index + 1
+        end = ends[self.index]
+        while child < end:
+            result.append(Node(ir, child))
+            child = ends[child]
+        return result
+
+    def descendants(self):
+        """按文档顺序产出所有后代节点"""
+        ir = self.ir
+        for index in range(self.index + 1, ir.ends[self.index]):
+            yield Node(ir, index)
+
+    def find(self, name):
+        """第一个指定标签的后代元素，没有时返回None"""
+        for node in self.find_all(name):
+            return node
+        return None
+
+    def find_all(self, name, recursive=True):
+        """
+        指定标签的后代元素
+
+        Args:
+            name (str): 标签名
+            recursive (bool): False 时只查找直接子元素
+        """
+        nodes = self.descendants() if recursive else self.children
+        return [node for node in nodes if node.name == name]
+
+    def find_parent(self, names):
+        """最近的、标签在 names 中的祖先元素"""
+        if isinstance(names, str):
+            names = (names,)
+        node = self.parent
+        while node is not None:
+            if node.name in names:
+                return node
+            node = node.parent
+        return None
+
+    def get_text(self):
+        """所有后代文本节点的内容；原始HTML取其中的文本"""
+        return self.ir.get_text(self.index)
+
+
+class DocumentIR:
+    """
+    紧凑的文档中间表示
+    节点按先序排列在几个平行的整数数组中：类型、子树结束位置、父节点，以及文本在文本池中的偏移和长度；
+    所有文本拼接为一个字符串，属性只为有属性的元素保存。
+    Markdown转HTML和HTML转Markdown两个方向都产出这一结构，序列化、纯文本、大纲和统计都在它上面完成，
+    解析得到的文档树在建立IR后即可释放
+    """
+
+    __slots__ = ('kinds', 'ends', 'parents', 'starts', 'lengths', 'text', 'attrs', 'extra_tags', 'names')
+
+    def __init__(self, kinds, ends, parents, starts, lengths, text, attrs, extra_tags):
+        """
+        Args:
+            kinds (array): 节点类型（'H'）
+            ends (array): 子树结束位置，即子树之后第一个节点的序号（'I'）
+            parents (array): 父节点序号，根节点为 -1（'i'）
+            starts (array): 文本在文本池中的起始偏移（'I'）
+            lengths (array): 文本长度（'I'）
+            text (str): 文本池
+            attrs (dict): 节点序号 -> ((属性名, 属性值), ...)
+            extra_tags (list): 不在 TAGS 中的标签名
+        """
+        self.kinds = kinds
+        self.ends = ends
+        self.parents = parents
+        self.starts = starts
+        self.lengths = lengths
+        self.text = text
+        self.attrs = attrs
+        self.extra_tags = extra_tags
+        # 节点类型 -> 标签名，非元素为None
+        self.names = (None,) * ELEMENT + TAGS + tuple(extra_tags)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def root(self):
+        return Node(self, 0)
+
+    @property
+    def nbytes(self):
+        """估算占用的字节数"""
+        size = sys.getsizeof(self.text) + sys.getsizeof(self.attrs)
+        for name, _ in _ARRAYS:
+            values = getattr(self, name)
+            size += values.itemsize * len(values)
+        for pairs in self.attrs.values():
+            size += sys.getsizeof(pairs) + sum(sys.getsizeof(name) + sys.getsizeof(value) for name, value in pairs)
+        return size
+
+    def tag(self, index):
+        """节点的标签名，不是元素时返回None"""
+        return self.names[self.kinds[index]]
+
+    def node_text(self, index):
+        start = self.starts[index]
+        return self.text[start:start + self.lengths[index]]
+
+    def get_text(self, index=0):
+        """节点所有后代的文本"""
+        kinds = self.kinds
+        parts = []
+        for child in range(index + 1, self.ends[index]):
+            kind = kinds[child]
+            if kind == TEXT:
+                parts.append(self.node_text(child))
+            elif kind == RAW_INLINE or kind == RAW_BLOCK:
+                parts.append(_raw_to_text(self.node_text(child)))
+        return ''.join(parts)
+
+    def iter(self, name=None):
+        """按文档顺序产出指定标签（默认为所有）的元素"""
+        for index in range(len(self.kinds)):
+            tag = self.tag(index)
+            if tag is not None and (name is None or tag == name):
+                yield Node(self, index)
+
+    # ---- 从解析结果建立 ----
+
+    @classmethod
+    def from_etree(cls, md, root):
+        """
+        从 Python-Markdown 运行完树处理器的文档树建立IR
+        暂存的原始HTML（包括语法高亮后的代码块）还原为原始HTML节点，只包含一个块级原始HTML的段落直接替换为该块，
+        与 md.convert 的后处理结果一致
+
+        Args:
+            md (markdown.Markdown): 解析该文档的实例
+            root: 文档树根节点
+        """
+        builder = _Builder()
+        raw_html = md.postprocessors['raw_html'] if 'raw_html' in md.postprocessors else None
+        stash = _resolve_stash(md.htmlStash.rawHtmlBlocks)
+        document = builder.open(DOCUMENT, -1)
+        builder.etree_text(root.text, document, stash)
+        for child in root:
+            _build_etree(builder, child, document, stash, raw_html)
+        builder.close(document)
+        return builder.finish()
+
+    @classmethod
+    def from_soup(cls, soup):
+        """
+        从 BeautifulSoup 文档建立IR，文档有body时只包含body的内容
+        DOCTYPE、处理指令等不属于文档内容的节点被忽略，多值属性（如class）以空格连接
+        """
+        return cls._from_soup_nodes((soup.body or soup).children)
+
+    @classmethod
+    def iter_soup(cls, soup, block_tags):
+        """
+        与 from_soup 相同，但按顶层分段产出IR：每段的根节点下是一个 block_tags 中的元素，或相邻的一串其他节点
+        产出下一段前把上一段的节点从文档树中移除并释放，逐段处理时完整的解析树和IR不会同时保留
+
+        Args:
+            soup (BeautifulSoup): 解析后的文档，产出过程中会被清空
+            block_tags (set): 单独成段的顶层元素
+        """
+        from bs4.element import Tag
+
+        def release(nodes):
+            for node in nodes:
+                if isinstance(node, Tag):
+                    node.decompose()
+                else:
+                    node.extract()
+            nodes.clear()
+
+        run = []
+        for child in list((soup.body or soup).contents):
+            if isinstance(child, Tag) and child.name in block_tags:
+                if run:
+                    yield cls._from_soup_nodes(run)
+                    release(run)
+                yield cls._from_soup_nodes((child,))
+                release([child])
+            else:
+                run.append(child)
+        if run:
+            yield cls._from_soup_nodes(run)
+            release(run)
+
+    @classmethod
+    def _from_soup_nodes(cls, nodes):
+        """建立根节点下依次为 nodes 的IR"""
+        # 只在转换HTML时才导入 bs4，只转换Markdown的进程无需加载
+        from bs4.element import Tag, NavigableString, Comment, PreformattedString
+        builder = _Builder()
+        leaf = builder.leaf
+
+        def build(node, parent):
+            attrs = tuple((name, ' '.join(value) if isinstance(value, list) else value)
+                          for name, value in node.attrs.items())
+            index = builder.open_element(node.name, parent, attrs)
+            for child in node.children:
+                cls = type(child)
+                if cls is NavigableString:
+                    leaf(TEXT, index, str(child))
+                elif cls is Tag:
+                    build(child, index)
+                elif isinstance(child, Comment):
+                    leaf(COMMENT, index, str(child))
+                elif isinstance(child, Tag):
+                    build(child, index)
+                elif not isinstance(child, PreformattedString):
+                    leaf(TEXT, index, str(child))
+            builder.close(index)
+
+        document = builder.open(DOCUMENT, -1)
+        for child in nodes:
+            if isinstance(child, Tag):
+                build(child, document)
+            elif isinstance(child, Comment):
+                leaf(COMMENT, document, str(child))
+            elif not isinstance(child, PreformattedString):
+                leaf(TEXT, document, str(child))
+        builder.close(document)
+        return builder.finish()
+
+    # ---- 输出 ----
+
+    def to_html(self):
+        """
+        序列化为HTML片段，属性按名称排序，空元素写为 <br />，与 Python-Markdown 的输出格式一致
+        """
+        parts = []
+        self._write_html(0, parts.append)
+        return ''.join(parts).strip()
+
+    def _write_html(self, index, write, raw_text=False):
+        kinds = self.kinds
+        ends = self.ends
+        child = index + 1
+        end = ends[index]
+        while child < end:
+            kind = kinds[child]
+            if kind == TEXT:
+                text = self.node_text(child)
+                write(text if raw_text else _escape_text(text))
+            elif kind == RAW_INLINE or kind == RAW_BLOCK:
+                write(self.node_text(child))
+            elif kind == COMMENT:
+                write(f'<!--{self.node_text(child)}-->')
+            else:
+                tag = self.tag(child)
+                write('<' + tag)
+                for name, value in sorted(self.attrs.get(child, ())):
+                    write(f' {name}="{_escape_attr(value)}"')
+                if tag.lower() in _VOID_TAGS:
+                    write(' />')
+                else:
+                    write('>')
+                    self._write_html(child, write, tag.lower() in _RAW_TEXT_TAGS)
+                    write(f'</{tag}>')
+            child = ends[child]
+
+    def plain_text(self):
+        """
+        检索和统计用的纯文本：块级元素各占一行，表格单元格以制表符分隔，代码块保留换行和缩进，不含空行
+        """
+        parts = []
+        self._write_text(0, parts, False)
+        lines = (line.rstrip() for line in ''.join(parts).split('\n'))
+        return '\n'.join(line for line in lines if line.strip())
+
+    def _write_text(self, index, parts, preformatted):
+        kinds = self.kinds
+        ends = self.ends
+        child = index + 1
+        end = ends[index]
+        while child < end:
+            kind = kinds[child]
+            if kind == TEXT:
+                text = self.node_text(child)
+                if preformatted:
+                    parts.append(text)
+                elif not text.isspace():
+                    parts.append(text.replace('\n', ' '))
+                elif '\n' not in text:
+                    parts.append(' ')       # 行内元素之间的空格
+            elif kind == RAW_BLOCK:
+                parts.append('\n' + _raw_to_text(self.node_text(child)) + '\n')
+            elif kind == RAW_INLINE:
+                parts.append(_raw_to_text(self.node_text(child)))
+            elif kind != COMMENT:
+                tag = self.tag(child)
+                if tag == 'br':
+                    parts.append('\n')
+                elif tag in _TEXT_BLOCK_TAGS:
+                    parts.append('\n')
+                    self._write_text(child, parts, preformatted or tag == 'pre')
+                    parts.append('\n')
+                elif tag == 'td' or tag == 'th':
+                    # 同一行的单元格以制表符分隔
+                    self._write_text(child, parts, preformatted)
+                    parts.append('\t')
+                elif tag not in _RAW_TEXT_TAGS:
+                    self._write_text(child, parts, preformatted)
+            child = ends[child]
+
+    def headings(self):
+        """
+        文档中的标题
+
+        Returns:
+            list: (级别, 文本, id) 列表，没有id时为None
+        """
+        kinds = self.kinds
+        result = []
+        for index in range(len(kinds)):
+            if kinds[index] < ELEMENT:
+                continue
+            level = _HEADING_LEVELS.get(self.tag(index))
+            if level is not None:
+                result.append((level, self.get_text(index).strip(), Node(self, index).get('id')))
+        return result
+
+    # ---- 序列化 ----
+
+    def to_bytes(self):
+        """序列化为字节串，数组按小端序保存"""
+        header = json.dumps({
+            'count': len(self.kinds),
+            'text': len(self.text),
+            'attrs': [[index, [list(pair) for pair in pairs]] for index, pairs in sorted(self.attrs.items())],
+            'extra_tags': self.extra_tags,
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        chunks = [_PREFIX.pack(_MAGIC, _FORMAT_VERSION, len(header)), header]
+        for name, _ in _ARRAYS:
+            values = getattr(self, name)
+            if sys.byteorder != 'little':
+                values = array(values.typecode, values)
+                values.byteswap()
+            chunks.append(values.tobytes())
+        chunks.append(self.text.encode('utf-8'))
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        从 to_bytes 的结果还原
+
+        Raises:
+            ValueError: 数据不是有效的IR或版本不匹配
+        """
+        if len(data) < _PREFIX.size:
+            raise ValueError("文档IR数据不完整")
+        magic, version, header_length = _PREFIX.unpack_from(data)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("不是有效的文档IR数据或版本不匹配")
+        offset = _PREFIX.size
+        header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+        offset += header_length
+        count = header['count']
+        values = {}
+        for name, typecode in _ARRAYS:
+            values[name] = array(typecode)
+            size = values[name].itemsize * count
+            if offset + size > len(data):
+                raise ValueError("文档IR数据不完整")
+            values[name].frombytes(data[offset:offset + size])
+            if sys.byteorder != 'little':
+                values[name].byteswap()
+            offset += size
+        text = data[offset:].decode('utf-8')
+        if len(text) != header['text']:
+            raise ValueError("文档IR数据不完整")
+        attrs = {index: tuple(tuple(pair) for pair in pairs) for index, pairs in header['attrs']}
+        return cls(text=text, attrs=attrs, extra_tags=header['extra_tags'], **values)
+
+    def save(self, path):
+        """写入文件（先写临时文件再替换）"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+class _Builder:
+    """按先序追加节点，元素在其子树结束时回填结束位置"""
+
+    def __init__(self):
+        self.kinds = array('H')
+        self.ends = array('I')
+        self.parents = array('i')
+        self.starts = array('I')
+        self.lengths = array('I')
+        self.attrs = {}
+        self.extra_tags = []
+        self._extra_kinds = {}
+        self._parts = []
+        self._offset = 0
+
+    def _append(self, kind, parent, text=''):
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.ends.append(index + 1)
+        self.parents.append(parent)
+        self.starts.append(self._offset)
+        self.lengths.append(len(text))
+        if text:
+            self._parts.append(text)
+            self._offset += len(text)
+        return index
+
+    def open(self, kind, parent, attrs=None):
+        index = self._append(kind, parent)
+        if attrs:
+            self.attrs[index] = attrs
+        return index
+
+    def open_element(self, tag, parent, attrs=None):
+        kind = _TAG_KINDS.get(tag)
+        if kind is None:
+            kind = self._extra_kinds.get(tag)
+            if kind is None:
+                kind = ELEMENT + len(TAGS) + len(self.extra_tags)
+                self._extra_kinds[tag] = kind
+                self.extra_tags.append(tag)
+        return self.open(kind, parent, attrs)
+
+    def close(self, index):
+        self.ends[index] = len(self.kinds)
+
+    def leaf(self, kind, parent, text):
+        if text or kind != TEXT:
+            self._append(kind, parent, text)
+
+    def etree_text(self, value, parent, stash, code=False):
+        """Python-Markdown 文档树中的文本：还原转义，暂存占位符替换为原始HTML节点"""
+        if not value:
+            return
+        if code:
+            self.leaf(TEXT, parent, _unescape_code(value))
+            return
+        position = 0
+        for match in HTML_PLACEHOLDER_RE.finditer(value):
+            if match.start() > position:
+                self.amp_text(value[position:match.start()], parent)
+            index = int(match.group(1))
+            if index < len(stash):
+                self.leaf(RAW_INLINE, parent, stash[index])
+            else:
+                self.leaf(TEXT, parent, match.group(0))
+            position = match.end()
+        if position < len(value):
+            self.amp_text(value[position:], parent)
+
+    def amp_text(self, value, parent):
+        """
+        文本中 Python-Markdown 保护的实体引用按原样保存为行内HTML，输出时不转义，
+        与 Python-Markdown 的输出一致（例如混淆后的邮件地址）；取纯文本时再解码
+        """
+        if AMP_SUBSTITUTE not in value:
+            self.leaf(TEXT, parent, value)
+            return
+        position = 0
+        for match in _AMP_ENTITY_RUN_RE.finditer(value):
+            if match.start() > position:
+                self.leaf(TEXT, parent, value[position:match.start()].replace(AMP_SUBSTITUTE, '&'))
+            self.leaf(RAW_INLINE, parent, match.group(0).replace(AMP_SUBSTITUTE, '&'))
+            position = match.end()
+        if position < len(value):
+            self.leaf(TEXT, parent, value[position:].replace(AMP_SUBSTITUTE, '&'))
+
+    def finish(self):
+        return DocumentIR(self.kinds, self.ends, self.parents, self.starts, self.lengths,
+                          ''.join(self._parts), self.attrs, self.extra_tags)
+
+
+def _resolve_stash(blocks):
+    """暂存的原始HTML转为字符串，并展开其中嵌套的占位符"""
+    resolved = []
+    for block in blocks:
+        text = str(block)
+        if '\x02' in text:
+            text = HTML_PLACEHOLDER_RE.sub(
+                lambda m: resolved[int(m.group(1))] if int(m.group(1)) < len(resolved) else m.group(0), text)
+        resolved.append(text)
+    return resolved
+
+
+def _build_etree(builder, element, parent, stash, raw_html):
+    tag = element.tag
+    if not isinstance(tag, str):
+        # 注释等特殊节点
+        builder.leaf(COMMENT, parent, element.text or '')
+        builder.etree_text(element.tail, parent, stash)
+        return
+    text = element.text
+    if tag == 'p' and text and len(element) == 0 and not element.attrib and raw_html is not None:
+        match = HTML_PLACEHOLDER_RE.fullmatch(text)
+        if match and int(match.group(1)) < len(stash) and raw_html.isblocklevel(stash[int(match.group(1))]):
+            # 与后处理器一样，只包含块级原始HTML的段落被该HTML替换
+            builder.leaf(RAW_BLOCK, parent, stash[int(match.group(1))])
+            builder.etree_text(element.tail, parent, stash)
+            return
+    attrs = tuple((name, _restore_amp(value)) for name, value in element.items())
+    index = builder.open_element(tag, parent, attrs)
+    code = tag == 'code'
+    builder.etree_text(text, index, stash, code)
+    for child in element:
+        _build_etree(builder, child, index, stash, raw_html)
+    builder.close(index)
+    builder.etree_text(element.tail, parent, stash)
+
+
+def cache_key(kind, content, variant=''):
+    """
+    计算IR的缓存键
+
+    Args:
+        kind (str): 源格式，'md' 或 'html'
+        content (str): 源文本
+        variant (str): 影响解析结果的其他条件，例如HTML解析器
+    """
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+    return f'{kind}:{variant}:{digest}'
+
+
+class IRCache:
+    """
+    按源文本哈希缓存文档IR，超出内存预算时淘汰最久未使用的条目
+    指定目录时同时把IR写入磁盘，内存中淘汰或进程重启后仍可直接加载，不再重新解析；
+    可以在多个线程中使用
+    """
+
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET, directory=None):
+        """
+        初始化缓存
+
+        Args:
+            budget (int): 内存预算（字节），0 表示不在内存中缓存
+            directory (str, optional): 磁盘缓存目录
+        """
+        self.budget = budget
+        self.directory = directory
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # 缓存键 -> (IR, 字节数)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """获取缓存的IR，命中时标记为最近使用；内存中没有时尝试从磁盘加载"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                _CACHE_LOOKUPS['hit'].inc()
+                return entry[0]
+        ir = self._load(key)
+        if ir is None:
+            _CACHE_LOOKUPS['miss'].inc()
+            return None
+        _CACHE_LOOKUPS['hit'].inc()
+        self._remember(key, ir)
+        return ir
+
+    def put(self, key, ir):
+        """加入IR，并按预算淘汰最久未使用的条目"""
+        self._remember(key, ir)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                ir.save(self._path(key))
+            except OSError as e:
+                log_debug(f"写入文档IR缓存失败: {str(e)}")
+
+    def set_budget(self, budget):
+        """修改内存预算，超出新预算的最久未使用条目立即淘汰"""
+        with self._lock:
+            self.budget = budget
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            _CACHE_BYTES.set(0)
+
+    def _remember(self, key, ir):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if self.budget <= 0:
+                return
+            size = ir.nbytes
+            self._entries[key] = (ir, size)
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (self.total_bytes > self.budget or self.budget <= 0):
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.total_bytes -= old_size
+            _CACHE_EVICTIONS.inc()
+        _CACHE_BYTES.set(self.total_bytes)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace(':', '_') + '.ir')
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return DocumentIR.load(path)
+        except (OSError, ValueError) as e:
+            log_debug(f"读取文档IR缓存失败: {path}: {str(e)}")
+            return None
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,271 @@
+import hashlib
+import os
+import queue
+import sys
+import threading
+from collections import OrderedDict
+from converter import MarkdownConverter, _IO_SECONDS, _IO_CHARS
+from undo import UndoHistory
+from metrics import counter, gauge, histogram
+from logger import log_error, log_debug
+
+# 所有标签页共享的预览缓存预算（字节）
+DEFAULT_PREVIEW_BUDGET = 32 * 1024 * 1024
+
+# 性能指标
+_CACHE_LOOKUPS = {
+    result: counter('nextmd_preview_cache_lookups_total', '预览缓存查询次数', {'result': result})
+    for result in ('hit', 'miss')
+}
+_CACHE_BYTES = gauge('nextmd_preview_cache_bytes', '预览缓存占用的字节数')
+_CACHE_EVICTIONS = counter('nextmd_preview_cache_evictions_total', '预览缓存淘汰的条目数')
+_RENDER_SECONDS = histogram('nextmd_render_seconds', '后台渲染线程每次渲染的耗时（秒）')
+_RENDER_QUEUE = gauge('nextmd_render_queue_depth', '等待后台渲染的请求数')
+_RENDER_DROPPED = counter('nextmd_render_superseded_total', '开始渲染前被新请求替换的渲染请求数')
+
+
+def read_text(path):
+    """
+    读取UTF-8文本文件，并记录耗时和读取量
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        str: 文件内容
+    """
+    with _IO_SECONDS['read'].time():
+        with open(path, "r", encoding="utf-8") as file:
+            content = file.read()
+    _IO_CHARS['read'].inc(len(content))
+    return content
+
+
+def write_text(path, content):
+    """
+    写入UTF-8文本文件，并记录耗时和写入量
+
+    Args:
+        path (str): 文件路径
+        content (str): 文件内容
+    """
+    with _IO_SECONDS['write'].time():
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+    _IO_CHARS['write'].inc(len(content))
+
+
+def _preview_size(preview):
+    """估算预览内容占用的字节数，预览可以是字符串，或 (片段列表, 源码映射)"""
+    if isinstance(preview, str):
+        return sys.getsizeof(preview)
+    tokens, source_map = preview
+    return sys.getsizeof(tokens) + source_map.nbytes + sum(
+        sys.getsizeof(token) + sys.getsizeof(token.text) for token in tokens
+    )
+
+
+def content_key(text):
+    """计算文本内容的缓存键"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class DocumentTab:
+    """
+    单个标签页的文档状态
+    非活动的标签页只保留源文本、缓存键和光标位置，渲染结果统一放在预览缓存中
+    """
+
+    _next_id = 0
+
+    def __init__(self, path=None, source=''):
+        """
+        初始化文档状态
+
+        Args:
+            path (str, optional): 文件路径，未保存的新文档为None
+            source (str): 文档源文本
+        """
+        self.tab_id = DocumentTab._next_id
+        DocumentTab._next_id += 1
+        self.path = path
+        self.source = source            # 标签页处于活动状态时由编辑器持有，此处为None
+        self.saved_key = None
+        self.saved_length = 0
+        self.mark_saved(source)
+        self.cache_key = None           # 最近一次请求渲染的内容键
+        self.pending_key = None         # 正在后台渲染的内容键
+        self.modified = False
+        self.insert_index = "1.0"
+        self.yview = 0.0
+        self.undo_history = UndoHistory()
+
+    def mark_saved(self, text):
+        """记录已保存的内容，用于判断之后是否有未保存的更改"""
+        self.saved_key = content_key(text)
+        self.saved_length = len(text)
+
+    def matches_saved(self, text):
+        """text 是否与已保存的内容相同；长度不同时不计算哈希"""
+        return len(text) == self.saved_length and content_key(text) == self.saved_key
+
+    @property
+    def title(self):
+        """标签页标题"""
+        name = os.path.basename(self.path) if self.path else "未命名"
+        return f"*{name}" if self.modified else name
+
+    @property
+    def is_markdown(self):
+        """是否按Markdown渲染预览（未命名文档视为Markdown）"""
+        if not self.path:
+            return True
+        return os.path.splitext(self.path)[1].lower() not in ['.html', '.htm']
+
+    @property
+    def is_blank(self):
+        """是否为未修改的空白新文档，可以直接复用"""
+        return self.path is None and not self.modified
+
+
+class PreviewCache:
+    """
+    按内容键缓存渲染好的预览，超出内存预算时淘汰最久未使用的条目
+    只在Tk线程中访问
+    """
+
+    def __init__(self, budget=DEFAULT_PREVIEW_BUDGET):
+        """
+        初始化缓存
+
+        Args:
+            budget (int): 内存预算（字节）
+        """
+        self.budget = budget
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # 内容键 -> (预览内容, 字节数)
+
+    def get(self, key):
+        """获取缓存的预览，命中时标记为最近使用"""
+        entry = self._entries.get(key)
+        if entry is None:
+            _CACHE_LOOKUPS['miss'].inc()
+            return None
+        _CACHE_LOOKUPS['hit'].inc()
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, preview):
+        """加入预览，并按预算淘汰最久未使用的条目"""
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key)[1]
+        size = _preview_size(preview)
+        self._entries[key] = (preview, size)
+        self.total_bytes += size
+        self._evict()
+        _CACHE_BYTES.set(self.total_bytes)
+
+    def set_budget(self, budget):
+        """修改内存预算，超出新预算的最久未使用条目立即淘汰"""
+        self.budget = budget
+        self._evict()
+        _CACHE_BYTES.set(self.total_bytes)
+
+    def _evict(self):
+        while self.total_bytes > self.budget and len(self._entries) > 1:
+            old_key, (_, old_size) = self._entries.popitem(last=False)
+            self.total_bytes -= old_size
+            _CACHE_EVICTIONS.inc()
+            log_debug(f"预览缓存超出预算，淘汰: {old_key}")
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RenderWorker:
+    """
+    所有标签页共享的后台渲染线程
+    每个标签页只保留最新的一次请求，旧请求在开始渲染前被直接替换
+    """
+
+    def __init__(self, render=MarkdownConverter.md_to_html):
+        """
+        启动渲染线程
+
+        Args:
+            render (callable): 渲染函数，接收源文本返回预览内容
+        """
+        self._render = render
+        self._requests = OrderedDict()  # 标签页ID -> (内容键, 源文本)
+        self._results = queue.Queue()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="RenderWorker", daemon=True)
+        self._thread.start()
+
+    def submit(self, tab_id, key, source):
+        """提交渲染请求，替换该标签页尚未开始的旧请求"""
+        with self._condition:
+            if tab_id in self._requests:
+                _RENDER_DROPPED.inc()
+            self._requests[tab_id] = (key, source)
+            self._requests.move_to_end(tab_id)
+            _RENDER_QUEUE.set(len(self._requests))
+            self._condition.notify()
+
+    def cancel(self, tab_id):
+        """取消标签页尚未开始的渲染请求"""
+        with self._condition:
+            self._requests.pop(tab_id, None)
+            _RENDER_QUEUE.set(len(self._requests))
+
+    def poll(self):
+        """
+        取出所有已完成的渲染结果（非阻塞）
+
+        Returns:
+            list: (标签页ID, 内容键, 渲染结果) 列表
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def has_work(self):
+        """是否还有排队、进行中或未取走的渲染"""
+        with self._condition:
+            return bool(self._requests) or self._busy or not self._results.empty()
+
+    def stop(self):
+        """停止渲染线程"""
+        with self._condition:
+            self._stopped = True
+            self._requests.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._requests and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                # 优先渲染最近提交的请求，通常就是当前活动的标签页
+                tab_id, (key, source) = self._requests.popitem(last=True)
+                _RENDER_QUEUE.set(len(self._requests))
+                self._busy = True
+            try:
+                with _RENDER_SECONDS.time():
+                    result = self._render(source)
+                self._results.put((tab_id, key, result))
+            except Exception as e:
+                log_error(f"后台渲染失败: {str(e)}")
+            finally:
+                with self._condition:
+                    self._busy = False
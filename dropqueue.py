@@ -0,0 +1,237 @@
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from converter import MarkdownConverter, DEFAULT_COMPRESS_MIN_SIZE
+from documents import read_text
+from metrics import counter
+from logger import log_info, log_error, log_debug
+
+# 拖放时支持的文件类型
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+HTML_EXTENSIONS = ('.html', '.htm')
+SUPPORTED_EXTENSIONS = MARKDOWN_EXTENSIONS + HTML_EXTENSIONS
+
+# 拖入多个文件时对其余文件的处理方式
+DROP_ACTIONS = ('convert', 'open')
+
+# 一次拖放最多打开的标签页数，其余文件记为跳过
+MAX_OPEN_TABS = 100
+
+# 转换时每次提交给工作者的文件数，较小的块让取消和进度更新更及时
+_CHUNK_SIZE = 4
+
+# 后台任务交给界面线程的事件
+# kind: 'first'（第一个文件，detail为内容）、'total'（待处理文件数）、'done'（detail为输出路径）、
+#       'open'（detail为内容）、'skipped'、'error'（detail为原因）、'finished'
+DropEvent = namedtuple('DropEvent', ['kind', 'path', 'detail'])
+
+_DROP_FILES = {
+    result: counter('nextmd_drop_files_total', '拖放处理的文件数', {'result': result})
+    for result in ('done', 'skipped', 'error')
+}
+
+
+def expand_paths(paths):
+    """
+    展开拖入的路径：文件夹递归查找其中支持的文件（跳过隐藏目录），按名称排序；
+    直接拖入的文件不论类型都原样产出，由调用方报告不支持的类型
+
+    Args:
+        paths (iterable): 拖入的文件和文件夹路径
+
+    Yields:
+        str: 文件路径
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    yield os.path.join(directory, name)
+
+
+def conversion_target(path):
+    """转换的输出路径：Markdown转为同名的.html，HTML转为同名的.md"""
+    base, ext = os.path.splitext(path)
+    return base + ('.html' if ext.lower() in MARKDOWN_EXTENSIONS else '.md')
+
+
+class DropJob:
+    """
+    在后台处理一次拖放的文件
+    第一个支持的文件交给编辑器打开，其余文件按 action 在工作池中转换为另一种格式，或读取后在标签页中打开；
+    进度和每个文件的结果放入事件队列，由界面线程分批取出，任务可以随时取消
+    """
+
+    def __init__(self, paths, action='convert', executor='thread', max_workers=None):
+        """
+        启动后台任务
+
+        Args:
+            paths (list): 拖入的文件和文件夹路径
+            action (str): 其余文件的处理方式，'convert' 或 'open'
+            executor (str): 转换使用的执行器，取值同 convert_many
+            max_workers (int, optional): 工作线程/进程数，默认为CPU核数
+        """
+        if action not in DROP_ACTIONS:
+            raise ValueError(f"不支持的处理方式: {action}")
+        self.paths = list(paths)
+        self.action = action
+        self.executor = executor
+        self.max_workers = max_workers
+        self.events = queue.Queue()
+        # 以下计数只由界面线程在 poll 中更新
+        self.total = None       # 文件查找完成前为None
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.finished = False
+        self.started = time.monotonic()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="DropJob", daemon=True)
+        self._thread.start()
+        log_info(f"开始处理拖入的 {len(self.paths)} 个路径，其余文件: {action}")
+
+    @property
+    def processed(self):
+        return self.done + self.skipped + self.failed
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """请求取消，已提交给工作者的少量文件完成后停止"""
+        self._cancelled.set()
+
+    def throughput(self):
+        """每秒处理的文件数"""
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def poll(self, limit=500, open_limit=10):
+        """
+        在界面线程中取出事件并更新计数
+        每次最多取出 limit 个事件、open_limit 个需要打开的文件，避免一次处理过多阻塞界面
+
+        Returns:
+            list: DropEvent 列表
+        """
+        events = []
+        opened = 0
+        while len(events) < limit and opened < open_limit:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event.kind
+            if kind == 'total':
+                self.total = event.detail
+            elif kind == 'done' or kind == 'open':
+                self.done += 1
+                opened += kind == 'open'
+            elif kind == 'skipped':
+                self.skipped += 1
+            elif kind == 'error':
+                self.failed += 1
+            elif kind == 'finished':
+                self.finished = True
+            events.append(event)
+        return events
+
+    def _emit(self, kind, path=None, detail=None):
+        if kind in _DROP_FILES:
+            _DROP_FILES[kind].inc()
+        self.events.put(DropEvent(kind, path, detail))
+
+    def _run(self):
+        try:
+            files = []
+            # 查找文件时已产出错误事件的文件，它们计入 processed，因此也计入总数
+            rejected = 0
+            first_opened = False
+            for path in expand_paths(self.paths):
+                if self.cancelled:
+                    break
+                if os.path.splitext(path)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    self._emit('error', path, "不支持的文件类型")
+                    rejected += 1
+                    continue
+                if not first_opened:
+                    first_opened = self._read(path, 'first')
+                    rejected += not first_opened
+                    continue
+                files.append(path)
+            self._emit('total', detail=len(files) + rejected)
+            if self.action == 'convert':
+                self._convert(files)
+            else:
+                self._open(files)
+        except Exception as e:
+            log_error(f"处理拖入的文件失败: {str(e)}")
+            self._emit('error', None, str(e))
+        finally:
+            self._emit('finished')
+            log_info(f"拖入的文件处理{'已取消' if self.cancelled else '完成'}，"
+                     f"耗时 {time.monotonic() - self.started:.1f}s")
+
+    def _read(self, path, kind):
+        """读取文件并产出 kind 事件，失败时产出错误事件"""
+        try:
+            self._emit(kind, path, read_text(path))
+            return True
+        except UnicodeDecodeError:
+            self._emit('error', path, "无法解码文件，请检查文件编码是否为UTF-8")
+        except OSError as e:
+            self._emit('error', path, e.strerror or str(e))
+        return False
+
+    def _open(self, files):
+        for index, path in enumerate(files):
+            if self.cancelled:
+                return
+            if index >= MAX_OPEN_TABS:
+                self._emit('skipped', path, f"一次最多打开 {MAX_OPEN_TABS} 个标签页")
+                continue
+            self._read(path, 'open')
+
+    def _convert(self, files):
+        tasks = []
+        for path in files:
+            target = conversion_target(path)
+            if path.lower().endswith(HTML_EXTENSIONS) and os.path.exists(target):
+                # 不覆盖已有的Markdown文件，它往往正是这个HTML的来源
+                self._emit('skipped', path, f"已存在 {os.path.basename(target)}")
+            else:
+                # convert_file 的参数：输出已比输入新时跳过，再次拖入同一文件夹只转换修改过的文件
+                tasks.append((path, target, None, None, DEFAULT_COMPRESS_MIN_SIZE, True))
+        if not tasks or self.cancelled:
+            return
+
+        def inputs():
+            for task in tasks:
+                if self.cancelled:
+                    return
+                yield task
+
+        results = MarkdownConverter.convert_many(inputs(), 'convert_file', executor=self.executor,
+                                                 max_workers=self.max_workers, chunk_size=_CHUNK_SIZE,
+                                                 ordered=False)
+        try:
+            for index, ok in results:
+                path, target = tasks[index][:2]
+                if ok:
+                    self._emit('done', path, target)
+                else:
+                    self._emit('error', path, "转换失败，详见日志")
+                if self.cancelled:
+                    break
+        finally:
+            # 关闭生成器时取消尚未开始的任务并关闭工作池
+            results.close()
+        log_debug(f"拖入文件的转换结束，共 {len(tasks)} 个")
@@ -0,0 +1,404 @@
+"""
+NextMD 转换模糊测试：往返一致性与耗时增长
+
+用法:
+    python fuzz.py roundtrip [--iterations N] [--seed N] [--blocks N]
+    python fuzz.py scaling [--family 名称] [--max-exponent X] [--min-seconds 秒]
+    python fuzz.py replay 文件
+
+roundtrip 随机生成Markdown文档，检查 Markdown→HTML→Markdown→HTML 与直接转换的HTML结构一致
+（同时检查去掉块间空白的紧凑HTML），scaling 以成倍增大的病态输入测量转换耗时，
+耗时随输入大小超线性增长时报告。发现的问题把最小化后的输入保存到 fuzz_cases 目录，
+可用 replay 重新检查。
+"""
+import argparse
+import hashlib
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from bs4 import BeautifulSoup
+from converter import MarkdownConverter
+from logger import set_log_levels
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FUZZ_CASES_DIR = os.path.join(BASE_DIR, 'fuzz_cases')
+
+# 生成文本用的词，包含中文和HTML特殊字符
+_WORDS = ('alpha', 'beta', 'gamma', 'delta', 'node', 'value', 'x1', '42', 'a&b', '2<3',
+          '中文', '段落', '测试', '链接', '表格', 'émoji', 'naïve')
+_LANGUAGES = ('', 'python', 'js', 'text')
+_CODE_LINES = ('x = 1', 'if a < b and c > d:', '    return "*not* emphasis"', 'print(`tick`)',
+               '# not a heading', '<b>not bold</b>', '')
+
+# 结构比较时的标签归类，其余标签（div、span等）只保留内容
+_STRUCTURAL = {'h1': 'h1', 'h2': 'h2', 'h3': 'h3', 'h4': 'h4', 'h5': 'h5', 'h6': 'h6',
+               'p': 'p', 'ul': 'ul', 'ol': 'ol', 'li': 'li', 'blockquote': 'blockquote',
+               'table': 'table', 'tr': 'tr', 'th': 'th', 'td': 'td', 'hr': 'hr',
+               'strong': 'strong', 'b': 'strong', 'em': 'em', 'i': 'em', 'a': 'a', 'img': 'img',
+               'code': 'code'}
+
+_BLOCKS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'pre', 'blockquote',
+           'hr', 'table', 'thead', 'tbody', 'tr', 'th', 'td', 'div'}
+
+Family = namedtuple('Family', ['name', 'kind', 'build', 'sizes'])
+
+
+class MarkdownGenerator:
+    """用给定种子随机生成Markdown文档，覆盖标题、段落、列表、引用、代码块、表格和分隔线"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def words(self, low=1, high=6):
+        return ' '.join(self.rng.choice(_WORDS) for _ in range(self.rng.randint(low, high)))
+
+    def inline(self):
+        """一段行内内容：普通文字与强调、行内代码、链接、图片混排"""
+        parts = []
+        for _ in range(self.rng.randint(1, 5)):
+            roll = self.rng.random()
+            if roll < 0.5:
+                parts.append(self.words())
+            elif roll < 0.62:
+                parts.append(f'**{self.words(1, 3)}**')
+            elif roll < 0.74:
+                parts.append(f'*{self.words(1, 3)}*')
+            elif roll < 0.84:
+                parts.append(f'`{self.words(1, 2)}`')
+            elif roll < 0.94:
+                parts.append(f'[{self.words(1, 2)}](page{self.rng.randint(1, 9)}.md)')
+            else:
+                parts.append(f'![{self.words(1, 2)}](img{self.rng.randint(1, 9)}.png)')
+        return ' '.join(parts)
+
+    def list_block(self, depth):
+        ordered = self.rng.random() < 0.4
+        lines = []
+        for i in range(1, self.rng.randint(2, 5)):
+            marker = f'{i}. ' if ordered else '- '
+            lines.append(marker + self.inline())
+            if depth < 2 and self.rng.random() < 0.25:
+                lines.extend('    ' + line for line in self.list_block(depth + 1).split('\n'))
+        return '\n'.join(lines)
+
+    def table(self):
+        columns = self.rng.randint(1, 4)
+        rows = [[self.words(1, 2) for _ in range(columns)]]
+        rows.append(['---'] * columns)
+        for _ in range(self.rng.randint(1, 5)):
+            rows.append([self.inline() if self.rng.random() < 0.3 else self.words(1, 3)
+                         for _ in range(columns)])
+        return '\n'.join('| ' + ' | '.join(row) + ' |' for row in rows)
+
+    def block(self, depth=0):
+        roll = self.rng.random()
+        if roll < 0.15:
+            return '#' * self.rng.randint(1, 6) + ' ' + self.words(1, 4)
+        if roll < 0.45:
+            return '\n'.join(self.inline() for _ in range(self.rng.randint(1, 3)))
+        if roll < 0.6:
+            return self.list_block(0)
+        if roll < 0.7 and depth < 3:
+            inner = '\n\n'.join(self.block(depth + 1) for _ in range(self.rng.randint(1, 3)))
+            return '\n'.join(('> ' + line).rstrip() for line in inner.split('\n'))
+        if roll < 0.8:
+            fence = '```' + self.rng.choice(_LANGUAGES)
+            body = '\n'.join(self.rng.choice(_CODE_LINES) for _ in range(self.rng.randint(1, 4)))
+            return f'{fence}\n{body}\n```'
+        if roll < 0.93:
+            return self.table()
+        return '---'
+
+    def document(self, blocks):
+        # 相邻的同类列表会合并，块之间插入段落避免生成依赖合并规则的文档
+        parts = []
+        for _ in range(self.rng.randint(1, blocks)):
+            parts.append(self.block())
+            parts.append(self.words())
+        return '\n\n'.join(parts) + '\n'
+
+
+def structure(html_content):
+    """
+    HTML的结构签名：结构标签的开闭、链接和图片地址、代码块原文，以及空白归一后的文字
+    列表项中包裹内容的 p（宽松列表）和仅用于样式的 div/span 不计入
+
+    Returns:
+        list: 签名序列，两段HTML结构等价时签名相同
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    tokens = []
+
+    def text(value):
+        value = ' '.join(value.split())
+        if not value:
+            return
+        if tokens and tokens[-1][0] == 'text':
+            tokens[-1] = ('text', f'{tokens[-1][1]} {value}')
+        else:
+            tokens.append(('text', value))
+
+    def walk(element, in_li=False):
+        for child in element.children:
+            if child.name is None:
+                text(child)
+                continue
+            if child.name in ('script', 'style'):
+                continue
+            if child.name == 'pre':
+                tokens.append(('pre', child.get_text().rstrip('\n')))
+                continue
+            tag = _STRUCTURAL.get(child.name)
+            if tag is None or (tag == 'p' and in_li):
+                walk(child, in_li)
+                continue
+            if tag == 'a':
+                tokens.append(('a', child.get('href', '')))
+            elif tag == 'img':
+                tokens.append(('img', child.get('src', ''), child.get('alt', '')))
+            else:
+                tokens.append(('<', tag))
+            walk(child, tag == 'li')
+            tokens.append(('>', tag))
+
+    walk(soup)
+    return tokens
+
+
+def _compact(html_content):
+    """去掉块之间的空白，检查转换是否依赖HTML中块之间的换行"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for string in soup.find_all(string=True):
+        if string.strip() or string.find_parent('pre') is not None:
+            continue
+        before, after = string.previous_sibling, string.next_sibling
+        if (before is None or before.name in _BLOCKS) and (after is None or after.name in _BLOCKS):
+            string.extract()
+    return str(soup)
+
+
+def check_roundtrip(md_content):
+    """
+    检查一篇Markdown文档的往返一致性
+
+    Returns:
+        tuple: (是否一致, 说明)
+    """
+    html_content = MarkdownConverter.md_to_fragment(md_content)[0]
+    expected = structure(html_content)
+    for variant, source in (('html', html_content), ('compact', _compact(html_content))):
+        md_again = MarkdownConverter.html_to_md(source)
+        actual = structure(MarkdownConverter.md_to_fragment(md_again)[0])
+        if actual != expected:
+            return False, _describe(variant, expected, actual, md_again)
+    return True, ''
+
+
+def _describe(variant, expected, actual, md_again):
+    index = next((i for i, (a, b) in enumerate(zip(expected, actual)) if a != b),
+                 min(len(expected), len(actual)))
+    lines = [f"输入: {variant}",
+             f"第 {index} 个结构记号不同",
+             f"  期望: {expected[index:index + 4]}",
+             f"  实际: {actual[index:index + 4]}",
+             "往返后的Markdown:",
+             md_again]
+    return '\n'.join(lines)
+
+
+def minimize(md_content, failing):
+    """
+    缩小仍然触发问题的输入：依次尝试删除块、行和词
+
+    Args:
+        md_content (str): 触发问题的输入
+        failing (callable): 输入仍触发问题时返回True
+
+    Returns:
+        str: 缩小后的输入
+    """
+    for separator in ('\n\n', '\n', ' '):
+        parts = md_content.split(separator)
+        chunk = max(len(parts) // 2, 1)
+        while chunk >= 1:
+            index = 0
+            while index < len(parts):
+                candidate = parts[:index] + parts[index + chunk:]
+                if candidate and failing(separator.join(candidate)):
+                    parts = candidate
+                else:
+                    index += chunk
+            chunk //= 2
+        md_content = separator.join(parts)
+    return md_content
+
+
+def save_case(prefix, content, extension, note):
+    """
+    保存复现用的输入，文件名取内容哈希，相同的问题只保存一次
+
+    Returns:
+        str: 文件路径
+    """
+    os.makedirs(FUZZ_CASES_DIR, exist_ok=True)
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=6).hexdigest()
+    path = os.path.join(FUZZ_CASES_DIR, f'{prefix}-{digest}{extension}')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    with open(path + '.txt', 'w', encoding='utf-8') as f:
+        f.write(note + '\n')
+    return path
+
+
+def run_roundtrip(iterations=200, seed=None, blocks=8):
+    """
+    随机往返测试
+
+    Returns:
+        int: 发现的不同问题数
+    """
+    seed = random.randrange(1 << 32) if seed is None else seed
+    print(f"种子: {seed}")
+    saved = set()
+    for iteration in range(iterations):
+        md_content = MarkdownGenerator(seed + iteration).document(blocks)
+        ok, _ = check_roundtrip(md_content)
+        if ok:
+            continue
+        reduced = minimize(md_content, lambda text: not check_roundtrip(text)[0])
+        _, detail = check_roundtrip(reduced)
+        path = save_case('roundtrip', reduced, '.md', f"种子: {seed + iteration}\n{detail}")
+        if path not in saved:
+            saved.add(path)
+            print(f"\n[{iteration}] 往返结果不一致，已保存: {path}\n--- 最小输入 ---\n{reduced}--- 说明 ---\n{detail}")
+    print(f"\n完成 {iterations} 次，发现 {len(saved)} 个不同的问题")
+    return len(saved)
+
+
+def _nested(open_tag, close_tag, inner):
+    return lambda n: open_tag * n + inner + close_tag * n
+
+
+# 病态输入：每个函数按规模n生成输入，sizes 为测量的规模
+FAMILIES = (
+    Family('paragraph', 'md', lambda n: ' '.join(['word'] * n) + '\n', (2000, 4000, 8000, 16000)),
+    Family('emphasis_run', 'md', lambda n: '*a ' * n + '\n', (250, 500, 1000, 2000)),
+    Family('unclosed_strong', 'md', lambda n: '**a' * n + '\n', (250, 500, 1000, 2000)),
+    Family('underscore_run', 'md', lambda n: '_' * n + 'a' + '_' * (n // 2) + '\n', (250, 500, 1000, 2000)),
+    Family('brackets', 'md', lambda n: '[' * n + 'a' + ']' * n + '(b)\n', (100, 200, 400, 800)),
+    Family('backticks', 'md', lambda n: '`a ' * n + '\n', (250, 500, 1000, 2000)),
+    Family('deep_blockquote', 'md', lambda n: '>' * n + ' a\n', (10, 20, 40, 80)),
+    Family('deep_list', 'md', lambda n: ''.join('    ' * i + '- a\n' for i in range(n)), (10, 20, 40, 80)),
+    Family('md_table', 'md', lambda n: '| a | b |\n| --- | --- |\n' + '| x | *y* |\n' * n, (250, 500, 1000, 2000)),
+    Family('html_table', 'html',
+           lambda n: '<table>' + '<tr><td rowspan="2">a</td><td>b</td></tr>' * n + '</table>',
+           (250, 500, 1000, 2000)),
+    Family('html_nested_blockquote', 'html', _nested('<blockquote>', '</blockquote>', 'a'), (25, 50, 100, 200)),
+    Family('html_nested_inline', 'html', _nested('<b><i>', '</i></b>', 'a'), (25, 50, 100, 200)),
+    Family('html_siblings', 'html', lambda n: '<p>a <b>b</b> c</p>' * n, (500, 1000, 2000, 4000)),
+)
+
+
+def _time(function, argument, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _exponent(points):
+    """对数坐标下的最小二乘斜率，约等于耗时随规模增长的幂次"""
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(max(seconds, 1e-9)) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator
+
+
+def run_scaling(families=None, max_exponent=1.5, min_seconds=0.05, repeat=3):
+    """
+    测量病态输入的转换耗时随规模的增长
+    只有最大规模的耗时超过 min_seconds 时才判断增长幂次，避免计时噪声造成误报
+
+    Returns:
+        int: 超线性增长的输入类别数
+    """
+    flagged = 0
+    print(f"{'类别':<24}{'规模':>24}{'耗时(ms)':>36}{'幂次':>8}")
+    for family in FAMILIES:
+        if families and family.name not in families:
+            continue
+        convert = MarkdownConverter.md_to_html if family.kind == 'md' else MarkdownConverter.html_to_md
+        points = [(len(family.build(n)), _time(convert, family.build(n), repeat)) for n in family.sizes]
+        exponent = _exponent(points)
+        sizes = '/'.join(str(size) for size, _ in points)
+        timings = '/'.join(f'{seconds * 1000:.1f}' for _, seconds in points)
+        slow = exponent > max_exponent and points[-1][1] >= min_seconds
+        print(f"{family.name:<24}{sizes:>24}{timings:>36}{exponent:>8.2f}{'  超线性' if slow else ''}")
+        if slow:
+            flagged += 1
+            # 保存耗时已经明显的最小规模
+            n = next((n for n, (_, seconds) in zip(family.sizes, points) if seconds >= min_seconds),
+                     family.sizes[-1])
+            note = (f"类别: {family.name}\n规模 {sizes} 字符的耗时 {timings} ms，"
+                    f"增长幂次 {exponent:.2f}（阈值 {max_exponent:g}）")
+            path = save_case(f'scaling-{family.name}', family.build(n), f'.{family.kind}', note)
+            print(f"  已保存: {path}")
+    return flagged
+
+
+def replay(path):
+    """重新检查保存的输入：.md 检查往返一致性，.html 检查转换耗时"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if path.endswith('.md'):
+        ok, detail = check_roundtrip(content)
+        print("往返一致" if ok else detail)
+        start = time.perf_counter()
+        MarkdownConverter.md_to_html(content)
+    else:
+        ok = True
+        start = time.perf_counter()
+        MarkdownConverter.html_to_md(content)
+    print(f"转换耗时: {(time.perf_counter() - start) * 1000:.1f} ms")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NextMD 转换模糊测试')
+    subparsers = parser.add_subparsers(dest='name')
+    roundtrip_parser = subparsers.add_parser('roundtrip', help='随机文档的往返一致性')
+    roundtrip_parser.add_argument('--iterations', type=int, default=200, help='生成的文档数')
+    roundtrip_parser.add_argument('--seed', type=int, default=None, help='随机种子，默认随机')
+    roundtrip_parser.add_argument('--blocks', type=int, default=8, help='每篇文档最多的块数')
+    scaling_parser = subparsers.add_parser('scaling', help='病态输入的耗时增长')
+    scaling_parser.add_argument('--family', action='append', help='只测量指定类别，可重复')
+    scaling_parser.add_argument('--max-exponent', type=float, default=1.5, help='允许的耗时增长幂次')
+    scaling_parser.add_argument('--min-seconds', type=float, default=0.05, help='最大规模耗时低于该值时不判断')
+    scaling_parser.add_argument('--repeat', type=int, default=3, help='每个规模测量次数，取最短')
+    replay_parser = subparsers.add_parser('replay', help='重新检查保存的输入')
+    replay_parser.add_argument('path', help='fuzz_cases 中的文件')
+    args = parser.parse_args()
+
+    # 转换失败时 log_error 会输出完整堆栈，控制台只保留错误
+    set_log_levels(console_level='ERROR')
+    # 同一输入反复转换时IR缓存会跳过解析，测量和检查的都是解析过程，关闭缓存
+    MarkdownConverter.ir_cache.set_budget(0)
+    if args.name == 'roundtrip':
+        return 1 if run_roundtrip(args.iterations, args.seed, args.blocks) else 0
+    if args.name == 'scaling':
+        return 1 if run_scaling(args.family, args.max_exponent, args.min_seconds, args.repeat) else 0
+    if args.name == 'replay':
+        return 0 if replay(args.path) else 1
+    parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import re
+from textdiff import common_affixes
+
+# 高亮使用的文本标签，按优先级从低到高排列
+HIGHLIGHT_TAGS = (
+    'md_table', 'md_heading', 'md_code_block',
+    'md_italic', 'md_bold', 'md_link', 'md_code'
+)
+
+_ATX_RE = re.compile(r'^#{1,6}(\s|$)')
+_SETEXT_RE = re.compile(r'^(=+|-+)[ ]*$')
+_FENCE_RE = re.compile(r'^\s{0,3}(`{3,}|~{3,})')
+_TABLE_SEP_RE = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+
+# 行内标记，按出现位置从左到右匹配，代码片段优先
+_INLINE_RE = re.compile(
+    r'(?P<md_code>(`+)[^`]+?\2)'
+    r'|(?P<md_link>!?\[[^\]\n]*\]\([^)\n]*\))'
+    r'|(?P<md_bold>\*\*[^*\n]+\*\*|__[^_\n]+__)'
+    r'|(?P<md_italic>\*[^*\s][^*\n]*\*|(?<!\w)_[^_\s][^_\n]*_(?!\w))'
+)
+
+_TABLE = 'table'
+
+
+def _is_table_separator(line):
+    return '|' in line and '-' in line and _TABLE_SEP_RE.match(line) is not None
+
+
+class Highlighter:
+    """
+    Markdown源码高亮的行状态分析器
+    每行只保存行结束时的状态（围栏代码块或表格），编辑后从变化的行开始重新计算，
+    直到状态与旧状态重新一致为止；标记在绘制时按需计算，只处理可见区域附近尚未绘制的行
+    """
+
+    def __init__(self, text=''):
+        """
+        初始化分析器
+
+        Args:
+            text (str, optional): 初始的Markdown文本
+        """
+        self.reset(text)
+
+    def reset(self, text=''):
+        """丢弃所有状态并重新分析文本，编辑器内容被整体替换时调用"""
+        self._lines = []
+        self._states = []       # 每行结束后的状态：None、围栏标记或表格
+        self._painted = []      # 每行的标签是否已经绘制到编辑器中
+        self.update(text)
+
+    @staticmethod
+    def _next_state(state, line):
+        """根据当前行计算下一行开始时的状态"""
+        if state is not None and state != _TABLE:
+            stripped = line.strip()
+            if stripped.startswith(state) and not stripped.lstrip(state[0]):
+                return None
+            return state
+        match = _FENCE_RE.match(line)
+        if match:
+            return match.group(1)
+        if state == _TABLE:
+            return _TABLE if '|' in line and line.strip() else None
+        if _is_table_separator(line):
+            return _TABLE
+        return None
+
+    def update(self, text):
+        """
+        用新的文本内容更新行状态
+
+        Args:
+            text (str): 当前完整的Markdown文本
+
+        Returns:
+            tuple: 需要重新绘制的行范围 (起始行, 结束行)，从0开始、不含结束行；没有变化时返回None
+        """
+        new_lines = text.split('\n')
+        old_lines = self._lines
+        prefix, suffix = common_affixes(old_lines, new_lines)
+        if prefix == len(old_lines) == len(new_lines):
+            return None
+
+        old_end = len(old_lines) - suffix
+        new_end = len(new_lines) - suffix
+        delta = new_end - old_end
+
+        # 标题和表头的标记取决于相邻行和上一行开始时的状态，因此向前多扫描一行，
+        # 并且要在变化区域之后连续两行的状态都与旧状态一致时才停止
+        start = max(prefix - 1, 0)
+        state = self._states[start - 1] if start > 0 else None
+        new_states = []
+
+        i = start
+        total = len(new_lines)
+        matched = 0
+        while i < total:
+            if i > new_end:
+                old_i = i - delta
+                old_state = self._states[old_i - 1] if old_i > 0 else None
+                matched = matched + 1 if state == old_state else 0
+                if matched == 2:
+                    break
+            state = self._next_state(state, new_lines[i])
+            new_states.append(state)
+            i += 1
+
+        old_stop = i - delta
+        self._states = self._states[:start] + new_states + self._states[old_stop:]
+        self._painted = self._painted[:start] + [False] * (i - start) + self._painted[old_stop:]
+        self._lines = new_lines
+        return start, i
+
+    def _state_before(self, i):
+        return self._states[i - 1] if i > 0 else None
+
+    def line_tokens(self, i):
+        """
+        计算第i行的高亮标记
+
+        Args:
+            i (int): 行号（从0开始）
+
+        Returns:
+            list: (标签, 起始列, 结束列) 列表
+        """
+        lines = self._lines
+        line = lines[i]
+        if not line:
+            return []
+        end = len(line)
+        state = self._state_before(i)
+
+        # 围栏代码块（包括开始和结束的围栏行）
+        if (state is not None and state != _TABLE) or _FENCE_RE.match(line):
+            return [('md_code_block', 0, end)]
+        if line.startswith('    ') and state is None and (i == 0 or not lines[i - 1].strip()):
+            return [('md_code_block', 0, end)]
+
+        tokens = []
+        if _ATX_RE.match(line):
+            tokens.append(('md_heading', 0, end))
+        elif (state == _TABLE and '|' in line) or _is_table_separator(line):
+            tokens.append(('md_table', 0, end))
+        elif '|' in line and i + 1 < len(lines) and _is_table_separator(lines[i + 1]):
+            tokens.append(('md_table', 0, end))
+        elif _SETEXT_RE.match(line):
+            # setext标题的下划线
+            if i > 0 and lines[i - 1].strip() and self._state_before(i - 1) is None:
+                return [('md_heading', 0, end)]
+            return []
+        elif (i + 1 < len(lines) and line.strip() and not line.startswith('    ')
+              and _SETEXT_RE.match(lines[i + 1])):
+            tokens.append(('md_heading', 0, end))
+
+        for match in _INLINE_RE.finditer(line):
+            tokens.append((match.lastgroup, match.start(), match.end()))
+        return tokens
+
+    def take_unpainted(self, first, last):
+        """
+        取出范围内尚未绘制的行并标记为已绘制
+
+        Args:
+            first (int): 起始行（从0开始）
+            last (int): 结束行（包含）
+
+        Returns:
+            list: (行号, 标记列表) 列表，行号从0开始
+        """
+        first = max(first, 0)
+        last = min(last, len(self._lines) - 1)
+        result = []
+        painted = self._painted
+        for i in range(first, last + 1):
+            if not painted[i]:
+                painted[i] = True
+                result.append((i, self.line_tokens(i)))
+        return result
+
+    def __len__(self):
+        return len(self._lines)
@@ -0,0 +1,331 @@
+import logging
+import math
+import os
+import signal
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Executor, Future
+import multiprocessing
+from multiprocessing.connection import wait as wait_connections
+from logger import logger, log_info, log_warning, log_debug
+from metrics import counter
+
+try:
+    import resource
+except ImportError:     # Windows 没有 resource 模块，只能限制墙钟时间
+    resource = None
+
+# 每个文档的默认限制
+DEFAULT_CPU_SECONDS = 30
+DEFAULT_WALL_SECONDS = 60.0
+DEFAULT_MEMORY_MB = 1024
+
+# 每个文档的资源限制：CPU秒数、墙钟秒数、工作进程地址空间的增量（MB）；0 或 None 表示不限制
+Limits = namedtuple('Limits', ['cpu_seconds', 'wall_seconds', 'memory_mb'])
+DEFAULT_LIMITS = Limits(DEFAULT_CPU_SECONDS, DEFAULT_WALL_SECONDS, DEFAULT_MEMORY_MB)
+
+# 没有任务完成时检查超时的最长间隔（秒）
+_POLL_INTERVAL = 0.5
+
+_FAILURES = {
+    reason: counter('nextmd_isolated_failures_total', '隔离工作进程中失败的文档数', {'reason': reason})
+    for reason in ('cpu', 'timeout', 'memory', 'crash')
+}
+_RESTARTS = counter('nextmd_isolated_worker_restarts_total', '隔离工作进程的重启次数')
+
+
+class WorkerLimitError(RuntimeError):
+    """文档超出资源限制或导致工作进程崩溃，reason 为 'cpu'、'timeout'、'memory' 或 'crash'"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        return WorkerLimitError, (self.reason, str(self))
+
+
+def _address_space():
+    """当前进程的虚拟地址空间大小（字节），无法获取时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _MemoryErrorFilter(logging.Filter):
+    """转换方法会捕获异常并返回出错结果，通过其错误日志识别被吞掉的内存不足"""
+
+    def __init__(self):
+        super().__init__()
+        self.seen = False
+
+    def filter(self, record):
+        if record.exc_info and record.exc_info[0] is not None and issubclass(record.exc_info[0], MemoryError):
+            self.seen = True
+        return True
+
+
+def _worker_main(conn, limits):
+    """
+    工作进程主循环：逐个接收任务并返回结果
+    地址空间限制在启动时设置一次；CPU时间是进程累计值，每个任务开始前把软限制设为已用时间加上限额，
+    超出时内核发送 SIGXCPU 结束进程，由父进程重启
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # Ctrl+C 由父进程处理
+    memory_errors = _MemoryErrorFilter()
+    logger.addFilter(memory_errors)
+    if resource is not None and limits.memory_mb:
+        current = _address_space()
+        if current is not None:
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            soft = current + limits.memory_mb * 1024 * 1024
+            if hard == resource.RLIM_INFINITY or soft <= hard:
+                resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        fn, args = task
+        if resource is not None and limits.cpu_seconds:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            soft = math.ceil(usage.ru_utime + usage.ru_stime + limits.cpu_seconds)
+            if hard == resource.RLIM_INFINITY or soft <= hard:
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        try:
+            result = fn(*args)
+            if memory_errors.seen:
+                raise MemoryError()
+            conn.send((True, result))
+        except MemoryError:
+            # 内存不足后进程状态不可靠，报告失败并退出，由父进程重启
+            conn.send((False, WorkerLimitError('memory', f"超出内存限制 {limits.memory_mb}MB")))
+            return
+        except Exception as e:
+            conn.send((False, e))
+
+
+def worker_context():
+    """
+    工作进程使用的 multiprocessing 上下文
+    在多线程的进程中直接 fork 可能复制其他线程持有的锁，有 forkserver 时由它派生工作进程，
+    并预先导入转换模块，新的工作进程无需重新加载依赖；没有 forkserver 的平台（Windows）使用 spawn
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['converter'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class _Worker:
+    """一个工作进程及其通信管道和当前任务"""
+
+    def __init__(self, context, limits):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, limits),
+                                       name="NextMDIsolatedWorker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.future = None
+        self.deadline = None
+
+    def stop(self, timeout=1.0):
+        """请求工作进程退出，超时后强制结束"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class IsolatedExecutor(Executor):
+    """
+    预先启动的隔离工作进程池
+    每个工作进程同时只处理一个任务，任务受 CPU 时间、墙钟时间和地址空间限制；
+    超出限制或崩溃的工作进程被结束并立即重启，对应任务的 Future 以 WorkerLimitError 失败，
+    其余任务不受影响
+    """
+
+    def __init__(self, max_workers=None, limits=DEFAULT_LIMITS):
+        """
+        启动工作进程
+
+        Args:
+            max_workers (int, optional): 工作进程数，默认为CPU核数
+            limits (Limits): 每个任务的资源限制
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.limits = limits
+        if resource is None and (limits.cpu_seconds or limits.memory_mb):
+            log_warning("当前平台不支持 CPU 时间和内存限制，只限制墙钟时间")
+        self._context = worker_context()
+        self._workers = [_Worker(self._context, limits) for _ in range(self.max_workers)]
+        self._queue = deque()       # (future, fn, args)
+        self._lock = threading.Lock()
+        self._wake_reader, self._wake_writer = self._context.Pipe(duplex=False)
+        self._shutdown = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name="IsolatedDispatcher", daemon=True)
+        self._dispatcher.start()
+        log_info(f"隔离工作进程已启动: {self.max_workers} 个，限制 CPU {limits.cpu_seconds or '-'}s、"
+                 f"墙钟 {limits.wall_seconds or '-'}s、内存 {limits.memory_mb or '-'}MB")
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，fn 和参数需可序列化（模块级函数）"""
+        if kwargs:
+            raise TypeError("IsolatedExecutor 不支持关键字参数")
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("执行器已关闭")
+            self._queue.append((future, fn, args))
+        self._wake()
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft()[0].cancel()
+        self._wake()
+        if wait:
+            self._dispatcher.join()
+
+    def _wake(self):
+        try:
+            self._wake_writer.send_bytes(b'')
+        except OSError:
+            pass
+
+    def _assign(self):
+        """把排队的任务分给空闲的工作进程"""
+        for index, worker in enumerate(self._workers):
+            if worker.future is not None:
+                continue
+            if not worker.process.is_alive():
+                # 空闲时意外退出的工作进程
+                worker.process.join()
+                worker.conn.close()
+                self._restart(index)
+                worker = self._workers[index]
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        return
+                    future, fn, args = self._queue.popleft()
+                if future.set_running_or_notify_cancel():
+                    break
+            try:
+                worker.conn.send((fn, args))
+            except Exception as e:
+                # 参数无法序列化或管道已断开
+                future.set_exception(e)
+                if not worker.process.is_alive():
+                    self._restart(index)
+                continue
+            worker.future = future
+            worker.deadline = time.monotonic() + self.limits.wall_seconds if self.limits.wall_seconds else None
+
+    def _restart(self, index):
+        self._workers[index] = _Worker(self._context, self.limits)
+        _RESTARTS.inc()
+
+    def _fail(self, index, reason, message):
+        """结束工作进程，让其任务以 reason 失败，并启动替代的工作进程"""
+        worker = self._workers[index]
+        future = worker.future
+        if worker.process.is_alive():
+            worker.kill()
+        else:
+            worker.process.join()
+            worker.conn.close()
+        self._restart(index)
+        if future is not None:
+            _FAILURES[reason].inc()
+            log_warning(f"隔离工作进程已重启: {message}")
+            future.set_exception(WorkerLimitError(reason, message))
+
+    def _collect(self, index):
+        """读取工作进程返回的结果；进程已退出时按退出码判断原因"""
+        worker = self._workers[index]
+        try:
+            ok, value = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join()
+            code = worker.process.exitcode
+            if code == -getattr(signal, 'SIGXCPU', 0):
+                self._fail(index, 'cpu', f"超出CPU时间限制 {self.limits.cpu_seconds}s")
+            elif code == -getattr(signal, 'SIGKILL', 0) and self.limits.memory_mb:
+                # 通常是系统内存不足时被内核结束
+                self._fail(index, 'memory', "工作进程被系统结束（内存不足）")
+            else:
+                self._fail(index, 'crash', f"工作进程异常退出，退出码 {code}")
+            return
+        except Exception as e:
+            # 结果无法反序列化
+            self._fail(index, 'crash', f"无法读取工作进程的结果: {str(e)}")
+            return
+        future = worker.future
+        worker.future = None
+        worker.deadline = None
+        if ok:
+            future.set_result(value)
+            return
+        if isinstance(value, WorkerLimitError):
+            # 工作进程报告内存不足后会自行退出
+            worker.process.join()
+            worker.conn.close()
+            self._restart(index)
+            _FAILURES[value.reason].inc()
+            log_warning(f"隔离工作进程已重启: {value}")
+        future.set_exception(value)
+
+    def _dispatch(self):
+        try:
+            while True:
+                self._assign()
+                busy = [worker for worker in self._workers if worker.future is not None]
+                with self._lock:
+                    finished = self._shutdown and not busy and not self._queue
+                if finished:
+                    break
+
+                now = time.monotonic()
+                deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+                timeout = min([_POLL_INTERVAL] + [max(deadline - now, 0) for deadline in deadlines])
+                ready = wait_connections([self._wake_reader] + [worker.conn for worker in busy], timeout)
+                if self._wake_reader in ready:
+                    while self._wake_reader.poll():
+                        self._wake_reader.recv_bytes()
+
+                for index, worker in enumerate(self._workers):
+                    if worker.future is None:
+                        continue
+                    if worker.conn in ready:
+                        self._collect(index)
+                    elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                        self._fail(index, 'timeout', f"超出时间限制 {self.limits.wall_seconds:g}s")
+        finally:
+            for worker in self._workers:
+                if worker.future is not None:
+                    worker.future.set_exception(RuntimeError("执行器已关闭"))
+                worker.stop()
+            self._wake_reader.close()
+            self._wake_writer.close()
+            log_debug("隔离工作进程已全部退出")
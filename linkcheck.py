@@ -0,0 +1,238 @@
+"""
+NextMD 工作区链接检查
+
+用法:
+    python linkcheck.py DIR [--workers N] [--executor process|thread|isolated]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import defaultdict, namedtuple
+from urllib.parse import urlsplit, unquote
+from converter import MarkdownConverter, LinkRef
+from search import scan_workspace
+from logger import log_info, log_error, log_debug
+
+# 链接缓存目录，与搜索索引一样位于程序目录下
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LINK_CACHE_DIR = os.path.join(BASE_DIR, 'link_cache')
+
+# 缓存格式变化时递增，旧缓存整体作废
+_CACHE_VERSION = 1
+
+# 需要检查锚点的文件类型
+_ANCHOR_EXTENSIONS = ('.md', '.markdown', '.html', '.htm')
+
+# 失效的链接：所在文件、行号、链接地址、原因
+BrokenLink = namedtuple('BrokenLink', ['source', 'line', 'target', 'reason'])
+
+
+class LinkGraph:
+    """
+    工作区的链接图
+    每个文件提取出的锚点和链接按 (修改时间, 大小) 缓存在JSON文件中，
+    更新时只在进程池中重新解析新增和修改过的文件；检查只需查表和判断目标文件是否存在
+    """
+
+    def __init__(self, root, cache_path=None):
+        """
+        打开（或创建）工作区的链接图
+
+        Args:
+            root (str): 工作区目录
+            cache_path (str, optional): 缓存文件路径，默认按工作区路径放在 LINK_CACHE_DIR 下
+        """
+        self.root = os.path.abspath(root)
+        if cache_path is None:
+            digest = hashlib.blake2b(self.root.encode('utf-8'), digest_size=8).hexdigest()
+            cache_path = os.path.join(LINK_CACHE_DIR, f"{digest}.json")
+        self.cache_path = cache_path
+        # 绝对路径 -> {'mtime', 'size', 'anchors', 'links'}
+        self.files = self._load_cache()
+        # 工作区之外被链接到的文件的锚点，只在本次检查中缓存
+        self._external_anchors = {}
+
+    def _load_cache(self):
+        """读取缓存文件，不存在或格式不符时返回空表"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log_error(f"读取链接缓存失败: {self.cache_path} - {str(e)}")
+            return {}
+        if data.get('version') != _CACHE_VERSION or data.get('root') != self.root:
+            return {}
+        files = data.get('files', {})
+        for entry in files.values():
+            entry['links'] = [LinkRef(*link) for link in entry['links']]
+        return files
+
+    def _save_cache(self):
+        """写出缓存（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        data = json.dumps(
+            {'version': _CACHE_VERSION, 'root': self.root, 'files': self.files},
+            ensure_ascii=False
+        )
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, self.cache_path)
+
+    def update(self, executor='process', max_workers=None):
+        """
+        增量更新链接图：新增和修改的文件重新提取链接，已删除的文件从图中移除
+
+        Args:
+            executor: 同 MarkdownConverter.convert_many
+            max_workers (int, optional): 并行工作数
+
+        Returns:
+            tuple: (重新解析的文件数, 移除的文件数)
+        """
+        found = scan_workspace(self.root)
+        removed = [path for path in self.files if path not in found]
+        for path in removed:
+            del self.files[path]
+        changed = [
+            path for path, (mtime, size) in found.items()
+            if path not in self.files
+            or (self.files[path]['mtime'], self.files[path]['size']) != (mtime, size)
+        ]
+
+        parsed = 0
+        if changed:
+            results = MarkdownConverter.convert_many(
+                changed, mode='extract_links', executor=executor,
+                max_workers=max_workers, ordered=False
+            )
+            for index, result in results:
+                path = changed[index]
+                if result is None:
+                    # 读取失败的文件不缓存，下次重新尝试
+                    self.files.pop(path, None)
+                    continue
+                anchors, links = result
+                mtime, size = found[path]
+                self.files[path] = {'mtime': mtime, 'size': size, 'anchors': anchors, 'links': links}
+                parsed += 1
+
+        if changed or removed:
+            self._save_cache()
+            log_info(f"链接图已更新: {self.root}，重新解析 {parsed} 个文件，移除 {len(removed)} 个")
+        return parsed, len(removed)
+
+    def resolve(self, source, target):
+        """
+        把链接地址解析为本地路径和锚点
+
+        Args:
+            source (str): 链接所在的文件
+            target (str): 链接地址
+
+        Returns:
+            tuple: (绝对路径, 锚点)；外部链接（http、mailto等）返回None
+        """
+        parts = urlsplit(target)
+        # 单个字母的协议是Windows盘符
+        if parts.netloc or (parts.scheme and len(parts.scheme) > 1):
+            return None
+        path = unquote(target.split('#', 1)[0].split('?', 1)[0])
+        anchor = unquote(parts.fragment)
+        if not path:
+            return source, anchor
+        if path.startswith('/'):
+            resolved = os.path.join(self.root, path.lstrip('/'))
+        else:
+            resolved = os.path.join(os.path.dirname(source), path)
+        return os.path.normpath(resolved), anchor
+
+    def edges(self):
+        """
+        遍历图中所有指向本地文件的链接
+
+        Yields:
+            tuple: (所在文件, LinkRef, 目标路径, 锚点)
+        """
+        for source, entry in self.files.items():
+            for link in entry['links']:
+                resolved = self.resolve(source, link.target)
+                if resolved is not None:
+                    yield (source, link) + resolved
+
+    def inbound(self):
+        """
+        反向链接表
+
+        Returns:
+            dict: 目标路径 -> 链接到它的文件列表
+        """
+        linked_from = defaultdict(list)
+        for source, _, path, _ in self.edges():
+            if path != source and source not in linked_from[path]:
+                linked_from[path].append(source)
+        return linked_from
+
+    def _anchors_of(self, path):
+        """目标文件中的锚点集合，工作区之外的文件临时解析"""
+        entry = self.files.get(path)
+        if entry is not None:
+            return entry['anchors']
+        if path not in self._external_anchors:
+            result = MarkdownConverter.extract_links(path)
+            self._external_anchors[path] = set(result[0]) if result is not None else set()
+        return self._external_anchors[path]
+
+    def check(self):
+        """
+        检查所有本地链接的目标文件和锚点是否存在
+
+        Returns:
+            list: BrokenLink 列表，按文件和行号排列
+        """
+        self._external_anchors = {}
+        anchor_sets = {path: set(entry['anchors']) for path, entry in self.files.items()}
+        exists = {}
+        broken = []
+        for source, link, path, anchor in self.edges():
+            if path not in exists:
+                exists[path] = path in self.files or os.path.exists(path)
+            if not exists[path]:
+                broken.append(BrokenLink(source, link.line, link.target, "目标文件不存在"))
+                continue
+            if not anchor or os.path.splitext(path)[1].lower() not in _ANCHOR_EXTENSIONS:
+                continue
+            anchors = anchor_sets.get(path)
+            if anchors is None:
+                anchors = self._anchors_of(path)
+            if anchor not in anchors:
+                broken.append(BrokenLink(source, link.line, link.target, f"锚点 #{anchor} 不存在"))
+        broken.sort(key=lambda item: (item.source, item.line or 0))
+        log_debug(f"链接检查完成: {self.root}，{len(broken)} 个失效链接")
+        return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NextMD 工作区链接检查')
+    parser.add_argument('root', help='工作区目录')
+    parser.add_argument('--workers', type=int, default=None, help='并行工作进程数')
+    parser.add_argument('--executor', choices=('process', 'thread', 'isolated'), default='process')
+    args = parser.parse_args()
+
+    graph = LinkGraph(args.root)
+    parsed, removed = graph.update(executor=args.executor, max_workers=args.workers)
+    broken = graph.check()
+    for item in broken:
+        name = os.path.relpath(item.source, graph.root)
+        print(f"{name}:{item.line or '?'}: {item.target} - {item.reason}")
+    links = sum(len(entry['links']) for entry in graph.files.values())
+    print(f"{len(graph.files)} 个文件（重新解析 {parsed} 个），{links} 个链接，{len(broken)} 个失效")
+    return 1 if broken else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
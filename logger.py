@@ -57,4 +57,17 @@ def log_critical(message):
 
 def get_log_file_path():
     """获取当前日志文件路径"""
-    return LOG_FILE
\ No newline at end of file
+    return LOG_FILE
+
+def set_log_levels(console_level=None, file_level=None):
+    """
+    调整控制台和日志文件的日志级别，可在运行中调用
+    
+    Args:
+        console_level (str, optional): 控制台日志级别，如 'INFO'
+        file_level (str, optional): 日志文件的日志级别，如 'DEBUG'
+    """
+    if console_level:
+        console_handler.setLevel(console_level)
+    if file_level:
+        file_handler.setLevel(file_level)
@@ -1,27 +1,106 @@
 import sys
+import math
+import signal
 import argparse
-import tkinter as tk
-from config import Config, validate_config
+from config import Config, ConfigError, EXECUTORS, validate_config
 from converter import MarkdownConverter
-from ui import MarkdownEditorUI
-from logger import log_info, log_error, log_warning, log_debug
+from isolation import Limits
+from pipeline import PIPELINE_COMMANDS, add_pipeline_parsers, run_pipeline
+from metrics import REGISTRY, MetricsDumper, DEFAULT_DUMP_INTERVAL, SNAPSHOT_FORMATS
+from logger import log_info, log_error, log_warning, log_debug, set_log_levels
+
+# 检查.env文件是否修改的间隔（毫秒）
+CONFIG_POLL_INTERVAL = 2000
+
+def _positive_float(value):
+    """argparse 的类型检查：必须是大于0的有限数"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"不是有效的数字: {value}")
+    if not (number > 0 and math.isfinite(number)):
+        raise argparse.ArgumentTypeError(f"必须是大于0的有限数: {value}")
+    return number
 
 def parse_arguments():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='NextMD - Markdown编辑器')
     parser.add_argument('--host', type=str, help='部署地址')
     parser.add_argument('--port', type=int, help='部署端口')
+    parser.add_argument('--metrics-file', type=str, help='定期把性能指标写入该文件（.json 为JSON，其余为Prometheus文本）')
+    parser.add_argument('--metrics-interval', type=_positive_float, default=DEFAULT_DUMP_INTERVAL,
+                        help=f'写入性能指标的间隔秒数（默认：{DEFAULT_DUMP_INTERVAL:g}）')
+    parser.add_argument('--print-metrics', choices=SNAPSHOT_FORMATS, help='退出时把性能指标输出到标准输出')
+    
+    # 子命令：不启动界面，直接在命令行完成任务
+    subparsers = parser.add_subparsers(dest='command')
+    build_parser = subparsers.add_parser('build', help='把Markdown目录构建为静态HTML站点')
+    build_parser.add_argument('source', help='Markdown源目录')
+    build_parser.add_argument('output', help='HTML输出目录')
+    build_parser.add_argument('--workers', type=int, default=None, help='并行工作进程数，默认取配置中的 WORKERS')
+    build_parser.add_argument('--executor', choices=EXECUTORS, default=None,
+                              help='并行方式，默认取配置中的 EXECUTOR')
+    build_parser.add_argument('--minify', action='store_true', help='输出压缩后的HTML和样式表')
+    build_parser.add_argument('--force', action='store_true', help='忽略构建清单，重新构建全部页面')
+    add_pipeline_parsers(subparsers)
     return parser.parse_args()
 
+def apply_runtime_settings(config, changed):
+    """把日志级别、HTML解析器等进程级的配置应用到各模块，配置重新加载后再次调用"""
+    set_log_levels(config.log_level, config.file_log_level)
+    MarkdownConverter.html_parser = config.html_parser
+    MarkdownConverter.stream_threshold = config.stream_threshold_kb * 1024
+    MarkdownConverter.worker_limits = Limits(config.worker_cpu_seconds, config.worker_timeout,
+                                             config.worker_memory_mb)
+    MarkdownConverter.ir_cache.set_budget(config.ir_cache_mb * 1024 * 1024)
+
+def watch_config(root, config):
+    """定期检查.env文件是否修改，修改后重新加载配置"""
+    config.check_reload()
+    root.after(CONFIG_POLL_INTERVAL, watch_config, root, config)
+
+def run_build(args, config):
+    """执行静态站点构建，返回进程退出码"""
+    from sitebuild import build_site
+    try:
+        report = build_site(
+            args.source, args.output, executor=args.executor or config.executor,
+            max_workers=args.workers or config.workers or None,
+            minify=args.minify, force=args.force
+        )
+    except Exception as e:
+        log_error(f"站点构建失败: {str(e)}")
+        return 1
+    print(f"页面 {report.pages} 个，重新渲染 {report.rendered} 个，目录页 {report.indexes} 个，"
+          f"资源 {report.assets} 个，删除 {report.removed} 个")
+    for name, seconds in report.timings:
+        print(f"  {name:<6}{seconds * 1000:>10.1f} ms")
+    print(f"  {'总计':<6}{sum(seconds for _, seconds in report.timings) * 1000:>10.1f} ms")
+    return 0
+
 def main():
     """主程序入口"""
+    args = None
+    dumper = None
     try:
         # 解析命令行参数
         args = parse_arguments()
+        if args.metrics_file:
+            dumper = MetricsDumper(args.metrics_file, args.metrics_interval)
         
-        # 初始化配置
-        config = Config()
+        # 初始化配置，无效的配置值直接报错退出
+        try:
+            config = Config()
+        except ConfigError as e:
+            log_error(f"配置无效，请检查.env文件或环境变量:\n{e}")
+            sys.exit(2)
         config.update_from_cli(args)
+        config.add_listener(apply_runtime_settings)
+        
+        if args.command == 'build':
+            sys.exit(run_build(args, config))
+        if args.command in PIPELINE_COMMANDS:
+            sys.exit(run_pipeline(args, config))
         
         # 验证配置
         if not validate_config(config):
@@ -33,6 +112,10 @@ def main():
         log_info(f"启动 {config.app_name} v{config.app_version}")
         log_info(f"部署地址: {config.get_deployment_url()}")
         
+        # 界面相关的模块只在启动界面时导入，命令行子命令无需加载Tk
+        import tkinter as tk
+        from ui import MarkdownEditorUI
+        
         # 初始化Tkinter根窗口
         root = tk.Tk()
         
@@ -40,7 +123,12 @@ def main():
         root.title(f"{config.app_name} - Markdown编辑器")
         
         # 创建并显示编辑器界面
-        editor = MarkdownEditorUI(root)
+        editor = MarkdownEditorUI(root, config)
+        
+        # .env文件修改后或收到SIGHUP时重新加载配置，无需重启
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda signum, frame: config.request_reload())
+        root.after(CONFIG_POLL_INTERVAL, watch_config, root, config)
         
         # 启动主事件循环
         root.mainloop()
@@ -57,6 +145,12 @@ def main():
             except Exception:
                 pass
     finally:
+        if dumper is not None:
+            dumper.stop()
+        if args is not None and args.print_metrics:
+            # 管道模式的标准输出是转换结果，指标改写到标准错误
+            stream = sys.stderr if args.command in PIPELINE_COMMANDS else sys.stdout
+            print(REGISTRY.render(args.print_metrics), file=stream)
         log_info("程序已退出")
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from logger import log_info, log_error, log_debug
+
+# 耗时直方图的默认分桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 定期写出快照的默认间隔（秒）
+DEFAULT_DUMP_INTERVAL = 60.0
+
+SNAPSHOT_FORMATS = ('prometheus', 'json')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def sample(self):
+        return {'value': self._value}
+
+
+class Gauge:
+    """可增可减的当前值，例如队列深度"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def sample(self):
+        return {'value': self._value}
+
+
+class Histogram:
+    """
+    固定分桶的直方图
+    每个分桶只保存落入的次数，记录一次观测是一次二分查找和两次加法
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)   # 最后一个为 +Inf 桶
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        """计时上下文管理器，退出时记录经过的秒数"""
+        return _Timer(self)
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def quantile(self, q):
+        """
+        按分桶线性插值估算分位数
+
+        Args:
+            q (float): 0到1之间的分位
+
+        Returns:
+            float: 估算值，没有观测时返回0；落在 +Inf 桶时返回最大的分桶上界
+        """
+        counts = list(self._counts)
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def sample(self):
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            running += count
+            cumulative.append((bound, running))
+        return {'count': running, 'sum': total_sum, 'buckets': cumulative}
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    """
+    指标注册表
+    同一名称和标签只创建一个指标对象，模块加载时取得指标并保存，记录时不再查表
+    """
+
+    def __init__(self):
+        self._metrics = {}      # (名称, 标签) -> 指标
+        self._help = {}         # 名称 -> (类型, 说明)
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        labels = tuple(sorted((labels or {}).items()))
+        key = (name, labels)
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                known = self._help.get(name)
+                if known is not None and known[0] != cls.kind:
+                    raise ValueError(f"指标 {name} 已注册为 {known[0]}")
+                metric = cls(name, labels, **kwargs)
+                self._metrics[key] = metric
+                self._help.setdefault(name, (cls.kind, help_text))
+            return metric
+
+    def counter(self, name, help_text='', labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', labels=None):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def metrics(self):
+        """按名称和标签排列的所有指标"""
+        with self._lock:
+            return [self._metrics[key] for key in sorted(self._metrics)]
+
+    def snapshot(self):
+        """
+        当前所有指标的取值
+
+        Returns:
+            dict: 可直接序列化为JSON的快照
+        """
+        families = {}
+        for metric in self.metrics():
+            kind, help_text = self._help[metric.name]
+            family = families.setdefault(metric.name, {'type': kind, 'help': help_text, 'samples': []})
+            sample = metric.sample()
+            sample['labels'] = dict(metric.labels)
+            if kind == 'histogram':
+                sample['buckets'] = [['+Inf' if bound == math.inf else bound, count]
+                                     for bound, count in sample['buckets']]
+            family['samples'].append(sample)
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'pid': os.getpid(),
+            'metrics': families,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """
+        Prometheus 文本格式的快照
+
+        Returns:
+            str: 指标文本
+        """
+        lines = []
+        current = None
+        for metric in self.metrics():
+            kind, help_text = self._help[metric.name]
+            if metric.name != current:
+                current = metric.name
+                if help_text:
+                    lines.append(f'# HELP {metric.name} {help_text}')
+                lines.append(f'# TYPE {metric.name} {kind}')
+            sample = metric.sample()
+            if kind != 'histogram':
+                lines.append(f'{metric.name}{_format_labels(metric.labels)} {_format_value(sample["value"])}')
+                continue
+            for bound, count in sample['buckets']:
+                labels = metric.labels + (('le', _format_value(float(bound))),)
+                lines.append(f'{metric.name}_bucket{_format_labels(labels)} {count}')
+            lines.append(f'{metric.name}_sum{_format_labels(metric.labels)} {_format_value(sample["sum"])}')
+            lines.append(f'{metric.name}_count{_format_labels(metric.labels)} {sample["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def render(self, fmt='prometheus'):
+        """按格式（'prometheus' 或 'json'）输出快照"""
+        if fmt not in SNAPSHOT_FORMATS:
+            raise ValueError(f"不支持的指标格式: {fmt}")
+        return self.to_json() if fmt == 'json' else self.to_prometheus()
+
+    def dump(self, path, fmt=None):
+        """
+        把快照写入文件（先写临时文件再替换）
+
+        Args:
+            path (str): 文件路径
+            fmt (str, optional): 格式，默认按扩展名判断，.json 为JSON，其余为Prometheus文本
+        """
+        if fmt is None:
+            fmt = 'json' if path.lower().endswith('.json') else 'prometheus'
+        data = self.render(fmt)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+# 进程内共享的默认注册表
+REGISTRY = Registry()
+
+
+def counter(name, help_text='', labels=None):
+    """在默认注册表中取得计数器"""
+    return REGISTRY.counter(name, help_text, labels)
+
+
+def gauge(name, help_text='', labels=None):
+    """在默认注册表中取得当前值指标"""
+    return REGISTRY.gauge(name, help_text, labels)
+
+
+def histogram(name, help_text='', labels=None, buckets=DEFAULT_BUCKETS):
+    """在默认注册表中取得直方图"""
+    return REGISTRY.histogram(name, help_text, labels, buckets)
+
+
+def timed(hist, calls=None):
+    """
+    装饰器：记录函数每次调用的耗时
+
+    Args:
+        hist (Histogram): 记录耗时的直方图
+        calls (Counter, optional): 同时累加的调用次数
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+                if calls is not None:
+                    calls.inc()
+        return wrapper
+    return decorator
+
+
+class MetricsDumper:
+    """后台线程定期把快照写入文件，停止时再写出一次"""
+
+    def __init__(self, path, interval=DEFAULT_DUMP_INTERVAL, registry=None, fmt=None):
+        """
+        启动定期写出
+
+        Args:
+            path (str): 快照文件路径
+            interval (float): 写出间隔（秒）
+            registry (Registry, optional): 注册表，默认为 REGISTRY
+            fmt (str, optional): 格式，默认按扩展名判断
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry or REGISTRY
+        self.fmt = fmt
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MetricsDumper", daemon=True)
+        self._thread.start()
+        log_info(f"性能指标将每 {interval:g} 秒写入: {path}")
+
+    def _dump(self):
+        try:
+            self.registry.dump(self.path, self.fmt)
+            log_debug(f"性能指标已写入: {self.path}")
+        except Exception as e:
+            log_error(f"写入性能指标失败: {str(e)}")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._dump()
+
+    def stop(self):
+        """停止后台线程并写出最终快照"""
+        self._stopped.set()
+        self._thread.join(timeout=1)
+        self._dump()
@@ -0,0 +1,189 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from markdown.extensions.toc import slugify, unique
+from textdiff import common_affixes
+
+# 标题条目：级别、文本、锚点、源码行号（从1开始）
+Heading = namedtuple('Heading', ['level', 'text', 'anchor', 'line'])
+
+# 与Python-Markdown的标题规则保持一致
+_ATX_RE = re.compile(r'^(#{1,6})(.*?)#*\s*$')
+_SETEXT_RE = re.compile(r'^(=+|-+)[ ]*$')
+_FENCE_RE = re.compile(r'^(`{3,}|~{3,})')
+_LINK_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+_INLINE_MARK_RE = re.compile(r'\*\*|__|\*|`')
+
+
+def _clean_heading_text(text):
+    """去除标题中的常见行内标记，得到显示文本"""
+    text = _LINK_RE.sub(r'\1', text)
+    return _INLINE_MARK_RE.sub('', text).strip()
+
+
+class OutlineIndex:
+    """
+    文档大纲索引
+    按行扫描Markdown源码，维护标题列表（级别、文本、锚点、行号），
+    编辑后只重新扫描变化的行，直到围栏代码块状态与旧状态重新一致为止
+    """
+
+    def __init__(self, text=''):
+        """
+        初始化大纲索引
+
+        Args:
+            text (str, optional): 初始的Markdown文本
+        """
+        self._lines = []
+        self._states = []       # 每行结束后的围栏状态（围栏标记或None）
+        self._head_lines = []   # 标题所在行（从0开始），保持有序
+        self._head_info = []    # 与_head_lines对应的 (级别, 文本)
+        self._headings = None   # 带锚点的标题列表缓存
+        self.update(text)
+
+    @staticmethod
+    def _next_state(state, line):
+        """根据当前行计算围栏代码块状态"""
+        if state is not None:
+            stripped = line.rstrip()
+            if stripped.startswith(state) and not stripped.lstrip(state[0]):
+                return None
+            return state
+        match = _FENCE_RE.match(line)
+        if match:
+            return match.group(1)
+        return None
+
+    @staticmethod
+    def _classify(lines, i, state):
+        """
+        判断第i行是否为标题
+
+        Returns:
+            tuple: (级别, 文本)，不是标题时返回None
+        """
+        if state is not None:
+            return None
+        line = lines[i]
+        if _FENCE_RE.match(line):
+            return None
+        match = _ATX_RE.match(line)
+        if match:
+            return len(match.group(1)), _clean_heading_text(match.group(2))
+        if not line.strip() or line.startswith('    ') or _SETEXT_RE.match(line):
+            return None
+        if i + 1 < len(lines):
+            underline = _SETEXT_RE.match(lines[i + 1])
+            if underline:
+                level = 1 if underline.group(1)[0] == '=' else 2
+                return level, _clean_heading_text(line)
+        return None
+
+    def update(self, text):
+        """
+        用新的文本内容更新索引
+
+        Args:
+            text (str): 当前完整的Markdown文本
+
+        Returns:
+            bool: 大纲是否发生变化
+        """
+        new_lines = text.split('\n')
+        old_lines = self._lines
+        prefix, suffix = common_affixes(old_lines, new_lines)
+        if prefix == len(old_lines) == len(new_lines):
+            return False
+
+        old_end = len(old_lines) - suffix
+        new_end = len(new_lines) - suffix
+        delta = new_end - old_end
+
+        # setext标题由下一行决定，因此从变化区域的前一行开始扫描
+        start = max(prefix - 1, 0)
+        state = self._states[start - 1] if start > 0 else None
+        new_states = []
+        new_head_lines = []
+        new_head_info = []
+
+        i = start
+        total = len(new_lines)
+        while i < total:
+            if i >= new_end:
+                old_i = i - delta
+                old_state = self._states[old_i - 1] if old_i > 0 else None
+                if state == old_state:
+                    break
+            info = self._classify(new_lines, i, state)
+            if info is not None:
+                new_head_lines.append(i)
+                new_head_info.append(info)
+            state = self._next_state(state, new_lines[i])
+            new_states.append(state)
+            i += 1
+
+        old_stop = i - delta
+        self._states = self._states[:start] + new_states + self._states[old_stop:]
+
+        lo = bisect_left(self._head_lines, start)
+        hi = bisect_left(self._head_lines, old_stop)
+        # 扫描区域内的标题有增删，或其后的标题行号发生了平移
+        changed = (
+            self._head_info[lo:hi] != new_head_info or
+            self._head_lines[lo:hi] != new_head_lines or
+            (delta != 0 and hi < len(self._head_lines))
+        )
+        self._head_lines = (
+            self._head_lines[:lo] + new_head_lines +
+            [line + delta for line in self._head_lines[hi:]]
+        )
+        self._head_info = self._head_info[:lo] + new_head_info + self._head_info[hi:]
+        self._lines = new_lines
+        if changed:
+            self._headings = None
+        return changed
+
+    @property
+    def headings(self):
+        """
+        获取标题列表
+
+        Returns:
+            list: Heading 列表，按出现顺序排列
+        """
+        if self._headings is None:
+            used_ids = set()
+            headings = []
+            for line, (level, text) in zip(self._head_lines, self._head_info):
+                anchor = unique(slugify(text, '-'), used_ids)
+                headings.append(Heading(level, text, anchor, line + 1))
+            self._headings = headings
+        return self._headings
+
+    def heading_at(self, line):
+        """
+        二分查找给定行所属的标题
+
+        Args:
+            line (int): 行号（从1开始）
+
+        Returns:
+            int: 标题在列表中的下标，行位于第一个标题之前时返回-1
+        """
+        return bisect_right(self._head_lines, line - 1) - 1
+
+    def line_of(self, index):
+        """
+        获取第index个标题所在行
+
+        Args:
+            index (int): 标题下标
+
+        Returns:
+            int: 行号（从1开始）
+        """
+        return self._head_lines[index] + 1
+
+    def __len__(self):
+        return len(self._head_lines)
@@ -0,0 +1,131 @@
+import argparse
+import codecs
+import importlib.util
+import io
+import os
+import sys
+from converter import MarkdownConverter, MD_ENGINES
+from config import HTML_PARSERS
+from templates import CSS_MODES, DEFAULT_STYLESHEET
+from logger import log_error, log_debug, set_log_levels
+
+# 命令行管道模式：从标准输入读取一个文档，转换结果边生成边写到标准输出，不启动界面
+# 例如: python main.py md2html --fragment < README.md > README.html
+PIPELINE_COMMANDS = ('md2html', 'html2md')
+
+DEFAULT_ENCODING = 'utf-8'
+
+
+class _PipeClosed(BaseException):
+    """下游关闭了管道；继承 BaseException，不会被转换方法当作转换错误记录"""
+
+
+class _PipeWriter:
+    """包装标准输出，下游关闭管道时以 _PipeClosed 结束转换"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        try:
+            self.stream.write(text)
+        except BrokenPipeError:
+            raise _PipeClosed()
+
+
+def _encoding(name):
+    """argparse 的类型检查：编码名称必须有效"""
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        raise argparse.ArgumentTypeError(f"未知的编码: {name}")
+
+
+def _html_parser(name):
+    """argparse 的类型检查：第三方解析器需要已安装"""
+    module = HTML_PARSERS.get(name)
+    if module and importlib.util.find_spec(module) is None:
+        raise argparse.ArgumentTypeError(f"需要先安装 {module}（pip install {module}）")
+    return name
+
+
+def add_pipeline_parsers(subparsers):
+    """
+    注册 md2html 和 html2md 子命令
+
+    Args:
+        subparsers: argparse 的子命令集合
+    """
+    md_parser = subparsers.add_parser('md2html', help='从标准输入读取Markdown，把HTML写到标准输出')
+    md_parser.add_argument('--engine', choices=MD_ENGINES, default='markdown',
+                           help='转换引擎（默认：markdown；mistune 更快，但不生成标题id和代码高亮）')
+    md_parser.add_argument('--template', default='default',
+                           help="文档模板：'default'、'site' 或模板文件路径（默认：default）")
+    md_parser.add_argument('--fragment', action='store_true', help='只输出HTML片段，不套用文档模板')
+    md_parser.add_argument('--css', choices=CSS_MODES, default='inline', help='样式表内联或引用外部文件（默认：inline）')
+    md_parser.add_argument('--stylesheet', default=DEFAULT_STYLESHEET,
+                           help=f'--css external 时引用的样式表地址（默认：{DEFAULT_STYLESHEET}）')
+    md_parser.add_argument('--minify', action='store_true', help='输出压缩后的HTML')
+
+    html_parser = subparsers.add_parser('html2md', help='从标准输入读取HTML，把Markdown写到标准输出')
+    html_parser.add_argument('--engine', type=_html_parser, choices=tuple(HTML_PARSERS), default=None,
+                             help='HTML解析器，默认取配置中的 HTML_PARSER')
+
+    for parser in (md_parser, html_parser):
+        parser.add_argument('--encoding', type=_encoding, default=DEFAULT_ENCODING,
+                            help=f'标准输入的编码（默认：{DEFAULT_ENCODING}）')
+        parser.add_argument('--output-encoding', type=_encoding, default=DEFAULT_ENCODING,
+                            help=f'标准输出的编码（默认：{DEFAULT_ENCODING}）')
+
+
+def run_pipeline(args, config):
+    """
+    执行管道转换，返回进程退出码
+    两种解析器都需要完整的文档，输入一次读入；输出按文档模板的片段或Markdown的块逐段写出，
+    不额外拼接完整的结果
+
+    Args:
+        args: 解析后的命令行参数，args.command 为 PIPELINE_COMMANDS 之一
+        config (Config): 应用程序配置
+
+    Returns:
+        int: 0 表示成功，1 表示输入无法解码或转换失败
+    """
+    # 标准错误只显示警告和错误，避免被成千上万次调用的日志淹没；详细日志仍写入日志文件
+    set_log_levels('WARNING')
+    # 每个进程只转换一个文档，缓存没有命中的机会
+    MarkdownConverter.ir_cache.set_budget(0)
+
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding=args.encoding)
+    try:
+        content = stdin.read()
+    except UnicodeDecodeError as e:
+        log_error(f"无法按 {args.encoding} 解码标准输入: {str(e)}")
+        return 1
+    finally:
+        stdin.detach()
+
+    # HTML中无法用输出编码表示的字符写为字符引用，Markdown则直接报错
+    errors = 'xmlcharrefreplace' if args.command == 'md2html' else 'strict'
+    out = io.TextIOWrapper(sys.stdout.buffer, encoding=args.output_encoding, errors=errors, newline='\n')
+    writer = _PipeWriter(out)
+    try:
+        if args.command == 'md2html':
+            ok = MarkdownConverter.md_to_html_stream(
+                content, writer, template=None if args.fragment else args.template, css=args.css,
+                stylesheet_href=args.stylesheet, minify=args.minify, engine=args.engine
+            )
+        else:
+            if args.engine:
+                MarkdownConverter.html_parser = args.engine
+            ok = MarkdownConverter.html_to_md_stream(content, writer)
+        out.flush()
+    except (BrokenPipeError, _PipeClosed):
+        # 下游提前关闭（如 | head），丢弃剩余输出，避免退出时再次报错
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    finally:
+        out.detach()
+    log_debug(f"{args.command} 完成，输入 {len(content)} 字符")
+    return 0 if ok else 1
@@ -0,0 +1,114 @@
+import time
+import tkinter as tk
+from converter import PreviewToken
+from textdiff import common_affixes
+from metrics import counter, histogram
+from logger import log_debug
+
+_LIST_INDENT = 20
+
+# 性能指标：每次刷新预览控件的耗时和替换的片段数
+_SHOW_SECONDS = histogram('nextmd_preview_show_seconds', '刷新预览控件的耗时（秒）')
+_TOKENS_REPLACED = counter('nextmd_preview_tokens_replaced_total', '刷新预览时替换的片段数')
+
+
+class PreviewRenderer:
+    """
+    把预览片段序列显示到只读的Text控件中
+    刷新时与上一次显示的片段序列比较，只删除和插入发生变化的片段
+    """
+
+    def __init__(self, widget, font_family, font_size, code_font="Courier New"):
+        """
+        初始化预览渲染器并设置样式标签
+
+        Args:
+            widget (tk.Text): 预览用的Text控件
+            font_family (str): 正文字体
+            font_size (int): 正文字号
+            code_font (str): 代码和表格使用的等宽字体
+        """
+        self.widget = widget
+        self._tokens = []
+        self._configure_tags(font_family, font_size, code_font)
+
+    def _configure_tags(self, family, size, code_font):
+        """设置各样式标签对应的字体、缩进和背景"""
+        widget = self.widget
+        widget.tag_configure("p", spacing3=8)
+        for level in range(1, 7):
+            widget.tag_configure(
+                f"h{level}",
+                font=(family, size + max(10 - 2 * level, 0), "bold"),
+                foreground="#333333",
+                spacing1=10,
+                spacing3=6
+            )
+        for depth in range(1, 7):
+            widget.tag_configure(
+                f"list{depth}",
+                lmargin1=_LIST_INDENT * depth,
+                lmargin2=_LIST_INDENT * depth + 12,
+                spacing3=2
+            )
+        widget.tag_configure("quote", lmargin1=20, lmargin2=20, foreground="#666666")
+        widget.tag_configure(
+            "code_block",
+            font=(code_font, size - 1),
+            background="#f5f5f5",
+            lmargin1=10,
+            lmargin2=10,
+            spacing3=0
+        )
+        widget.tag_configure("table", font=(code_font, size - 1))
+        widget.tag_configure("table_header", font=(code_font, size - 1, "bold"), background="#f2f2f2")
+        widget.tag_configure("hr", foreground="#dddddd", spacing3=8)
+        widget.tag_configure("bold", font=(family, size, "bold"))
+        widget.tag_configure("italic", font=(family, size, "italic"))
+        widget.tag_configure("strike", overstrike=True)
+        widget.tag_configure("code", font=(code_font, size - 1), background="#f5f5f5", foreground="#c7254e")
+        widget.tag_configure("link", foreground="#0366d6", underline=True)
+        widget.tag_configure("error", foreground="#cc0000")
+
+    def show(self, tokens):
+        """
+        显示新的片段序列，只更新与上一次不同的部分
+
+        Args:
+            tokens (list): PreviewToken 列表
+        """
+        old = self._tokens
+        prefix, suffix = common_affixes(old, tokens)
+        if prefix == len(old) == len(tokens):
+            return
+
+        start = sum(len(token.text) for token in old[:prefix])
+        old_length = sum(len(token.text) for token in old[prefix:len(old) - suffix])
+        changed = tokens[prefix:len(tokens) - suffix]
+
+        widget = self.widget
+        started = time.perf_counter()
+        widget.config(state=tk.NORMAL)
+        try:
+            if old_length:
+                widget.delete(f"1.0 + {start} chars", f"1.0 + {start + old_length} chars")
+            if changed:
+                args = []
+                for token in changed:
+                    args.append(token.text)
+                    args.append(token.tags)
+                widget.insert(f"1.0 + {start} chars", *args)
+        finally:
+            widget.config(state=tk.DISABLED)
+        self._tokens = tokens
+        _SHOW_SECONDS.observe(time.perf_counter() - started)
+        _TOKENS_REPLACED.inc(len(changed))
+        log_debug(f"预览已更新: 替换 {len(old) - prefix - suffix} 个片段为 {len(changed)} 个")
+
+    def show_text(self, text):
+        """以纯文本显示内容，例如HTML文件的源码"""
+        self.show([PreviewToken(text, ())] if text else [])
+
+    def clear(self):
+        """清空预览"""
+        self.show([])
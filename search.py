@@ -0,0 +1,413 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter, defaultdict, namedtuple
+from logger import log_info, log_error, log_debug
+
+# 索引文件目录，与自动保存目录一样位于程序目录下
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.path.join(BASE_DIR, 'search_index')
+
+# 参与索引的文件类型
+INDEXED_EXTENSIONS = ('.md', '.markdown', '.html', '.htm')
+
+# 搜索结果：文件路径、得分、行号（从1开始）、列号、匹配长度、行内容
+SearchResult = namedtuple('SearchResult', ['path', 'score', 'line', 'column', 'length', 'snippet'])
+
+# 拉丁文字按单词切分，中日韩文字按相邻两字切分
+_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_WORD_RE = re.compile('[0-9A-Za-z_\u00c0-\u024f]+|[' + _CJK_CHARS + ']+')
+_CJK_RE = re.compile('[' + _CJK_CHARS + ']')
+_TAG_RE = re.compile(r'<[^>]*>')
+
+# 每批提交的文件数，查询最多等待一批文件的写入
+_BATCH_SIZE = 50
+_SNIPPET_LENGTH = 120
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    terms INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    lines BLOB NOT NULL,
+    PRIMARY KEY (term, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_file ON postings (file_id);
+"""
+
+
+def tokenize(text, query=False):
+    """
+    把文本切分为索引词
+    拉丁文字转为小写的单词；连续的中日韩文字切分为相邻两字的组合。
+    建立索引时每个字也单独作为一个词，查询时只有单个字才按单字查找
+
+    Args:
+        text (str): 文本
+        query (bool): 是否为查询文本
+
+    Returns:
+        list: 索引词列表
+    """
+    terms = []
+    for match in _WORD_RE.finditer(text):
+        word = match.group()
+        if _CJK_RE.match(word):
+            if len(word) == 1 or not query:
+                terms.extend(word)
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word.lower())
+    return terms
+
+
+def scan_workspace(root):
+    """
+    遍历工作区目录（跳过隐藏目录），返回其中所有Markdown和HTML文件
+
+    Args:
+        root (str): 工作区目录
+
+    Returns:
+        dict: 绝对路径 -> (修改时间, 大小)
+    """
+    found = {}
+    for directory, dirnames, filenames in os.walk(os.path.abspath(root)):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in INDEXED_EXTENSIONS:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (stat.st_mtime, stat.st_size)
+    return found
+
+
+class WorkspaceIndex:
+    """
+    工作区全文索引
+    倒排表保存在SQLite文件中：每个 (词, 文件) 记录词频和出现的行号，
+    更新时只重新索引修改时间或大小发生变化的文件
+    """
+
+    def __init__(self, root, index_path=None):
+        """
+        打开（或创建）工作区的索引
+
+        Args:
+            root (str): 工作区目录
+            index_path (str, optional): 索引文件路径，默认按工作区路径放在 INDEX_DIR 下
+        """
+        self.root = os.path.abspath(root)
+        if index_path is None:
+            digest = hashlib.blake2b(self.root.encode('utf-8'), digest_size=8).hexdigest()
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            index_path = os.path.join(INDEX_DIR, f"{digest}.sqlite")
+        self.index_path = index_path
+        # 索引在后台线程中更新，在Tk线程中查询，连接由锁保护
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        # 正在进行的后台更新数；关闭时仍有更新则由最后一个结束的更新关闭连接
+        self._active = 0
+        self._closing = threading.Event()
+        self._closed = False
+
+    def close(self):
+        """
+        关闭索引文件
+        后台更新仍在进行时只请求它们尽快停止，最后一个更新结束时再关闭，调用方无需等待
+        """
+        self._closing.set()
+        with self._lock:
+            if not self._active:
+                self._close_db()
+
+    def _close_db(self):
+        if not self._closed:
+            self._db.close()
+            self._closed = True
+
+    def _begin_update(self):
+        """登记一次后台更新，索引已关闭时返回False"""
+        with self._lock:
+            if self._closing.is_set():
+                return False
+            self._active += 1
+            return True
+
+    def _end_update(self):
+        with self._lock:
+            self._active -= 1
+            if self._closing.is_set() and not self._active:
+                self._close_db()
+
+    def scan(self):
+        """
+        遍历工作区，返回所有需要索引的文件
+
+        Returns:
+            dict: 绝对路径 -> (修改时间, 大小)
+        """
+        return scan_workspace(self.root)
+
+    def update(self, cancel=None):
+        """
+        增量更新索引：新增和修改的文件重新索引，已删除的文件从索引中移除
+
+        Args:
+            cancel (threading.Event, optional): 设置后尽快停止更新；关闭索引同样会停止更新
+
+        Returns:
+            tuple: (重新索引的文件数, 移除的文件数)
+        """
+        if not self._begin_update():
+            return 0, 0
+        try:
+            return self._update(cancel)
+        finally:
+            self._end_update()
+
+    def _update(self, cancel):
+        def cancelled():
+            return self._closing.is_set() or (cancel is not None and cancel.is_set())
+
+        found = self.scan()
+        if cancelled():
+            return 0, 0
+        with self._lock:
+            known = {
+                path: (file_id, mtime, size)
+                for file_id, path, mtime, size in self._db.execute('SELECT id, path, mtime, size FROM files')
+            }
+
+        removed = [known[path][0] for path in known if path not in found]
+        changed = [
+            path for path, (mtime, size) in found.items()
+            if path not in known or known[path][1:] != (mtime, size)
+        ]
+        if removed:
+            with self._lock, self._db:
+                for file_id in removed:
+                    self._delete_file(file_id)
+
+        indexed = 0
+        for start in range(0, len(changed), _BATCH_SIZE):
+            batch = []
+            for path in changed[start:start + _BATCH_SIZE]:
+                if cancelled():
+                    break
+                entry = self._read_postings(path)
+                if entry is not None:
+                    batch.append((path, found[path]) + entry)
+            if cancelled():
+                break
+            with self._lock, self._db:
+                for path, (mtime, size), total, postings in batch:
+                    self._store_file(path, mtime, size, total, postings)
+            indexed += len(batch)
+
+        if indexed or removed:
+            log_info(f"工作区索引已更新: {self.root}，重新索引 {indexed} 个文件，移除 {len(removed)} 个")
+        return indexed, len(removed)
+
+    def update_file(self, path):
+        """
+        重新索引单个文件，例如文件刚被保存；文件不在工作区内时忽略
+
+        Args:
+            path (str): 文件路径
+        """
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep):
+            return
+        if os.path.splitext(path)[1].lower() not in INDEXED_EXTENSIONS:
+            return
+        if not self._begin_update():
+            return
+        try:
+            stat = os.stat(path)
+            entry = self._read_postings(path)
+            if entry is not None and not self._closing.is_set():
+                with self._lock, self._db:
+                    self._store_file(path, stat.st_mtime, stat.st_size, *entry)
+        finally:
+            self._end_update()
+
+    @staticmethod
+    def _read_lines(path):
+        """读取文件的各行，HTML文件去掉标签（保持行号不变）"""
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        if os.path.splitext(path)[1].lower() in ('.html', '.htm'):
+            text = _TAG_RE.sub(lambda match: '\n' * match.group().count('\n'), text)
+        return text.split('\n')
+
+    @staticmethod
+    def _read_postings(path):
+        """
+        读取文件并统计每个词的词频和所在行
+
+        Returns:
+            tuple: (总词数, {词: (词频, 行号数组)})，读取失败时返回None
+        """
+        try:
+            lines = WorkspaceIndex._read_lines(path)
+        except OSError as e:
+            log_error(f"读取待索引文件失败: {path} - {str(e)}")
+            return None
+        counts = Counter()
+        term_lines = defaultdict(lambda: array('l'))
+        for number, line in enumerate(lines, 1):
+            terms = tokenize(line)
+            counts.update(terms)
+            for term in set(terms):
+                term_lines[term].append(number)
+        total = sum(counts.values())
+        return total, {term: (counts[term], term_lines[term]) for term in counts}
+
+    def _delete_file(self, file_id):
+        self._db.execute('DELETE FROM postings WHERE file_id = ?', (file_id,))
+        self._db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    def _store_file(self, path, mtime, size, total, postings):
+        """写入一个文件的倒排记录（调用方持有锁并处于事务中）"""
+        row = self._db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+        if row is not None:
+            self._delete_file(row[0])
+        cursor = self._db.execute(
+            'INSERT INTO files (path, mtime, size, terms) VALUES (?, ?, ?, ?)',
+            (path, mtime, size, total)
+        )
+        file_id = cursor.lastrowid
+        self._db.executemany(
+            'INSERT INTO postings (term, file_id, tf, lines) VALUES (?, ?, ?, ?)',
+            ((term, file_id, tf, lines.tobytes()) for term, (tf, lines) in postings.items())
+        )
+
+    def search(self, query, limit=50):
+        """
+        查询工作区，所有查询词都出现的文件才会返回
+
+        Args:
+            query (str): 查询文本
+            limit (int): 最多返回的结果数
+
+        Returns:
+            list: SearchResult 列表，按得分从高到低排列
+        """
+        terms = list(dict.fromkeys(tokenize(query, query=True)))
+        if not terms:
+            return []
+
+        with self._lock:
+            file_count, total_terms = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(terms), 0) FROM files'
+            ).fetchone()
+            if not file_count:
+                return []
+            average_length = total_terms / file_count or 1
+
+            # 先查询出现文件最少的词，尽早缩小候选集
+            postings = []
+            for term in terms:
+                rows = self._db.execute(
+                    'SELECT file_id, tf, lines FROM postings WHERE term = ?', (term,)
+                ).fetchall()
+                if not rows:
+                    return []
+                postings.append(rows)
+            postings.sort(key=len)
+
+            candidates = {file_id: [] for file_id, _, _ in postings[0]}
+            for rows in postings:
+                matched = {}
+                for file_id, tf, lines in rows:
+                    if file_id in candidates:
+                        matched[file_id] = candidates[file_id] + [(tf, lines, len(rows))]
+                candidates = matched
+                if not candidates:
+                    return []
+
+            files = {}
+            ids = list(candidates)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for file_id, path, length in self._db.execute(
+                        f'SELECT id, path, terms FROM files WHERE id IN ({placeholders})', chunk):
+                    files[file_id] = (path, length)
+
+        # BM25 打分
+        k1, b = 1.2, 0.75
+        scored = []
+        for file_id, matches in candidates.items():
+            path, length = files[file_id]
+            score = 0.0
+            for tf, _, df in matches:
+                idf = math.log(1 + (file_count - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+            scored.append((score, file_id))
+        scored.sort(reverse=True)
+
+        results = []
+        for score, file_id in scored[:limit]:
+            path = files[file_id][0]
+            line = self._best_line(candidates[file_id])
+            results.append(self._make_result(path, score, line, query, terms))
+        log_debug(f"工作区搜索 '{query}': {len(scored)} 个文件匹配")
+        return results
+
+    @staticmethod
+    def _best_line(matches):
+        """选出包含查询词最多的行，相同时取靠前的行"""
+        hits = Counter()
+        for _, lines, _ in matches:
+            hits.update(set(array('l', lines)))
+        return min(hits, key=lambda line: (-hits[line], line))
+
+    @staticmethod
+    def _make_result(path, score, line, query, terms):
+        """读取匹配行，生成结果和跳转位置"""
+        raw = ''
+        column, length = 0, 0
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for number, text in enumerate(f, 1):
+                    if number == line:
+                        raw = text.rstrip('\n')
+                        break
+        except OSError:
+            pass
+
+        # 跳转位置按原始行计算；优先定位完整的查询文本，其次是第一个查询词
+        lowered = raw.lower()
+        for needle in (query.strip().lower(), terms[0]):
+            position = lowered.find(needle)
+            if needle and position >= 0:
+                column, length = position, len(needle)
+                break
+
+        # 显示时去掉HTML标签，长行只保留匹配位置附近的内容
+        snippet = raw
+        if os.path.splitext(path)[1].lower() in ('.html', '.htm'):
+            snippet = _TAG_RE.sub('', raw)
+        display = snippet.strip()
+        if len(display) > _SNIPPET_LENGTH:
+            needle_at = max(display.lower().find(terms[0]), 0)
+            start = max(needle_at - _SNIPPET_LENGTH // 3, 0)
+            display = ('...' if start else '') + display[start:start + _SNIPPET_LENGTH] + '...'
+        return SearchResult(path, score, line, column, length, display)
@@ -0,0 +1,363 @@
+import hashlib
+import html
+import json
+import os
+import posixpath
+import re
+import shutil
+import time
+from collections import defaultdict, namedtuple
+from urllib.parse import urlsplit, urlunsplit, unquote
+from converter import MarkdownConverter
+from templates import get_template, write_stylesheet, DEFAULT_STYLESHEET
+from logger import log_info, log_error, log_warning, log_debug
+
+# 输出目录中的构建清单，记录每个页面的内容哈希和依赖
+MANIFEST_NAME = '.nextmd-build.json'
+
+# 清单格式或页面生成方式变化时递增，旧的输出整体重建
+_MANIFEST_VERSION = 1
+
+PAGE_EXTENSIONS = ('.md', '.markdown')
+
+# 构建结果：页面总数、重新渲染的页面数、重新生成的目录页数、复制的资源文件数、
+# 删除的输出文件数、各阶段耗时 [(阶段, 秒)]
+BuildReport = namedtuple('BuildReport', ['pages', 'rendered', 'indexes', 'assets', 'removed', 'timings'])
+
+_HREF_RE = re.compile(r'''(<a\b[^>]*?\bhref=)(["'])(.*?)\2''', re.I | re.S)
+
+
+def _hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def _output_name(rel_path):
+    """页面源文件的相对路径对应的输出路径"""
+    return posixpath.splitext(rel_path)[0] + '.html'
+
+
+def _relative_href(from_dir, target):
+    """从 from_dir 目录指向 target 的相对地址（均为站点内的相对路径）"""
+    return posixpath.relpath(target, from_dir or '.')
+
+
+def rewrite_links(body, page, pages):
+    """
+    把HTML片段中指向站点内Markdown页面的链接改为对应的 .html 页面
+
+    Args:
+        body (str): HTML片段
+        page (str): 当前页面的相对路径（以 / 分隔）
+        pages (set): 站点内所有页面的相对路径
+
+    Returns:
+        tuple: (改写后的HTML片段, 链接到的页面相对路径列表)
+        目标不存在的链接保持原样，仍然记录为依赖，目标出现后当前页面会被重建
+    """
+    depends = []
+    page_dir = posixpath.dirname(page)
+
+    def replace(match):
+        href = html.unescape(match.group(3))
+        parts = urlsplit(href)
+        if parts.scheme or parts.netloc or not parts.path:
+            return match.group(0)
+        extension = posixpath.splitext(parts.path)[1].lower()
+        if extension not in PAGE_EXTENSIONS:
+            return match.group(0)
+        path = unquote(parts.path)
+        if path.startswith('/'):
+            target = posixpath.normpath(path.lstrip('/'))
+        else:
+            target = posixpath.normpath(posixpath.join(page_dir, path))
+        depends.append(target)
+        if target not in pages:
+            log_warning(f"站点页面 {page} 链接到不存在的页面: {href}")
+            return match.group(0)
+        new_path = parts.path[:-len(extension)] + '.html'
+        new_href = urlunsplit(('', '', new_path, parts.query, parts.fragment))
+        return f'{match.group(1)}{match.group(2)}{html.escape(new_href)}{match.group(2)}'
+
+    return _HREF_RE.sub(replace, body), sorted(set(depends))
+
+
+class SiteBuilder:
+    """
+    增量静态站点构建
+    把源目录中的Markdown文件转换为输出目录中的HTML页面，并为每个目录生成索引页。
+    清单记录每个页面的内容哈希、标题和链接到的页面：只重新渲染内容变化的页面，
+    以及所链接页面新增或删除了的页面（链接改写结果随之变化）；目录索引页只在其列表变化时重新生成
+    """
+
+    def __init__(self, source_dir, output_dir, minify=False):
+        """
+        初始化构建器
+
+        Args:
+            source_dir (str): Markdown源目录
+            output_dir (str): HTML输出目录
+            minify (bool): 是否输出压缩后的HTML和样式表
+        """
+        self.source_dir = os.path.abspath(source_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.minify = minify
+        self.manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        self._timings = []
+        self._phase_start = None
+
+    def _phase(self, name=None):
+        """结束上一个阶段的计时并开始新的阶段"""
+        now = time.perf_counter()
+        if self._phase_start is not None:
+            self._timings.append((self._phase_start[0], now - self._phase_start[1]))
+        self._phase_start = (name, now) if name else None
+
+    def _options(self):
+        return {'version': _MANIFEST_VERSION, 'minify': self.minify}
+
+    def _load_manifest(self):
+        """读取上一次构建的清单，构建选项不同时视为没有清单"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log_error(f"读取构建清单失败: {self.manifest_path} - {str(e)}")
+            return None
+        if manifest.get('options') != self._options():
+            log_info("构建选项已变化，重新构建全部页面")
+            return None
+        return manifest
+
+    def _scan(self):
+        """
+        遍历源目录（跳过隐藏目录和输出目录）
+
+        Returns:
+            tuple: (页面相对路径列表, 资源文件相对路径列表)
+        """
+        pages, assets = [], []
+        for directory, dirnames, filenames in os.walk(self.source_dir):
+            dirnames[:] = sorted(
+                name for name in dirnames
+                if not name.startswith('.') and os.path.join(directory, name) != self.output_dir
+            )
+            rel_dir = os.path.relpath(directory, self.source_dir)
+            rel_dir = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/')
+            for name in sorted(filenames):
+                if name.startswith('.'):
+                    continue
+                rel_path = posixpath.join(rel_dir, name)
+                if os.path.splitext(name)[1].lower() in PAGE_EXTENSIONS:
+                    pages.append(rel_path)
+                else:
+                    assets.append(rel_path)
+        return pages, assets
+
+    def _source_path(self, rel_path):
+        return os.path.join(self.source_dir, *rel_path.split('/'))
+
+    def _output_path(self, rel_path):
+        return os.path.join(self.output_dir, *rel_path.split('/'))
+
+    def _write(self, rel_path, content):
+        path = self._output_path(rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def _breadcrumb(self, directory):
+        """目录及其各级上级目录的导航链接"""
+        parts = directory.split('/') if directory else []
+        up = '../' * len(parts)
+        items = [f'<a href="{up}index.html">首页</a>']
+        for depth, part in enumerate(parts, 1):
+            href = '../' * (len(parts) - depth) + 'index.html'
+            items.append(f'<a href="{href}">{html.escape(part)}</a>')
+        return ' / '.join(items)
+
+    def _render_page(self, template_for, page, body, title):
+        directory = posixpath.dirname(page)
+        compiled = template_for(directory)
+        return compiled.render(body, title=html.escape(title), nav=self._breadcrumb(directory))
+
+    def build(self, executor='process', max_workers=None, force=False):
+        """
+        构建站点
+
+        Args:
+            executor: 同 MarkdownConverter.convert_many
+            max_workers (int, optional): 并行工作数
+            force (bool): 忽略上一次的清单，重新构建全部页面
+
+        Returns:
+            BuildReport: 构建结果
+        """
+        self._timings = []
+        log_info(f"开始构建站点: {self.source_dir} -> {self.output_dir}")
+
+        self._phase('扫描')
+        pages, assets = self._scan()
+        page_set = set(pages)
+        manifest = None if force else self._load_manifest()
+        old_pages = manifest['pages'] if manifest else {}
+        old_indexes = manifest['indexes'] if manifest else {}
+        old_assets = manifest['assets'] if manifest else {}
+
+        self._phase('哈希')
+        hashes = {page: _hash_file(self._source_path(page)) for page in pages}
+
+        self._phase('计划')
+        # 新增或删除的页面会改变链接到它们的页面中的链接改写结果
+        appeared = page_set.symmetric_difference(old_pages)
+        dirty = []
+        for page in pages:
+            entry = old_pages.get(page)
+            if (entry is None or entry['hash'] != hashes[page]
+                    or not os.path.exists(self._output_path(_output_name(page)))
+                    or appeared.intersection(entry['depends'])):
+                dirty.append(page)
+        log_debug(f"站点页面 {len(pages)} 个，需要重新渲染 {len(dirty)} 个")
+
+        self._phase('渲染')
+        os.makedirs(self.output_dir, exist_ok=True)
+        templates = {}
+
+        def template_for(directory):
+            if directory not in templates:
+                href = _relative_href(directory, DEFAULT_STYLESHEET)
+                templates[directory] = get_template('site', 'external', href, self.minify)
+            return templates[directory]
+
+        new_pages = {page: old_pages[page] for page in pages if page not in dirty}
+        contents = (self._read_page(page) for page in dirty)
+        for index, (body, headings) in MarkdownConverter.convert_many(
+                contents, mode='md_to_fragment', executor=executor,
+                max_workers=max_workers, ordered=False):
+            page = dirty[index]
+            body, depends = rewrite_links(body, page, page_set)
+            title = headings[0].text if headings else posixpath.splitext(posixpath.basename(page))[0]
+            self._write(_output_name(page), self._render_page(template_for, page, body, title))
+            new_pages[page] = {'hash': hashes[page], 'title': title, 'depends': depends}
+
+        self._phase('索引')
+        new_indexes, index_count = self._build_indexes(pages, new_pages, old_indexes, template_for)
+        write_stylesheet(self.output_dir, minify=self.minify, site=True)
+
+        self._phase('资源')
+        new_assets, asset_count = self._copy_assets(assets, old_assets)
+
+        self._phase('清理')
+        # 同一个输出文件可能在页面和目录索引页之间转换（新增或删除了 index.md）
+        live = {_output_name(page) for page in pages}
+        live.update(new_indexes, new_assets)
+        stale = {_output_name(page) for page in old_pages}
+        stale.update(old_indexes, old_assets)
+        removed = 0
+        for rel_path in sorted(stale - live):
+            path = self._output_path(rel_path)
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+
+        manifest = {
+            'options': self._options(),
+            'pages': new_pages,
+            'indexes': new_indexes,
+            'assets': new_assets,
+        }
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+        self._phase()
+
+        report = BuildReport(len(pages), len(dirty), index_count, asset_count, removed, self._timings)
+        summary = '，'.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self._timings)
+        log_info(f"站点构建完成: 页面 {len(pages)} 个，重新渲染 {len(dirty)} 个，"
+                 f"目录页 {index_count} 个，资源 {asset_count} 个，删除 {removed} 个；{summary}")
+        return report
+
+    def _read_page(self, page):
+        with open(self._source_path(page), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _build_indexes(self, pages, page_info, old_indexes, template_for):
+        """
+        为每个没有 index.md 的目录生成索引页，列出子目录和页面标题
+
+        Returns:
+            tuple: (索引页相对路径 -> 列表签名, 重新生成的索引页数)
+        """
+        children = defaultdict(set)
+        for page in pages:
+            parts = page.split('/')
+            for depth in range(len(parts) - 1):
+                children['/'.join(parts[:depth])].add(('dir', parts[depth]))
+            children['/'.join(parts[:-1])].add(('page', page))
+        children.setdefault('', set())
+
+        indexes = {}
+        count = 0
+        for directory, entries in children.items():
+            if any(posixpath.basename(posixpath.splitext(name)[0]) == 'index'
+                   for kind, name in entries if kind == 'page'):
+                continue
+            items = []
+            for kind, name in sorted(entries):
+                if kind == 'dir':
+                    items.append((f"{name}/index.html", f"{name}/"))
+                else:
+                    href = posixpath.basename(_output_name(name))
+                    items.append((href, page_info[name]['title']))
+            rel_path = posixpath.join(directory, 'index.html')
+            signature = hashlib.blake2b(
+                json.dumps(items, ensure_ascii=False).encode('utf-8'), digest_size=16
+            ).hexdigest()
+            indexes[rel_path] = signature
+            if old_indexes.get(rel_path) == signature and os.path.exists(self._output_path(rel_path)):
+                continue
+            title = directory or '首页'
+            listing = '\n'.join(
+                f'<li><a href="{html.escape(href)}">{html.escape(text)}</a></li>' for href, text in items
+            )
+            body = f'<h1>{html.escape(title)}</h1>\n<ul class="site-index">\n{listing}\n</ul>'
+            compiled = template_for(directory)
+            self._write(rel_path, compiled.render(body, title=html.escape(title), nav=self._breadcrumb(directory)))
+            count += 1
+        return indexes, count
+
+    def _copy_assets(self, assets, old_assets):
+        """
+        复制图片等非Markdown文件，大小和修改时间都未变化的文件跳过
+
+        Returns:
+            tuple: (资源相对路径 -> [修改时间, 大小], 复制的文件数)
+        """
+        copied = {}
+        count = 0
+        for asset in assets:
+            source = self._source_path(asset)
+            stat = os.stat(source)
+            signature = [stat.st_mtime, stat.st_size]
+            copied[asset] = signature
+            target = self._output_path(asset)
+            if old_assets.get(asset) == signature and os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            count += 1
+        return copied, count
+
+
+def build_site(source_dir, output_dir, executor='process', max_workers=None, minify=False, force=False):
+    """
+    构建静态站点，参数含义见 SiteBuilder 和 SiteBuilder.build
+
+    Returns:
+        BuildReport: 构建结果
+    """
+    builder = SiteBuilder(source_dir, output_dir, minify=minify)
+    return builder.build(executor=executor, max_workers=max_workers, force=force)
@@ -0,0 +1,245 @@
+"""
+NextMD 长时间运行测试：内存增长与吞吐量漂移
+
+用法:
+    python soak.py [--duration 秒] [--interval 秒] [--warmup 秒]
+                   [--max-growth-mb N] [--max-rss-growth-mb N] [--max-drift 比例] [--top N]
+
+循环执行 md_to_html、html_to_md 和 convert_file（两个方向），定期采样 tracemalloc 与 RSS，
+结束时报告内存增长最多的分配位置（按代码行和按模块汇总）以及各时段的吞吐量；
+增长或吞吐量下降超过阈值时以非零退出码结束。
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from benchmark import sample_markdown, sample_table
+from converter import MarkdownConverter
+from logger import set_log_levels
+
+# 报告分配位置时忽略的文件
+_IGNORED_FILES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>',
+                  '<frozen importlib._bootstrap_external>', '<unknown>')
+
+
+def read_rss():
+    """
+    当前进程的常驻内存（字节）
+    Linux 读取 /proc/self/statm；其他类Unix系统只能取得峰值；不支持时返回None
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def build_corpus(directory):
+    """
+    生成混合语料：大小不同的Markdown文档、表格密集的HTML和中英文混排文本，
+    并为 convert_file 写出输入文件
+
+    Returns:
+        list: (操作名, 可调用对象) 列表
+    """
+    small_md = sample_markdown(3)
+    large_md = sample_markdown(40)
+    cjk_md = '\n\n'.join(f"## 第{i}章\n\n中文段落，包含**强调**、`代码`和[链接](p{i}.md)。" * 3 for i in range(40))
+    article_html = MarkdownConverter.md_to_html(large_md)
+    table_html = sample_table(150, 5, nested_every=50)
+
+    md_path = os.path.join(directory, 'input.md')
+    html_path = os.path.join(directory, 'input.html')
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(large_md)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(article_html)
+    md_out = os.path.join(directory, 'out.html')
+    html_out = os.path.join(directory, 'out.md')
+
+    return [
+        ('md_to_html 小文档', lambda: MarkdownConverter.md_to_html(small_md)),
+        ('md_to_html 大文档', lambda: MarkdownConverter.md_to_html(large_md)),
+        ('md_to_html 中文', lambda: MarkdownConverter.md_to_html(cjk_md)),
+        ('html_to_md 文章', lambda: MarkdownConverter.html_to_md(article_html)),
+        ('html_to_md 表格', lambda: MarkdownConverter.html_to_md(table_html)),
+        ('convert_file md->html', lambda: MarkdownConverter.convert_file(md_path, md_out)),
+        ('convert_file html->md', lambda: MarkdownConverter.convert_file(html_path, html_out)),
+    ]
+
+
+def _module_of(filename):
+    """把分配所在的文件归到模块：site-packages 下取包名，其余取文件名"""
+    parts = filename.replace('\\', '/').split('/')
+    for marker in ('site-packages', 'dist-packages'):
+        if marker in parts:
+            index = parts.index(marker)
+            if index + 1 < len(parts):
+                return parts[index + 1].split('.')[0]
+    if len(parts) >= 2 and parts[-2] in ('logging', 'json', 'html', 'xml', 'email'):
+        return parts[-2]
+    return os.path.splitext(parts[-1])[0]
+
+
+def _filtered(snapshot):
+    return snapshot.filter_traces([tracemalloc.Filter(False, name) for name in _IGNORED_FILES])
+
+
+def _slope(points):
+    """最小二乘斜率，points 为 (x, y) 列表"""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if not denominator:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+
+def soak(duration=600.0, interval=30.0, warmup=30.0, max_growth_mb=16.0, max_rss_growth_mb=64.0,
+         max_drift=0.25, top=15, frames=1):
+    """
+    执行长时间运行测试
+
+    Args:
+        duration (float): 预热之后的测试时长（秒）
+        interval (float): 采样间隔（秒）
+        warmup (float): 预热时长（秒），期间的缓存填充和模块加载不计入增长
+        max_growth_mb (float): tracemalloc 跟踪内存允许的增长（MB）
+        max_rss_growth_mb (float): RSS 允许的增长（MB）
+        max_drift (float): 最后一个时段的吞吐量允许比第一个时段下降的比例
+        top (int): 报告的分配位置数
+        frames (int): tracemalloc 记录的调用栈深度
+
+    Returns:
+        bool: 是否通过
+    """
+    # 控制台只显示警告，避免每次 convert_file 的日志淹没报告；日志文件照常写入
+    set_log_levels(console_level='WARNING')
+    # 语料反复转换，IR缓存命中后不再解析；关闭缓存，使每次操作都经过完整的解析
+    MarkdownConverter.ir_cache.set_budget(0)
+    tracemalloc.start(frames)
+    with tempfile.TemporaryDirectory() as directory:
+        operations = build_corpus(directory)
+        counts = defaultdict(int)
+        seconds = defaultdict(float)
+
+        def run_for(length):
+            """轮流执行各操作直到时间用完，返回完成的操作数"""
+            done = 0
+            deadline = time.perf_counter() + length
+            while time.perf_counter() < deadline:
+                for name, operation in operations:
+                    start = time.perf_counter()
+                    operation()
+                    seconds[name] += time.perf_counter() - start
+                    counts[name] += 1
+                    done += 1
+            return done
+
+        print(f"预热 {warmup:g}s ...")
+        run_for(warmup)
+        gc.collect()
+        baseline = _filtered(tracemalloc.take_snapshot())
+        base_traced = tracemalloc.get_traced_memory()[0]
+        base_rss = read_rss()
+        counts.clear()
+        seconds.clear()
+
+        print(f"{'时间(s)':>8}{'操作/秒':>10}{'跟踪内存(MB)':>14}{'RSS(MB)':>10}")
+        samples = []        # (经过秒数, 操作/秒, 跟踪内存, RSS)
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            window = min(interval, duration - (time.perf_counter() - started))
+            window_start = time.perf_counter()
+            done = run_for(window)
+            rate = done / (time.perf_counter() - window_start)
+            gc.collect()
+            traced = tracemalloc.get_traced_memory()[0]
+            rss = read_rss()
+            elapsed = time.perf_counter() - started
+            samples.append((elapsed, rate, traced, rss))
+            rss_text = f"{rss / 1048576:>10.1f}" if rss is not None else f"{'-':>10}"
+            print(f"{elapsed:>8.0f}{rate:>10.1f}{traced / 1048576:>14.2f}{rss_text}")
+
+        final = _filtered(tracemalloc.take_snapshot())
+        tracemalloc.stop()
+
+    print(f"\n各操作平均耗时:")
+    for name, _ in operations:
+        if counts[name]:
+            print(f"  {name:<24}{counts[name]:>8} 次  {seconds[name] / counts[name] * 1000:>9.2f} ms")
+
+    print(f"\n内存增长最多的位置（与预热结束时相比）:")
+    for stat in final.compare_to(baseline, 'lineno')[:top]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        print(f"  {stat.size_diff / 1024:>+10.1f} KB  {stat.count_diff:>+7} 块  {frame.filename}:{frame.lineno}")
+
+    by_module = defaultdict(int)
+    for stat in final.compare_to(baseline, 'filename'):
+        by_module[_module_of(stat.traceback[0].filename)] += stat.size_diff
+    print(f"\n按模块汇总的内存增长:")
+    for module, diff in sorted(by_module.items(), key=lambda item: -item[1])[:top]:
+        if diff:
+            print(f"  {diff / 1024:>+10.1f} KB  {module}")
+
+    failures = []
+    if samples:
+        traced_growth = samples[-1][2] - base_traced
+        slope = _slope([(elapsed, traced) for elapsed, _, traced, _ in samples])
+        print(f"\n跟踪内存增长: {traced_growth / 1048576:+.2f} MB，趋势 {slope * 60 / 1024:+.1f} KB/分钟")
+        if traced_growth > max_growth_mb * 1048576:
+            failures.append(f"跟踪内存增长 {traced_growth / 1048576:.2f} MB 超过阈值 {max_growth_mb:g} MB")
+        if base_rss is not None and samples[-1][3] is not None:
+            rss_growth = samples[-1][3] - base_rss
+            print(f"RSS增长: {rss_growth / 1048576:+.2f} MB")
+            if rss_growth > max_rss_growth_mb * 1048576:
+                failures.append(f"RSS增长 {rss_growth / 1048576:.2f} MB 超过阈值 {max_rss_growth_mb:g} MB")
+        first_rate, last_rate = samples[0][1], samples[-1][1]
+        drift = 1 - last_rate / first_rate if first_rate else 0.0
+        print(f"吞吐量: 第一个时段 {first_rate:.1f} 操作/秒，最后一个时段 {last_rate:.1f} 操作/秒（下降 {drift:.1%}）")
+        if len(samples) > 1 and drift > max_drift:
+            failures.append(f"吞吐量下降 {drift:.1%} 超过阈值 {max_drift:.0%}")
+
+    if failures:
+        print("\n未通过:")
+        for failure in failures:
+            print(f"  {failure}")
+        return False
+    print("\n通过")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NextMD 长时间运行测试（内存增长与吞吐量漂移）')
+    parser.add_argument('--duration', type=float, default=600, help='测试时长（秒，不含预热）')
+    parser.add_argument('--interval', type=float, default=30, help='采样间隔（秒）')
+    parser.add_argument('--warmup', type=float, default=30, help='预热时长（秒）')
+    parser.add_argument('--max-growth-mb', type=float, default=16, help='tracemalloc 跟踪内存允许的增长（MB）')
+    parser.add_argument('--max-rss-growth-mb', type=float, default=64, help='RSS允许的增长（MB）')
+    parser.add_argument('--max-drift', type=float, default=0.25, help='吞吐量允许下降的比例')
+    parser.add_argument('--top', type=int, default=15, help='报告的分配位置数')
+    parser.add_argument('--frames', type=int, default=1, help='tracemalloc 记录的调用栈深度')
+    args = parser.parse_args()
+
+    passed = soak(args.duration, args.interval, args.warmup, args.max_growth_mb,
+                  args.max_rss_growth_mb, args.max_drift, args.top, args.frames)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
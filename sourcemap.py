@@ -0,0 +1,142 @@
+import sys
+from array import array
+from bisect import bisect_right
+
+# 查找块对应的源码行时，从上一个匹配位置向后最多搜索的行数
+DEFAULT_SEARCH_WINDOW = 500
+
+
+class SourceMap:
+    """
+    源码行号与预览输出偏移之间的映射
+    若干有序的整数数组一一对应，双向查询都是二分查找，位于两个锚点之间的位置按比例插值。
+    锚点同时记录预览中的行列位置，界面可以直接使用 "行.列" 索引，无需从文档开头计算字符偏移
+    """
+
+    __slots__ = ('lines', 'offsets', 'rows', 'cols')
+
+    def __init__(self, lines=None, offsets=None, rows=None, cols=None):
+        """
+        初始化映射
+
+        Args:
+            lines (array): 源码行号（从1开始），单调递增
+            offsets (array): 对应的预览字符偏移，单调递增
+            rows (array): 对应的预览行号（从1开始）
+            cols (array): 对应的预览列号（从0开始）
+        """
+        self.lines = lines if lines is not None else array('l')
+        self.offsets = offsets if offsets is not None else array('l')
+        self.rows = rows if rows is not None else array('l')
+        self.cols = cols if cols is not None else array('l')
+
+    @staticmethod
+    def build(source, marks, window=DEFAULT_SEARCH_WINDOW):
+        """
+        根据渲染时记录的块起点建立映射
+        每个块起点带有一段出现在源码中的文本，按顺序在源码中向后查找，找不到的块被跳过
+
+        Args:
+            source (str): Markdown源码
+            marks (list): (关键文本, 预览偏移, 预览行, 预览列) 列表，按预览偏移排列
+            window (int): 每个块最多向后搜索的行数
+
+        Returns:
+            SourceMap: 映射
+        """
+        source_lines = source.split('\n')
+        total = len(source_lines)
+        source_map = SourceMap()
+        lines, offsets = source_map.lines, source_map.offsets
+        cursor = 0
+        for key, offset, row, col in marks:
+            if not key:
+                continue
+            for i in range(cursor, min(cursor + window, total)):
+                if key in source_lines[i]:
+                    if not offsets or offset > offsets[-1]:
+                        lines.append(i + 1)
+                        offsets.append(offset)
+                        source_map.rows.append(row)
+                        source_map.cols.append(col)
+                    cursor = i + 1
+                    break
+        return source_map
+
+    @staticmethod
+    def _interpolate(keys, values, key):
+        """在有序数组keys中查找key，返回values中对应（插值后）的值"""
+        index = bisect_right(keys, key) - 1
+        if index < 0:
+            return values[0] if values else 0
+        if index + 1 >= len(keys):
+            return values[index]
+        k0, k1 = keys[index], keys[index + 1]
+        v0, v1 = values[index], values[index + 1]
+        return v0 + (v1 - v0) * (key - k0) // (k1 - k0)
+
+    def output_offset(self, line):
+        """
+        源码行对应的预览偏移
+
+        Args:
+            line (int): 源码行号（从1开始）
+
+        Returns:
+            int: 预览中的字符偏移
+        """
+        return self._interpolate(self.lines, self.offsets, line)
+
+    def source_line(self, offset):
+        """
+        预览偏移对应的源码行
+
+        Args:
+            offset (int): 预览中的字符偏移
+
+        Returns:
+            int: 源码行号（从1开始）
+        """
+        if not self.lines:
+            return 1
+        return self._interpolate(self.offsets, self.lines, offset)
+
+    def output_position(self, line):
+        """
+        源码行对应的预览位置，以最近的锚点加上插值出的字符数表示
+
+        Args:
+            line (int): 源码行号（从1开始）
+
+        Returns:
+            tuple: (预览行, 预览列, 锚点之后的字符数)
+        """
+        index = bisect_right(self.lines, line) - 1
+        if index < 0:
+            return 1, 0, 0
+        extra = self.output_offset(line) - self.offsets[index]
+        return self.rows[index], self.cols[index], extra
+
+    def anchor_before(self, row, col):
+        """
+        预览位置之前（含）最近的锚点
+
+        Args:
+            row (int): 预览行号（从1开始）
+            col (int): 预览列号
+
+        Returns:
+            int: 锚点下标，位置位于第一个锚点之前时返回-1
+        """
+        index = bisect_right(self.rows, row) - 1
+        while index >= 0 and self.rows[index] == row and self.cols[index] > col:
+            index -= 1
+        return index
+
+    @property
+    def nbytes(self):
+        """映射占用的字节数"""
+        return sum(sys.getsizeof(values) for values in (self.lines, self.offsets, self.rows, self.cols))
+
+    def __len__(self):
+        return len(self.lines)
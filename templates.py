@@ -0,0 +1,251 @@
+import html
+import os
+import re
+from logger import log_info, log_debug
+
+# 默认样式表，内联和外部引用两种模式共用
+DEFAULT_CSS = """body { font-family: Arial, sans-serif; line-height: 1.6; padding: 20px; max-width: 800px; margin: 0 auto; }
+h1, h2, h3, h4, h5, h6 { color: #333; }
+pre { background-color: #f5f5f5; padding: 10px; border-radius: 5px; overflow-x: auto; }
+code { font-family: 'Courier New', Courier, monospace; background-color: #f5f5f5; padding: 2px 4px; border-radius: 3px; }
+blockquote { border-left: 4px solid #ddd; padding-left: 16px; margin-left: 0; color: #666; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 1px solid #ddd; padding: 8px 12px; text-align: left; }
+th { background-color: #f2f2f2; }"""
+
+# 静态站点页面额外的样式，只用于站点模板和站点构建写出的共享样式表
+SITE_CSS = DEFAULT_CSS + """
+nav.site-nav { font-size: 0.9em; color: #666; border-bottom: 1px solid #ddd; padding-bottom: 8px; }"""
+
+DEFAULT_STYLESHEET = "nextmd.css"
+DEFAULT_TITLE = "Converted from Markdown"
+
+# 默认文档模板，{{name}} 为占位符
+DEFAULT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{{title}}</title>
+{{styles}}
+</head>
+<body>
+{{content}}
+</body>
+</html>"""
+
+# 静态站点页面模板，比默认模板多一个导航栏
+SITE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{{title}}</title>
+{{styles}}
+</head>
+<body>
+<nav class="site-nav">{{nav}}</nav>
+{{content}}
+</body>
+</html>"""
+
+# 内置模板名称，其余取值视为模板文件路径
+BUILTIN_TEMPLATES = {'default': DEFAULT_TEMPLATE, 'site': SITE_TEMPLATE}
+
+CSS_MODES = ('inline', 'external')
+
+_PLACEHOLDER_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# 压缩输出时需要原样保留的元素
+_PRESERVE_RE = re.compile(r'(<(pre|textarea|script)\b.*?</\2\s*>)', re.S | re.I)
+_BLOCK_TAGS = (
+    r'html|head|body|meta|title|style|link|div|p|h[1-6]|ul|ol|li|dl|dt|dd|'
+    r'table|thead|tbody|tfoot|tr|th|td|pre|blockquote|hr|br|section|article|nav'
+)
+_SPACE_BEFORE_BLOCK_RE = re.compile(r'\s+(?=</?(?:' + _BLOCK_TAGS + r')\b)', re.I)
+_SPACE_AFTER_BLOCK_RE = re.compile(r'(</?(?:' + _BLOCK_TAGS + r')\b[^>]*>)\s+', re.I)
+_SPACE_RUN_RE = re.compile(r'\s+')
+_CSS_PUNCT_RE = re.compile(r'\s*([{};:,])\s*')
+
+_template_cache = {}
+
+
+def minify_html(html_content):
+    """
+    去除HTML中的冗余空白
+    pre、textarea、script 元素的内容保持不变；块级标签前后的空白被删除，
+    其余连续空白折叠为一个空格
+
+    Args:
+        html_content (str): HTML内容
+
+    Returns:
+        str: 压缩后的HTML内容
+    """
+    parts = _PRESERVE_RE.split(html_content)
+    result = []
+    # split 结果依次为: 普通文本, 保留元素, 标签名, 普通文本, ...
+    for i in range(0, len(parts), 3):
+        text = parts[i]
+        text = _SPACE_BEFORE_BLOCK_RE.sub('', text)
+        text = _SPACE_AFTER_BLOCK_RE.sub(r'\1', text)
+        result.append(_SPACE_RUN_RE.sub(' ', text))
+        if i + 1 < len(parts):
+            result.append(parts[i + 1])
+    return ''.join(result)
+
+
+def minify_css(css):
+    """去除CSS中的冗余空白"""
+    css = _SPACE_RUN_RE.sub(' ', css)
+    return _CSS_PUNCT_RE.sub(r'\1', css).replace(';}', '}').strip()
+
+
+class HtmlTemplate:
+    """
+    预编译的HTML文档模板
+    编译时把模板拆分为静态片段和占位符，并代入文档无关的常量，
+    渲染时只需按顺序拼接
+    """
+
+    def __init__(self, source, minify=False, **constants):
+        """
+        编译模板
+
+        Args:
+            source (str): 模板文本，占位符写作 {{name}}
+            minify (bool): 是否压缩静态片段
+            **constants: 编译期即可确定的占位符取值
+        """
+        self.minify = minify
+        pieces = []
+        pos = 0
+        for match in _PLACEHOLDER_RE.finditer(source):
+            pieces.append(source[pos:match.start()])
+            name = match.group(1)
+            if name in constants:
+                pieces.append(str(constants[name]))
+            else:
+                pieces.append((name,))
+            pos = match.end()
+        pieces.append(source[pos:])
+
+        # 合并相邻的静态片段
+        self._pieces = []
+        for piece in pieces:
+            if isinstance(piece, str) and self._pieces and isinstance(self._pieces[-1], str):
+                self._pieces[-1] += piece
+            else:
+                self._pieces.append(piece)
+        if minify:
+            self._pieces = [
+                minify_html(piece) if isinstance(piece, str) else piece
+                for piece in self._pieces
+            ]
+        self.fields = tuple(piece[0] for piece in self._pieces if not isinstance(piece, str))
+
+    def render(self, content, title=DEFAULT_TITLE, **fields):
+        """
+        渲染完整的HTML文档
+
+        Args:
+            content (str): 文档主体HTML
+            title (str): 文档标题（需已转义）
+            **fields: 其余占位符的取值，未提供时使用空字符串
+
+        Returns:
+            str: 完整的HTML文档
+        """
+        if self.minify:
+            content = minify_html(content)
+        fields['content'] = content
+        fields['title'] = title
+        return ''.join(
+            piece if isinstance(piece, str) else fields.get(piece[0], '')
+            for piece in self._pieces
+        )
+
+    def write(self, out, content, title=DEFAULT_TITLE, **fields):
+        """
+        与 render 相同，但把各片段依次写入out，不在内存中拼接完整的文档
+
+        Args:
+            out: 任何带有 write(str) 方法的对象
+            content (str): 文档主体HTML
+            title (str): 文档标题（需已转义）
+            **fields: 其余占位符的取值，未提供时使用空字符串
+        """
+        if self.minify:
+            content = minify_html(content)
+        fields['content'] = content
+        fields['title'] = title
+        for piece in self._pieces:
+            out.write(piece if isinstance(piece, str) else fields.get(piece[0], ''))
+
+
+def _styles_block(css, stylesheet_href, minify, stylesheet=DEFAULT_CSS):
+    """生成 <head> 中的样式部分"""
+    if css == 'external':
+        return f'    <link rel="stylesheet" href="{html.escape(stylesheet_href)}">'
+    if minify:
+        return f'<style>{minify_css(stylesheet)}</style>'
+    indented = '\n'.join('        ' + line for line in stylesheet.split('\n'))
+    return f'    <style>\n{indented}\n    </style>'
+
+
+def get_template(template='default', css='inline', stylesheet_href=DEFAULT_STYLESHEET,
+                 minify=False):
+    """
+    获取编译好的模板，同一组参数只加载和编译一次
+
+    Args:
+        template (str): 内置模板名（'default'、'site'）或模板文件路径
+        css (str): 'inline' 内联样式表，'external' 引用外部共享样式表
+        stylesheet_href (str): 外部样式表的地址
+        minify (bool): 是否输出压缩后的HTML
+
+    Returns:
+        HtmlTemplate: 编译好的模板
+    """
+    if css not in CSS_MODES:
+        raise ValueError(f"不支持的样式表模式: {css}")
+
+    mtime = None
+    if template not in BUILTIN_TEMPLATES:
+        mtime = os.path.getmtime(template)
+    key = (template, mtime, css, stylesheet_href, minify)
+    compiled = _template_cache.get(key)
+    if compiled is None:
+        if template in BUILTIN_TEMPLATES:
+            source = BUILTIN_TEMPLATES[template]
+        else:
+            with open(template, 'r', encoding='utf-8') as f:
+                source = f.read()
+        compiled = HtmlTemplate(
+            source,
+            minify=minify,
+            styles=_styles_block(css, stylesheet_href, minify, SITE_CSS if template == 'site' else DEFAULT_CSS)
+        )
+        _template_cache[key] = compiled
+        log_debug(f"模板已编译: {template}, 样式表={css}, 压缩={minify}")
+    return compiled
+
+
+def write_stylesheet(directory, filename=DEFAULT_STYLESHEET, minify=False, site=False):
+    """
+    写出共享样式表文件，供 css='external' 模式的页面引用
+
+    Args:
+        directory (str): 输出目录
+        filename (str): 样式表文件名
+        minify (bool): 是否压缩样式表
+        site (bool): 是否包含静态站点页面的样式
+
+    Returns:
+        str: 样式表文件路径
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    with open(path, 'w', encoding='utf-8') as f:
+        stylesheet = SITE_CSS if site else DEFAULT_CSS
+        f.write(minify_css(stylesheet) if minify else stylesheet + '\n')
+    log_info(f"共享样式表已写出: {path}")
+    return path
@@ -0,0 +1,90 @@
+"""
+文本差异辅助函数
+用于在两个版本的文本（字符串或行列表）之间快速定位变化区间
+"""
+
+
+def common_prefix_length(a, b):
+    """
+    计算两个序列的公共前缀长度
+
+    采用倍增分块比较加二分定位，比较操作都在切片层面完成，
+    对长文本比逐元素循环快得多。
+
+    Args:
+        a: 字符串或列表
+        b: 字符串或列表
+
+    Returns:
+        int: 公共前缀长度
+    """
+    n = min(len(a), len(b))
+    lo, step = 0, 64
+    while lo < n:
+        hi = min(lo + step, n)
+        if a[lo:hi] != b[lo:hi]:
+            break
+        lo = hi
+        step <<= 1
+    else:
+        return n
+
+    # 不变式: a[:lo] == b[:lo] 且 a[lo:hi] != b[lo:hi]
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def common_suffix_length(a, b, limit=None):
+    """
+    计算两个序列的公共后缀长度
+
+    Args:
+        a: 字符串或列表
+        b: 字符串或列表
+        limit (int, optional): 后缀长度上限，用于避免与前缀重叠
+
+    Returns:
+        int: 公共后缀长度
+    """
+    len_a, len_b = len(a), len(b)
+    n = min(len_a, len_b)
+    if limit is not None:
+        n = min(n, limit)
+    lo, step = 0, 64
+    while lo < n:
+        hi = min(lo + step, n)
+        if a[len_a - hi:len_a - lo] != b[len_b - hi:len_b - lo]:
+            break
+        lo = hi
+        step <<= 1
+    else:
+        return n
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[len_a - mid:len_a - lo] == b[len_b - mid:len_b - lo]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def common_affixes(old, new):
+    """
+    计算新旧两个版本的公共前缀和公共后缀长度
+
+    Args:
+        old: 旧版本（字符串或列表）
+        new: 新版本（字符串或列表）
+
+    Returns:
+        tuple: (前缀长度, 后缀长度)，两者之和不超过较短序列的长度
+    """
+    prefix = common_prefix_length(old, new)
+    suffix = common_suffix_length(old, new, min(len(old), len(new)) - prefix)
+    return prefix, suffix
@@ -1,21 +1,44 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
+import queue
+import threading
+import time
 from converter import MarkdownConverter
+from outline import OutlineIndex
+from highlighter import Highlighter, HIGHLIGHT_TAGS
+from documents import DocumentTab, PreviewCache, RenderWorker, content_key, read_text, write_text
+from autosave import AutosaveManager
+from preview import PreviewRenderer
+from search import WorkspaceIndex
+from linkcheck import LinkGraph
+from dropqueue import DropJob, SUPPORTED_EXTENSIONS
+from undo import DEFAULT_UNDO_BUDGET, apply_hunks
+from config import DEFAULT_PREVIEW_DEBOUNCE_MS
+from metrics import REGISTRY, counter, histogram
 from logger import log_info, log_error, log_warning, log_debug
 
+# 性能指标：界面刷新循环中各步骤的耗时
+_HIGHLIGHT_SECONDS = histogram('nextmd_highlight_seconds', '语法高亮增量更新和绘制的耗时（秒）')
+_PREVIEW_LATENCY = histogram('nextmd_preview_latency_seconds', '从提交后台渲染到显示预览的耗时（秒）')
+_PREVIEW_DEFERRED = counter('nextmd_preview_deferred_total', '预览不可见时推迟的刷新次数')
+
+# 预览区宽度小于该值（像素）时视为已被分隔条折叠
+_PREVIEW_MIN_WIDTH = 20
+
 class MarkdownEditorUI:
     """
     Markdown编辑器的用户界面类
     提供直观的界面用于创建、编辑、保存Markdown文件，以及格式转换功能
     """
     
-    def __init__(self, root):
+    def __init__(self, root, config=None):
         """
         初始化编辑器界面
         
         Args:
             root: Tkinter的根窗口对象
+            config (Config, optional): 应用程序配置
         """
         try:
             self.root = root
@@ -25,7 +48,47 @@ class MarkdownEditorUI:
             # 设置中文字体支持
             self.font_family = "SimHei"  # 中文支持的字体
             self.font_size = 12
-            self.current_file = None
+            
+            # 多文档标签页，共享一个渲染线程和预览缓存
+            self.tabs = []
+            self.active_tab = None
+            self._tab_frames = {}
+            self.preview_cache = PreviewCache()
+            self.render_worker = RenderWorker(MarkdownConverter.md_to_preview)
+            self._preview_job = None
+            self._render_poll_job = None
+            self.preview_delay = DEFAULT_PREVIEW_DEBOUNCE_MS
+            self._render_started = {}   # 标签页ID -> (内容键, 提交渲染的时间)
+            # 预览不可见（折叠、最小化或窗口不在前台）时推迟刷新，重新可见时只刷新一次
+            self._preview_deferred = False
+            
+            # 当前预览的源码映射，用于编辑区与预览区的同步滚动
+            self.source_map = None
+            self._scroll_sync_job = None
+            self._scroll_sync_skip = None
+            
+            # 后台自动保存，编辑差异追加到日志中
+            self.autosave = AutosaveManager()
+            
+            # 文档大纲索引，随编辑增量更新
+            self.outline_index = OutlineIndex()
+            self._outline_job = None
+            
+            # 语法高亮，编辑后只重新分析变化的行，并且只绘制可见区域附近的行
+            self.highlighter = Highlighter()
+            self._highlight_job = None
+            self._paint_job = None
+            
+            # 撤销历史由各标签页自行管理，编辑器只保留上一次的内容用于计算差异
+            self.undo_budget = DEFAULT_UNDO_BUDGET
+            self._undo_baseline = ""
+            
+            # 工作区全文索引，首次使用工作区搜索时选择文件夹
+            self.workspace_index = None
+            
+            # 链接检查等批量任务的并行方式，None 表示CPU核数
+            self.batch_executor = 'process'
+            self.batch_workers = None
             
             log_info("初始化Markdown编辑器用户界面")
             
@@ -54,11 +117,41 @@ class MarkdownEditorUI:
             # 绑定事件
             self._bind_events()
             
+            # 打开第一个空白标签页
+            self._add_tab(DocumentTab())
+            
+            # 窗口显示后检查上次是否有未保存的内容
+            self.root.after_idle(self._restore_autosave_sessions)
+            
+            # 应用配置中的性能参数，配置重新加载后自动更新
+            if config is not None:
+                config.add_listener(self._apply_config)
+            
             log_info("用户界面初始化完成")
         except Exception as e:
             log_error(f"初始化用户界面失败: {str(e)}")
             messagebox.showerror("错误", f"初始化界面失败: {str(e)}")
     
+    def _apply_config(self, config, changed):
+        """
+        应用配置中与界面相关的性能参数
+        
+        Args:
+            config (Config): 应用程序配置
+            changed (set): 发生变化的配置项
+        """
+        if 'undo_memory_mb' in changed:
+            self.undo_budget = int(config.undo_memory_mb * 1024 * 1024)
+            for tab in self.tabs:
+                tab.undo_history.max_bytes = self.undo_budget
+        if 'preview_cache_mb' in changed:
+            self.preview_cache.set_budget(int(config.preview_cache_mb * 1024 * 1024))
+        if 'preview_debounce_ms' in changed:
+            self.preview_delay = config.preview_debounce_ms
+        self.batch_executor = config.executor
+        self.batch_workers = config.workers or None
+        log_debug(f"界面已应用配置: {', '.join(sorted(changed))}")
+    
     def _create_menu(self):
         """创建菜单栏"""
         try:
@@ -70,19 +163,30 @@ class MarkdownEditorUI:
             self.file_menu.add_command(label="打开", command=self.open_file, accelerator="Ctrl+O")
             self.file_menu.add_command(label="保存", command=self.save_file, accelerator="Ctrl+S")
             self.file_menu.add_command(label="另存为...", command=self.save_file_as, accelerator="Ctrl+Shift+S")
+            self.file_menu.add_command(label="关闭标签页", command=self.close_tab, accelerator="Ctrl+W")
             self.file_menu.add_separator()
-            self.file_menu.add_command(label="退出", command=self.root.quit, accelerator="Ctrl+Q")
+            self.file_menu.add_command(label="退出", command=self.quit_app, accelerator="Ctrl+Q")
             self.menu_bar.add_cascade(label="文件", menu=self.file_menu)
             
             # 编辑菜单
             self.edit_menu = tk.Menu(self.menu_bar, tearoff=0)
             self.edit_menu.add_command(label="撤销", command=self.undo, accelerator="Ctrl+Z")
             self.edit_menu.add_command(label="重做", command=self.redo, accelerator="Ctrl+Y")
+            self.edit_menu.add_command(label="撤销历史占用...", command=self.show_undo_memory)
             self.edit_menu.add_separator()
             self.edit_menu.add_command(label="查找...", command=self.find_text, accelerator="Ctrl+F")
             self.edit_menu.add_command(label="替换...", command=self.replace_text, accelerator="Ctrl+H")
+            self.edit_menu.add_command(label="在工作区中搜索...", command=self.search_workspace, accelerator="Ctrl+Shift+F")
+            self.edit_menu.add_command(label="检查工作区链接...", command=self.check_workspace_links)
             self.menu_bar.add_cascade(label="编辑", menu=self.edit_menu)
             
+            # 视图菜单
+            self.view_menu = tk.Menu(self.menu_bar, tearoff=0)
+            self.show_preview_var = tk.BooleanVar(value=True)
+            self.view_menu.add_checkbutton(label="预览区", variable=self.show_preview_var,
+                                           command=self.toggle_preview)
+            self.menu_bar.add_cascade(label="视图", menu=self.view_menu)
+            
             # 转换菜单
             self.convert_menu = tk.Menu(self.menu_bar, tearoff=0)
             self.convert_menu.add_command(label="Markdown转HTML", command=self.convert_md_to_html)
@@ -91,6 +195,7 @@ class MarkdownEditorUI:
             
             # 帮助菜单
             self.help_menu = tk.Menu(self.menu_bar, tearoff=0)
+            self.help_menu.add_command(label="性能统计...", command=self.show_metrics)
             self.help_menu.add_command(label="关于", command=self.show_about)
             self.menu_bar.add_cascade(label="帮助", menu=self.help_menu)
             
@@ -127,10 +232,17 @@ class MarkdownEditorUI:
     
     def _create_editor(self):
         """创建编辑区域"""
+        # 标签栏，每个标签页对应一个打开的文档
+        self.tab_bar = ttk.Notebook(self.main_frame)
+        self.tab_bar.pack(fill=tk.X)
+        
         # 创建一个分割窗口，左边是Markdown编辑，右边是HTML预览
         self.paned_window = ttk.PanedWindow(self.main_frame, orient=tk.HORIZONTAL)
         self.paned_window.pack(fill=tk.BOTH, expand=True)
         
+        # 最左边的文档大纲
+        self._create_outline_panel()
+        
         # 左边Markdown编辑区域
         self.md_frame = ttk.Frame(self.paned_window, width=500)
         self.paned_window.add(self.md_frame, weight=1)
@@ -143,16 +255,17 @@ class MarkdownEditorUI:
         self.md_scrollbar = ttk.Scrollbar(self.md_frame)
         self.md_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # 创建文本编辑区域，启用撤销功能
+        # 创建文本编辑区域，撤销历史由标签页的UndoHistory管理，不使用Tk内置的撤销栈
         self.text_editor = tk.Text(
             self.md_frame,
             wrap=tk.WORD,
-            undo=True,
+            undo=False,
             font=(self.font_family, self.font_size),
-            yscrollcommand=self.md_scrollbar.set
+            yscrollcommand=self._on_editor_scroll
         )
         self.text_editor.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.md_scrollbar.config(command=self.text_editor.yview)
+        self._configure_highlight_tags()
         
         # 右边HTML预览区域
         self.html_frame = ttk.Frame(self.paned_window, width=500)
@@ -170,13 +283,54 @@ class MarkdownEditorUI:
             self.html_frame,
             wrap=tk.WORD,
             font=(self.font_family, self.font_size),
-            yscrollcommand=self.html_scrollbar.set
+            yscrollcommand=self._on_preview_scroll
         )
         self.html_preview.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.html_scrollbar.config(command=self.html_preview.yview)
         
         # 设置预览区域为只读
         self.html_preview.config(state=tk.DISABLED)
+        
+        # 预览显示渲染后的效果，每次刷新只替换变化的片段
+        self.preview_renderer = PreviewRenderer(self.html_preview, self.font_family, self.font_size)
+    
+    def _create_outline_panel(self):
+        """创建文档大纲侧边栏"""
+        self.outline_frame = ttk.Frame(self.paned_window, width=180)
+        self.paned_window.add(self.outline_frame, weight=0)
+        
+        self.outline_label = ttk.Label(self.outline_frame, text="大纲")
+        self.outline_label.pack(anchor=tk.W, padx=5, pady=2)
+        
+        self.outline_scrollbar = ttk.Scrollbar(self.outline_frame)
+        self.outline_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.outline_list = tk.Listbox(
+            self.outline_frame,
+            activestyle=tk.NONE,
+            exportselection=False,
+            font=(self.font_family, self.font_size - 2),
+            yscrollcommand=self.outline_scrollbar.set
+        )
+        self.outline_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.outline_scrollbar.config(command=self.outline_list.yview)
+    
+    def _configure_highlight_tags(self):
+        """设置语法高亮的文本标签样式"""
+        bold = (self.font_family, self.font_size, "bold")
+        styles = {
+            "md_table": dict(foreground="#22863a"),
+            "md_heading": dict(foreground="#1f4e9a", font=bold),
+            "md_code_block": dict(foreground="#555555", background="#f5f5f5"),
+            "md_italic": dict(font=(self.font_family, self.font_size, "italic")),
+            "md_bold": dict(font=bold),
+            "md_link": dict(foreground="#0366d6", underline=True),
+            "md_code": dict(foreground="#c7254e", background="#f5f5f5"),
+        }
+        # 按HIGHLIGHT_TAGS的顺序创建，后创建的标签优先级更高
+        for tag in HIGHLIGHT_TAGS:
+            self.text_editor.tag_configure(tag, **styles[tag])
+        self.text_editor.tag_raise("sel")
     
     def _create_statusbar(self):
         """创建状态栏"""
@@ -202,7 +356,11 @@ class MarkdownEditorUI:
             log_warning(f"启用文件拖放功能失败: {str(e)}")
     
     def _on_drop(self, event):
-        """处理文件拖放事件"""
+        """
+        处理文件拖放事件
+        只拖入一个文件时直接打开；拖入多个文件或文件夹时，第一个文件在编辑器中打开，
+        其余文件由用户选择转换或在标签页中打开，在后台处理并显示进度
+        """
         try:
             # 获取拖入的文件路径
             file_paths = self.root.tk.splitlist(event.data)
@@ -210,47 +368,135 @@ class MarkdownEditorUI:
             if not file_paths:
                 return
             
-            # 只处理第一个文件
+            if len(file_paths) > 1 or os.path.isdir(file_paths[0]):
+                choice = messagebox.askyesnocancel(
+                    "拖入多个文件",
+                    "第一个文件将在编辑器中打开，其余文件如何处理？\n\n"
+                    "是：转换为另一种格式（Markdown转HTML，HTML转Markdown，保存在原文件旁）\n"
+                    "否：在标签页中打开\n"
+                    "取消：不处理"
+                )
+                if choice is None:
+                    return
+                self._start_drop_job(file_paths, 'convert' if choice else 'open')
+                return
+            
             file_path = file_paths[0]
             
             # 检查文件扩展名
             file_ext = os.path.splitext(file_path)[1].lower()
-            if file_ext not in ['.md', '.markdown', '.html', '.htm']:
+            if file_ext not in SUPPORTED_EXTENSIONS:
                 messagebox.showwarning("不支持的文件类型", "仅支持打开.md、.markdown、.html和.htm文件")
                 return
             
-            # 检查当前文件是否有未保存的更改
-            if self._check_unsaved_changes():
-                return
-            
             # 打开拖入的文件
-            with open(file_path, "r", encoding="utf-8") as file:
-                content = file.read()
-            
-            # 清空编辑区域并加载文件内容
-            self.text_editor.delete("1.0", tk.END)
-            self.text_editor.insert(tk.END, content)
+            content = read_text(file_path)
             
-            # 设置当前文件路径
-            self.current_file = file_path
-            self.root.title(f"NextMD - {os.path.basename(file_path)}")
-            
-            # 根据文件类型自动转换预览
-            if file_ext in [".md", ".markdown"]:
-                self._update_preview()
-            elif file_ext in [".html", ".htm"]:
-                # HTML文件直接显示内容
-                self.html_preview.config(state=tk.NORMAL)
-                self.html_preview.delete("1.0", tk.END)
-                self.html_preview.insert(tk.END, content)
-                self.html_preview.config(state=tk.DISABLED)
-            
-            # 更新状态栏
-            self._on_text_modified()
+            # 在标签页中打开
+            self._open_document(file_path, content)
             
         except Exception as e:
             messagebox.showerror("错误", f"打开拖入的文件失败: {str(e)}")
     
+    def _start_drop_job(self, paths, action):
+        """
+        在后台处理拖入的多个文件，并显示进度面板
+        面板每100毫秒分批取出结果，显示进度、吞吐量和出错的文件，可随时取消
+        
+        Args:
+            paths (tuple): 拖入的文件和文件夹路径
+            action (str): 其余文件的处理方式，'convert' 或 'open'
+        """
+        try:
+            job = DropJob(paths, action, executor=self.batch_executor, max_workers=self.batch_workers)
+            
+            dialog = tk.Toplevel(self.root)
+            dialog.title("转换拖入的文件" if action == 'convert' else "打开拖入的文件")
+            dialog.geometry("640x360")
+            dialog.transient(self.root)
+            
+            status_label = ttk.Label(dialog, anchor=tk.W, text="正在查找文件...")
+            status_label.pack(fill=tk.X, padx=5, pady=(5, 0))
+            progress = ttk.Progressbar(dialog, mode='indeterminate')
+            progress.pack(fill=tk.X, padx=5, pady=5)
+            progress.start(50)
+            
+            btn_frame = ttk.Frame(dialog)
+            btn_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+            ttk.Label(dialog, anchor=tk.W, text="出错或跳过的文件（双击打开）:").pack(fill=tk.X, padx=5)
+            list_frame = ttk.Frame(dialog)
+            list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            scrollbar = ttk.Scrollbar(list_frame)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            problem_list = tk.Listbox(list_frame, yscrollcommand=scrollbar.set, font=(self.font_family, 10))
+            problem_list.pack(fill=tk.BOTH, expand=True)
+            scrollbar.config(command=problem_list.yview)
+            problems = []
+            
+            def describe():
+                if job.total is None:
+                    return f"正在查找文件...  已处理 {job.processed} 个"
+                text = (f"{job.processed}/{job.total}  完成 {job.done}，跳过 {job.skipped}，出错 {job.failed}  "
+                        f"{job.throughput():.1f} 个/秒")
+                if job.finished:
+                    return ("已取消  " if job.cancelled else "全部完成  ") + text
+                return text
+            
+            def poll():
+                if not dialog.winfo_exists():
+                    return
+                for event in job.poll():
+                    if event.kind == 'first' or event.kind == 'open':
+                        self._open_dropped(event.path, event.detail, switch=event.kind == 'first')
+                    elif event.kind == 'total':
+                        progress.stop()
+                        progress.config(mode='determinate', maximum=max(event.detail, 1))
+                    elif event.kind in ('error', 'skipped'):
+                        problems.append(event.path)
+                        name = event.path or "（全部）"
+                        prefix = "跳过" if event.kind == 'skipped' else "出错"
+                        problem_list.insert(tk.END, f"{prefix}  {name}  {event.detail}")
+                if job.total is not None:
+                    progress.config(value=job.processed)
+                status_label.config(text=describe())
+                if job.finished and job.events.empty():
+                    cancel_button.config(state=tk.DISABLED)
+                    return
+                dialog.after(100, poll)
+            
+            def open_problem(event=None):
+                selection = problem_list.curselection()
+                if selection and problems[selection[0]]:
+                    path = problems[selection[0]]
+                    if os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS:
+                        self._open_location(path, 1)
+            
+            def close():
+                job.cancel()
+                dialog.destroy()
+            
+            problem_list.bind("\u003cDouble-Button-1\u003e", open_problem)
+            problem_list.bind("\u003cReturn\u003e", open_problem)
+            cancel_button = ttk.Button(btn_frame, text="取消", command=job.cancel)
+            cancel_button.pack(side=tk.LEFT, padx=5)
+            ttk.Button(btn_frame, text="关闭", command=close).pack(side=tk.RIGHT, padx=5)
+            dialog.protocol("WM_DELETE_WINDOW", close)
+            
+            poll()
+        except Exception as e:
+            log_error(f"处理拖入的文件失败: {str(e)}")
+            messagebox.showerror("错误", f"处理拖入的文件失败: {str(e)}")
+    
+    def _open_dropped(self, path, content, switch):
+        """打开拖入的文件；批量打开的其余文件在后台标签页中打开，不切换过去"""
+        if switch:
+            self._open_document(path, content)
+            return
+        for tab in self.tabs:
+            if tab.path and os.path.abspath(tab.path) == os.path.abspath(path):
+                return
+        self._add_background_tab(DocumentTab(path, content))
+    
     def _bind_events(self):
         """绑定事件"""
         # 绑定快捷键
@@ -258,14 +504,34 @@ class MarkdownEditorUI:
         self.root.bind("\u003cControl-o\u003e", lambda event: self.open_file())
         self.root.bind("\u003cControl-s\u003e", lambda event: self.save_file())
         self.root.bind("\u003cControl-Shift-S\u003e", lambda event: self.save_file_as())
-        self.root.bind("\u003cControl-q\u003e", lambda event: self.root.quit())
+        self.root.bind("\u003cControl-q\u003e", lambda event: self.quit_app())
+        self.root.bind("\u003cControl-w\u003e", lambda event: self.close_tab())
         self.root.bind("\u003cControl-z\u003e", lambda event: self.undo())
         self.root.bind("\u003cControl-y\u003e", lambda event: self.redo())
+        self.text_editor.bind("<<Undo>>", lambda event: self.undo())
+        self.text_editor.bind("<<Redo>>", lambda event: self.redo())
         self.root.bind("\u003cControl-f\u003e", lambda event: self.find_text())
         self.root.bind("\u003cControl-h\u003e", lambda event: self.replace_text())
+        self.root.bind("\u003cControl-Shift-F\u003e", lambda event: self.search_workspace())
+        
+        # 关闭窗口时检查所有标签页的未保存更改
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
         
         # 当编辑内容变化时更新状态栏
         self.text_editor.bind("<<Modified>>", self._on_text_modified)
+        
+        # 切换标签页
+        self.tab_bar.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        
+        # 大纲跳转，以及光标移动时同步高亮当前所在章节
+        self.outline_list.bind("<<ListboxSelect>>", self._on_outline_select)
+        self.text_editor.bind("<KeyRelease>", self._sync_outline_selection, add="+")
+        self.text_editor.bind("<ButtonRelease-1>", self._sync_outline_selection, add="+")
+        
+        # 预览重新可见时补上推迟的刷新：窗口还原、重新获得焦点、拖动分隔条展开预览区
+        self.root.bind("<Map>", self._resume_preview, add="+")
+        self.root.bind("<FocusIn>", self._resume_preview, add="+")
+        self.html_frame.bind("<Configure>", self._resume_preview, add="+")
     
     def _on_text_modified(self, event=None):
         """当文本内容变化时更新状态栏"""
@@ -280,29 +546,380 @@ class MarkdownEditorUI:
         
         # 重新设置修改标志，以便下次变化时再次触发
         self.text_editor.edit_modified(False)
+        
+        # 与上次保存的内容比较，更新标签页的未保存标记
+        tab = self.active_tab
+        if tab is not None:
+            # 记录与上一次内容的差异，作为撤销历史
+            text = content[:-1]
+            if text != self._undo_baseline:
+                tab.undo_history.record(self._undo_baseline, text)
+                self._undo_baseline = text
+            
+            modified = not tab.matches_saved(text)
+            if modified != tab.modified:
+                tab.modified = modified
+                self._refresh_tab_title(tab)
+                if not modified:
+                    self.autosave.discard(tab.tab_id)
+            if modified:
+                # 交给后台线程计算差异并追加到自动保存日志
+                self.autosave.record(tab.tab_id, tab.path, text)
+        
+        # 延迟刷新高亮、大纲和预览，连续输入时只刷新一次
+        self._schedule_highlight_update()
+        self._schedule_outline_update()
+        self._schedule_preview_update()
+    
+    def _schedule_highlight_update(self):
+        """安排一次延迟的语法高亮更新"""
+        if self._highlight_job is not None:
+            self.root.after_cancel(self._highlight_job)
+        self._highlight_job = self.root.after(50, self._refresh_highlight)
+    
+    def _refresh_highlight(self):
+        """增量更新行状态，然后重新绘制可见区域"""
+        self._highlight_job = None
+        try:
+            with _HIGHLIGHT_SECONDS.time():
+                self.highlighter.update(self.text_editor.get("1.0", "end-1c"))
+                self._paint_visible()
+        except Exception as e:
+            log_error(f"更新语法高亮失败: {str(e)}")
+    
+    def _on_editor_scroll(self, first, last):
+        """编辑器滚动时更新滚动条，并绘制新进入可见区域的行"""
+        self.md_scrollbar.set(first, last)
+        if self._paint_job is None:
+            self._paint_job = self.root.after_idle(self._paint_visible)
+        self._on_pane_scrolled("editor")
+    
+    def _on_preview_scroll(self, first, last):
+        """预览区滚动时更新滚动条，并同步编辑区"""
+        self.html_scrollbar.set(first, last)
+        self._on_pane_scrolled("preview")
+    
+    def _on_pane_scrolled(self, pane):
+        """某一侧滚动后安排同步另一侧；由同步本身引起的滚动被忽略"""
+        if self._scroll_sync_skip == pane:
+            self._scroll_sync_skip = None
+            return
+        if self._scroll_sync_job is None:
+            self._scroll_sync_job = self.root.after_idle(lambda: self._sync_scroll(pane))
+    
+    def _sync_scroll(self, source):
+        """
+        根据源码映射把另一侧滚动到对应位置，查询为二分查找
+        
+        Args:
+            source (str): 发生滚动的一侧，'editor' 或 'preview'
+        """
+        self._scroll_sync_job = None
+        source_map = self.source_map
+        if not source_map:
+            return
+        try:
+            if source == "editor":
+                line = int(self.text_editor.index("@0,0").split(".")[0])
+                row, col, extra = source_map.output_position(line)
+                target = self.html_preview.index(f"{row}.{col} + {extra} chars")
+                if self.html_preview.index("@0,0") != target:
+                    self._scroll_sync_skip = "preview"
+                    self.html_preview.yview(target)
+            else:
+                top = self.html_preview.index("@0,0")
+                row, col = map(int, top.split("."))
+                index = source_map.anchor_before(row, col)
+                if index < 0:
+                    line = 1
+                else:
+                    # 只统计最近的锚点到可见区域顶部之间的字符数
+                    anchor = f"{source_map.rows[index]}.{source_map.cols[index]}"
+                    counted = self.html_preview.count(anchor, top, "chars")
+                    chars = (counted[0] if isinstance(counted, tuple) else counted) or 0
+                    line = source_map.source_line(source_map.offsets[index] + chars)
+                if int(self.text_editor.index("@0,0").split(".")[0]) != line:
+                    self._scroll_sync_skip = "editor"
+                    self.text_editor.yview(f"{line}.0")
+        except Exception as e:
+            log_error(f"同步滚动失败: {str(e)}")
+    
+    def _paint_visible(self, margin=50):
+        """
+        为可见区域及上下若干行绘制高亮标签，已绘制过且未修改的行直接跳过
+        
+        Args:
+            margin (int): 可见区域之外额外绘制的行数
+        """
+        self._paint_job = None
+        if self._highlight_job is not None:
+            # 行状态尚未与编辑器内容同步，等待高亮更新后再绘制
+            return
+        editor = self.text_editor
+        first = int(editor.index("@0,0").split(".")[0])
+        last = int(editor.index(f"@0,{editor.winfo_height()}").split(".")[0])
+        lines = self.highlighter.take_unpainted(first - 1 - margin, last - 1 + margin)
+        if not lines:
+            return
+        
+        # 连续的行合并为一个区间，每个标签只调用一次tag_remove和tag_add
+        runs = []
+        for line, _ in lines:
+            if runs and runs[-1][1] == line:
+                runs[-1][1] = line + 1
+            else:
+                runs.append([line, line + 1])
+        ranges = {tag: [] for tag in HIGHLIGHT_TAGS}
+        for line, tokens in lines:
+            for tag, start, end in tokens:
+                ranges[tag].extend((f"{line + 1}.{start}", f"{line + 1}.{end}"))
+        for tag in HIGHLIGHT_TAGS:
+            for start, stop in runs:
+                editor.tag_remove(tag, f"{start + 1}.0", f"{stop}.end")
+            if ranges[tag]:
+                editor.tag_add(tag, *ranges[tag])
+    
+    def _schedule_outline_update(self):
+        """安排一次延迟的大纲刷新"""
+        if self._outline_job is not None:
+            self.root.after_cancel(self._outline_job)
+        self._outline_job = self.root.after(300, self._refresh_outline)
+    
+    def _refresh_outline(self):
+        """增量更新大纲索引，标题有变化时重建侧边栏列表"""
+        self._outline_job = None
+        try:
+            content = self.text_editor.get("1.0", "end-1c")
+            if self.outline_index.update(content):
+                self.outline_list.delete(0, tk.END)
+                for heading in self.outline_index.headings:
+                    self.outline_list.insert(tk.END, "  " * (heading.level - 1) + heading.text)
+                log_debug(f"大纲已更新，标题数: {len(self.outline_index)}")
+            self._sync_outline_selection()
+        except Exception as e:
+            log_error(f"更新大纲失败: {str(e)}")
+    
+    def _on_outline_select(self, event=None):
+        """点击大纲条目时跳转到对应标题"""
+        try:
+            selection = self.outline_list.curselection()
+            if not selection:
+                return
+            
+            line = self.outline_index.line_of(selection[0])
+            self.text_editor.mark_set(tk.INSERT, f"{line}.0")
+            self.text_editor.see(f"{line}.0")
+            self.text_editor.focus_set()
+        except Exception as e:
+            log_error(f"跳转到标题失败: {str(e)}")
+    
+    def _sync_outline_selection(self, event=None):
+        """根据光标所在行高亮大纲中的当前章节"""
+        line = int(self.text_editor.index(tk.INSERT).split('.')[0])
+        index = self.outline_index.heading_at(line)
+        self.outline_list.selection_clear(0, tk.END)
+        if index >= 0:
+            self.outline_list.selection_set(index)
+            self.outline_list.see(index)
+    
+    @property
+    def current_file(self):
+        """当前标签页的文件路径"""
+        return self.active_tab.path if self.active_tab else None
+    
+    @current_file.setter
+    def current_file(self, path):
+        self.active_tab.path = path
+        self._refresh_tab_title(self.active_tab)
+    
+    def _add_tab(self, tab):
+        """添加标签页并切换过去"""
+        self._add_background_tab(tab)
+        self._switch_to_tab(tab)
+    
+    def _add_background_tab(self, tab):
+        """添加标签页但不切换过去，文档内容保留在标签页中，切换时再加载到编辑器"""
+        frame = ttk.Frame(self.tab_bar, height=0)
+        self._tab_frames[tab.tab_id] = frame
+        self.tabs.append(tab)
+        tab.undo_history.max_bytes = self.undo_budget
+        self.tab_bar.add(frame, text=tab.title)
+        log_debug(f"打开标签页: {tab.title}，共 {len(self.tabs)} 个")
+    
+    def _open_document(self, file_path, content):
+        """
+        在标签页中打开文档
+        已打开的文件直接切换过去，当前为空白新文档时复用该标签页
+        """
+        for tab in self.tabs:
+            if tab.path and os.path.abspath(tab.path) == os.path.abspath(file_path):
+                self._switch_to_tab(tab)
+                return
+        
+        self._place_tab(DocumentTab(file_path, content))
+    
+    def _place_tab(self, tab):
+        """显示新的标签页，当前为空白新文档时替换该标签页"""
+        active = self.active_tab
+        if active is not None and active.is_blank and not self.text_editor.get("1.0", "end-1c"):
+            # 用新文档替换空白标签页
+            index = self.tabs.index(active)
+            self._add_tab(tab)
+            self._remove_tab(active)
+            self.tabs.insert(index, self.tabs.pop())
+            self.tab_bar.insert(index, self._tab_frames[tab.tab_id])
+        else:
+            self._add_tab(tab)
+    
+    def _restore_autosave_sessions(self):
+        """启动时在后台读取上次异常退出前未保存的文档，读取完成后询问是否恢复"""
+        results = queue.Queue()
+        self.autosave.find_sessions(results)
+        
+        def wait():
+            try:
+                sessions = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, wait)
+                return
+            if sessions:
+                self._offer_autosave_sessions(sessions)
+        
+        self.root.after(100, wait)
+    
+    def _offer_autosave_sessions(self, sessions):
+        """
+        询问是否恢复遗留的会话，无论是否恢复都删除会话文件
+        
+        Args:
+            sessions (list): (会话ID, 文件路径, 文本内容) 列表
+        """
+        try:
+            restore = messagebox.askyesno(
+                "恢复未保存的内容",
+                f"发现 {len(sessions)} 个上次未保存的文档，是否恢复?"
+            )
+            for session_id, path, text in sessions:
+                if restore:
+                    tab = DocumentTab(path, text)
+                    # 与磁盘上的文件比较，决定恢复的内容是否为未保存状态
+                    saved = ""
+                    if path and os.path.exists(path):
+                        saved = read_text(path)
+                    tab.mark_saved(saved)
+                    tab.modified = not tab.matches_saved(text)
+                    self._place_tab(tab)
+                    log_info(f"已恢复未保存的文档: {path or '未命名'}")
+                self.autosave.remove_session(session_id)
+        except Exception as e:
+            log_error(f"恢复未保存的文档失败: {str(e)}")
+            messagebox.showerror("错误", f"恢复未保存的文档失败: {str(e)}")
+    
+    def _stash_active_tab(self):
+        """保存当前标签页的源文本和视图位置，预览只保留缓存键"""
+        tab = self.active_tab
+        tab.source = self.text_editor.get("1.0", "end-1c")
+        tab.insert_index = self.text_editor.index(tk.INSERT)
+        tab.yview = self.text_editor.yview()[0]
+        self.render_worker.cancel(tab.tab_id)
+        tab.pending_key = None
+    
+    def _switch_to_tab(self, tab):
+        """切换到指定标签页，最近渲染过的预览直接从缓存显示"""
+        if tab is self.active_tab:
+            return
+        if self.active_tab is not None:
+            self._stash_active_tab()
+        self.active_tab = tab
+        
+        frame = self._tab_frames[tab.tab_id]
+        if self.tab_bar.select() != str(frame):
+            self.tab_bar.select(frame)
+        
+        # 加载源文本，活动标签页的内容只由编辑器持有
+        self.text_editor.delete("1.0", tk.END)
+        self.text_editor.insert(tk.END, tab.source)
+        self._undo_baseline = tab.source
+        self.highlighter.reset(tab.source)
+        self.text_editor.mark_set(tk.INSERT, tab.insert_index)
+        self.text_editor.yview_moveto(tab.yview)
+        tab.source = None
+        
+        self.root.title(f"NextMD - {os.path.basename(tab.path)}" if tab.path else "NextMD - Markdown编辑器")
+        
+        # 显示预览：最近渲染过的内容直接从缓存显示，否则清空后交给后台渲染
+        self.preview_renderer.clear()
+        self.source_map = None
+        self._update_preview()
+        
+        # 更新状态栏
+        self._on_text_modified()
+    
+    def _on_tab_changed(self, event=None):
+        """用户点击标签栏切换标签页"""
+        try:
+            selected = self.tab_bar.select()
+            for tab in self.tabs:
+                if str(self._tab_frames[tab.tab_id]) == selected:
+                    self._switch_to_tab(tab)
+                    break
+        except Exception as e:
+            log_error(f"切换标签页失败: {str(e)}")
+    
+    def _refresh_tab_title(self, tab):
+        """刷新标签栏上的标题"""
+        frame = self._tab_frames.get(tab.tab_id)
+        if frame is not None:
+            self.tab_bar.tab(frame, text=tab.title)
+    
+    def _remove_tab(self, tab):
+        """从标签栏移除标签页"""
+        self.render_worker.cancel(tab.tab_id)
+        self.tabs.remove(tab)
+        frame = self._tab_frames.pop(tab.tab_id)
+        self.tab_bar.forget(frame)
+        frame.destroy()
+    
+    def close_tab(self):
+        """关闭当前标签页"""
+        try:
+            tab = self.active_tab
+            if tab is None or self._check_unsaved_changes(tab):
+                return
+            log_info(f"关闭标签页: {tab.title}")
+            
+            index = self.tabs.index(tab)
+            self.active_tab = None
+            self._remove_tab(tab)
+            self.autosave.discard(tab.tab_id)
+            if not self.tabs:
+                self._add_tab(DocumentTab())
+            else:
+                self._switch_to_tab(self.tabs[min(index, len(self.tabs) - 1)])
+        except Exception as e:
+            log_error(f"关闭标签页失败: {str(e)}")
+            messagebox.showerror("错误", f"关闭标签页失败: {str(e)}")
+    
+    def quit_app(self):
+        """退出程序，逐个检查标签页的未保存更改"""
+        try:
+            for tab in list(self.tabs):
+                if self._check_unsaved_changes(tab):
+                    return
+            self.render_worker.stop()
+            # 用户已逐个确认过未保存的更改，正常退出时不保留自动保存内容
+            self.autosave.stop(discard_all=True)
+        except Exception as e:
+            log_error(f"退出检查失败: {str(e)}")
+        self.root.quit()
     
     def new_file(self):
         """新建文件"""
         try:
             log_info("执行新建文件操作")
             
-            # 检查当前文件是否有未保存的更改
-            if self._check_unsaved_changes():
-                log_debug("用户取消新建文件操作")
-                return
-            
-            # 清空编辑区域
-            self.text_editor.delete("1.0", tk.END)
-            self.html_preview.config(state=tk.NORMAL)
-            self.html_preview.delete("1.0", tk.END)
-            self.html_preview.config(state=tk.DISABLED)
-            
-            # 重置当前文件路径
-            self.current_file = None
-            self.root.title("NextMD - Markdown编辑器")
-            
-            # 更新状态栏
-            self._on_text_modified()
+            # 在新标签页中打开空白文档
+            self._add_tab(DocumentTab())
             
             log_debug("新建文件完成")
         except Exception as e:
@@ -314,11 +931,6 @@ class MarkdownEditorUI:
         try:
             log_info("执行打开文件操作")
             
-            # 检查当前文件是否有未保存的更改
-            if self._check_unsaved_changes():
-                log_debug("用户取消打开文件操作")
-                return
-            
             # 打开文件对话框
             file_path = filedialog.askopenfilename(
                 defaultextension=".md",
@@ -344,30 +956,10 @@ class MarkdownEditorUI:
                         if not messagebox.askyesno("警告", "文件较大，可能会影响性能。是否继续打开？"):
                             return
                     
-                    with open(file_path, "r", encoding="utf-8") as file:
-                        content = file.read()
-                    
-                    # 清空编辑区域并加载文件内容
-                    self.text_editor.delete("1.0", tk.END)
-                    self.text_editor.insert(tk.END, content)
+                    content = read_text(file_path)
                     
-                    # 设置当前文件路径
-                    self.current_file = file_path
-                    self.root.title(f"NextMD - {os.path.basename(file_path)}")
-                    
-                    # 根据文件类型自动转换预览
-                    file_ext = os.path.splitext(file_path)[1].lower()
-                    if file_ext in [".md", ".markdown"]:
-                        self._update_preview()
-                    elif file_ext in [".html", ".htm"]:
-                        # HTML文件直接显示内容
-                        self.html_preview.config(state=tk.NORMAL)
-                        self.html_preview.delete("1.0", tk.END)
-                        self.html_preview.insert(tk.END, content)
-                        self.html_preview.config(state=tk.DISABLED)
-                    
-                    # 更新状态栏
-                    self._on_text_modified()
+                    # 在标签页中打开
+                    self._open_document(file_path, content)
                     
                     log_info(f"成功打开文件: {file_path}")
                 except UnicodeDecodeError:
@@ -399,8 +991,14 @@ class MarkdownEditorUI:
                         os.makedirs(directory)
                         log_debug(f"创建目录: {directory}")
                     
-                    with open(self.current_file, "w", encoding="utf-8") as file:
-                        file.write(content)
+                    write_text(self.current_file, content)
+                    
+                    # 记录已保存的内容，用于判断之后是否有未保存的更改
+                    self.active_tab.mark_saved(content[:-1])
+                    self.active_tab.modified = False
+                    self._refresh_tab_title(self.active_tab)
+                    self.autosave.discard(self.active_tab.tab_id)
+                    self._reindex_file(self.current_file)
                     
                     log_info(f"成功保存文件: {self.current_file}")
                     messagebox.showinfo("成功", "文件已保存")
@@ -440,15 +1038,26 @@ class MarkdownEditorUI:
             log_error(f"另存为操作失败: {str(e)}")
             messagebox.showerror("错误", f"另存为操作失败: {str(e)}")
     
-    def _check_unsaved_changes(self):
-        """检查是否有未保存的更改"""
+    def _check_unsaved_changes(self, tab=None):
+        """
+        检查标签页是否有未保存的更改，有则询问是否保存
+        
+        Args:
+            tab (DocumentTab, optional): 要检查的标签页，默认为当前标签页
+            
+        Returns:
+            bool: 用户是否取消了操作
+        """
         try:
+            tab = tab or self.active_tab
             log_debug("检查未保存的更改")
+            if tab is None or not tab.modified:
+                return False
             
-            # 这里简化处理，实际应用中应该检查文本是否被修改
+            file_name = os.path.basename(tab.path) if tab.path else "未命名"
             response = messagebox.askyesnocancel(
                 "未保存的更改", 
-                "当前文件有未保存的更改，是否保存?"
+                f"文件 {file_name} 有未保存的更改，是否保存?"
             )
             
             if response is None:  # 用户点击取消
@@ -456,7 +1065,10 @@ class MarkdownEditorUI:
                 return True
             elif response:  # 用户点击是
                 log_debug("用户选择保存未保存的更改")
+                self._switch_to_tab(tab)
                 self.save_file()
+                # 保存失败或取消了另存为时，视为取消操作
+                return tab.modified
             
             return False
         except Exception as e:
@@ -464,27 +1076,130 @@ class MarkdownEditorUI:
             return False
     
     def _update_preview(self):
-        """更新HTML预览"""
+        """更新HTML预览，Markdown交给共享的后台渲染线程转换"""
         try:
+            self._preview_job = None
+            tab = self.active_tab
+            if tab is None:
+                return
+            if not self._preview_visible():
+                self._defer_preview()
+                return
+            self._preview_deferred = False
             log_debug("更新HTML预览")
             
-            # 获取Markdown内容并转换为HTML
-            md_content = self.text_editor.get("1.0", tk.END)
-            log_debug(f"转换Markdown内容到HTML，长度: {len(md_content)} 字符")
-            
-            html_content = MarkdownConverter.md_to_html(md_content)
-            
-            # 更新预览区域
-            self.html_preview.config(state=tk.NORMAL)
-            self.html_preview.delete("1.0", tk.END)
-            self.html_preview.insert(tk.END, html_content)
-            self.html_preview.config(state=tk.DISABLED)
+            content = self.text_editor.get("1.0", "end-1c")
+            if not tab.is_markdown:
+                # HTML文件直接显示源码
+                self.preview_renderer.show_text(content)
+                self.source_map = None
+                return
             
-            log_debug("HTML预览更新成功")
+            # 命中缓存时直接显示，否则提交后台渲染
+            key = content_key(content)
+            tab.cache_key = key
+            preview = self.preview_cache.get(key)
+            if preview is not None:
+                self._show_preview(preview)
+                log_debug("HTML预览命中缓存")
+            elif key != tab.pending_key:
+                log_debug(f"提交Markdown渲染，长度: {len(content)} 字符")
+                tab.pending_key = key
+                self._render_started[tab.tab_id] = (key, time.perf_counter())
+                self.render_worker.submit(tab.tab_id, key, content)
+                self._start_render_polling()
         except Exception as e:
             log_error(f"更新HTML预览失败: {str(e)}")
             messagebox.showerror("转换错误", f"Markdown转HTML失败: {str(e)}")
     
+    def _preview_visible(self):
+        """
+        预览是否可见：预览区未被隐藏或折叠，窗口未最小化，并且焦点在本程序的窗口中
+        
+        Returns:
+            bool: 可见时返回True
+        """
+        if not self.show_preview_var.get():
+            return False
+        if self.root.state() in ('iconic', 'withdrawn'):
+            return False
+        if not self.html_frame.winfo_ismapped() or self.html_frame.winfo_width() < _PREVIEW_MIN_WIDTH:
+            return False
+        try:
+            return self.root.focus_displayof() is not None
+        except KeyError:
+            # 焦点在Tk内部的弹出窗口（如下拉列表）中
+            return True
+    
+    def _defer_preview(self):
+        """记录一次推迟的刷新，多次推迟在预览重新可见时合并为一次"""
+        if not self._preview_deferred:
+            self._preview_deferred = True
+            log_debug("预览不可见，推迟刷新")
+        _PREVIEW_DEFERRED.inc()
+    
+    def _resume_preview(self, event=None):
+        """预览重新可见时补上推迟的刷新"""
+        if self._preview_deferred and self._preview_job is None and self._preview_visible():
+            log_debug("预览重新可见，刷新推迟的预览")
+            self._update_preview()
+    
+    def toggle_preview(self):
+        """显示或隐藏预览区，隐藏期间不渲染预览"""
+        try:
+            panes = [str(pane) for pane in self.paned_window.panes()]
+            if self.show_preview_var.get():
+                if str(self.html_frame) not in panes:
+                    self.paned_window.add(self.html_frame, weight=1)
+                self._resume_preview()
+            elif str(self.html_frame) in panes:
+                self.paned_window.forget(self.html_frame)
+        except Exception as e:
+            log_error(f"切换预览区失败: {str(e)}")
+    
+    def _schedule_preview_update(self):
+        """安排一次延迟的预览刷新"""
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+        self._preview_job = self.root.after(self.preview_delay, self._update_preview)
+    
+    def _show_preview(self, preview):
+        """显示渲染结果 (片段列表, 源码映射)，并按编辑区的位置对齐预览"""
+        tokens, self.source_map = preview
+        self.preview_renderer.show(tokens)
+        self._sync_scroll("editor")
+    
+    def _start_render_polling(self):
+        """在有后台渲染任务时轮询结果"""
+        if self._render_poll_job is None:
+            self._render_poll_job = self.root.after(30, self._poll_render_results)
+    
+    def _poll_render_results(self):
+        """取回后台渲染结果，写入缓存并刷新当前标签页的预览"""
+        self._render_poll_job = None
+        try:
+            for tab_id, key, preview in self.render_worker.poll():
+                started = self._render_started.get(tab_id)
+                if started is not None and started[0] == key:
+                    del self._render_started[tab_id]
+                    _PREVIEW_LATENCY.observe(time.perf_counter() - started[1])
+                self.preview_cache.put(key, preview)
+                for tab in self.tabs:
+                    if tab.tab_id == tab_id and tab.pending_key == key:
+                        tab.pending_key = None
+                tab = self.active_tab
+                if tab is not None and tab.tab_id == tab_id and tab.cache_key == key:
+                    if self._preview_visible():
+                        self._show_preview(preview)
+                        log_debug("预览更新成功")
+                    else:
+                        # 结果已在缓存中，重新可见时直接显示
+                        self._defer_preview()
+        except Exception as e:
+            log_error(f"获取渲染结果失败: {str(e)}")
+        if self.render_worker.has_work():
+            self._start_render_polling()
+    
     def convert_md_to_html(self):
         """将当前Markdown内容转换为HTML并保存"""
         try:
@@ -518,8 +1233,7 @@ class MarkdownEditorUI:
                     
                     # 转换并保存
                     html_content = MarkdownConverter.md_to_html(md_content)
-                    with open(file_path, "w", encoding="utf-8") as file:
-                        file.write(html_content)
+                    write_text(file_path, html_content)
                     
                     log_info(f"成功保存HTML文件: {file_path}")
                     messagebox.showinfo("成功", f"HTML文件已保存至: {file_path}")
@@ -561,8 +1275,7 @@ class MarkdownEditorUI:
                             return
                     
                     # 读取HTML内容
-                    with open(file_path, "r", encoding="utf-8") as file:
-                        html_content = file.read()
+                    html_content = read_text(file_path)
                     
                     log_debug(f"读取HTML内容完成，长度: {len(html_content)} 字符")
                     
@@ -586,20 +1299,14 @@ class MarkdownEditorUI:
                             os.makedirs(directory)
                             log_debug(f"创建目录: {directory}")
                         
-                        with open(save_path, "w", encoding="utf-8") as file:
-                            file.write(md_content)
+                        write_text(save_path, md_content)
                         
                         log_info(f"成功保存Markdown文件: {save_path}")
                         
                         # 询问是否在编辑器中打开
                         if messagebox.askyesno("完成", f"转换完成，是否在编辑器中打开?"):
                             log_debug("用户选择在编辑器中打开转换后的文件")
-                            self.new_file()  # 先清空当前内容
-                            self.text_editor.insert(tk.END, md_content)
-                            self.current_file = save_path
-                            self.root.title(f"NextMD - {os.path.basename(save_path)}")
-                            self._update_preview()
-                            self._on_text_modified()
+                            self._open_document(save_path, md_content)
                     else:
                         log_debug("用户取消保存Markdown文件")
                 except UnicodeDecodeError:
@@ -622,27 +1329,68 @@ class MarkdownEditorUI:
         """撤销操作"""
         try:
             log_debug("执行撤销操作")
-            self.text_editor.edit_undo()
+            hunks = self.active_tab.undo_history.undo()
+            if hunks is None:
+                log_debug("没有可撤销的操作")
+                return "break"
+            self._apply_hunks(hunks)
             log_debug("撤销操作成功")
-        except tk.TclError:
-            # 没有可撤销的操作
-            log_debug("没有可撤销的操作")
-            pass
         except Exception as e:
             log_error(f"撤销操作失败: {str(e)}")
+        return "break"
     
     def redo(self):
         """重做操作"""
         try:
             log_debug("执行重做操作")
-            self.text_editor.edit_redo()
+            hunks = self.active_tab.undo_history.redo()
+            if hunks is None:
+                log_debug("没有可重做的操作")
+                return "break"
+            self._apply_hunks(hunks)
             log_debug("重做操作成功")
-        except tk.TclError:
-            # 没有可重做的操作
-            log_debug("没有可重做的操作")
-            pass
         except Exception as e:
             log_error(f"重做操作失败: {str(e)}")
+        return "break"
+    
+    def _apply_hunks(self, hunks):
+        """
+        把撤销/重做片段应用到编辑器，只修改变化的部分
+        
+        Args:
+            hunks (list): (起始偏移, 旧文本, 新文本) 列表，按偏移升序排列
+        """
+        # 从后往前应用，前面片段的偏移不受影响
+        for start, old, new in reversed(hunks):
+            start_index = f"1.0 + {start} chars"
+            if old:
+                self.text_editor.delete(start_index, f"1.0 + {start + len(old)} chars")
+            if new:
+                self.text_editor.insert(start_index, new)
+        start, old, new = hunks[0]
+        self.text_editor.mark_set(tk.INSERT, f"1.0 + {start + len(new)} chars")
+        self.text_editor.see(tk.INSERT)
+        # 更新差异基准，随后的<<Modified>>事件不会把这次修改记录为新的编辑
+        self._undo_baseline = self.text_editor.get("1.0", "end-1c")
+    
+    def show_undo_memory(self):
+        """显示撤销历史的内存占用"""
+        try:
+            lines = []
+            total = 0
+            for tab in self.tabs:
+                history = tab.undo_history
+                total += history.total_bytes
+                line = (f"{tab.title}: {history.undo_count} 步撤销 / {history.redo_count} 步重做，"
+                        f"{history.total_bytes / 1024:.1f} KB")
+                if history.evicted:
+                    line += f"（已丢弃最早的 {history.evicted} 步）"
+                lines.append(line)
+            lines.append("")
+            lines.append(f"合计: {total / 1024:.1f} KB，每个文档上限 {self.undo_budget / 1024 / 1024:g} MB")
+            messagebox.showinfo("撤销历史占用", "\n".join(lines))
+        except Exception as e:
+            log_error(f"显示撤销历史占用失败: {str(e)}")
     
     def find_text(self):
         """查找文本"""
@@ -840,31 +1588,29 @@ class MarkdownEditorUI:
                 
                 try:
                     # 获取全部文本
-                    content = self.text_editor.get("1.0", tk.END)
+                    content = self.text_editor.get("1.0", "end-1c")
                     log_debug(f"文档长度: {len(content)} 字符")
                     
-                    # 执行替换
-                    if case_var.get():
-                        new_content = content.replace(search_text, replace_text)
-                        count = content.count(search_text)
-                        log_debug(f"区分大小写替换完成，替换数量: {count}")
-                    else:
-                        # 不区分大小写的替换需要更复杂的处理
-                        import re
-                        flags = 0 if case_var.get() else re.IGNORECASE
-                        new_content = re.sub(re.escape(search_text), replace_text, content, flags=flags)
-                        count = len(re.findall(re.escape(search_text), content, flags=flags))
-                        log_debug(f"不区分大小写替换完成，替换数量: {count}")
-                    
-                    # 计算替换的次数
-                    if case_var.get():
-                        count = content.count(search_text)
-                    else:
-                        count = len(re.findall(re.escape(search_text), content, flags=flags))
+                    # 逐个记录匹配位置，撤销历史只保存被替换的片段
+                    import re
+                    flags = 0 if case_var.get() else re.IGNORECASE
+                    hunks = [
+                        (match.start(), match.group(), replace_text)
+                        for match in re.finditer(re.escape(search_text), content, flags=flags)
+                    ]
+                    count = len(hunks)
+                    log_debug(f"替换完成，替换数量: {count}")
                     
-                    # 更新文本
-                    self.text_editor.delete("1.0", tk.END)
-                    self.text_editor.insert(tk.END, new_content)
+                    if hunks:
+                        new_content = apply_hunks(content, hunks)
+                        self.active_tab.undo_history.record_hunks(hunks)
+                        self._undo_baseline = new_content
+                        
+                        # 只重写第一个到最后一个匹配之间的部分
+                        first = hunks[0][0]
+                        tail = len(content) - (hunks[-1][0] + len(hunks[-1][1]))
+                        self.text_editor.delete(f"1.0 + {first} chars", f"end-1c - {tail} chars")
+                        self.text_editor.insert(f"1.0 + {first} chars", new_content[first:len(new_content) - tail])
                     
                     messagebox.showinfo("替换", f"已完成 {count} 处替换")
                     log_info(f"全部替换完成，共替换 {count} 处")
@@ -886,6 +1632,307 @@ class MarkdownEditorUI:
             log_error(f"创建替换对话框失败: {str(e)}")
             messagebox.showerror("错误", f"打开替换对话框失败: {str(e)}")
     
+    def _choose_workspace(self):
+        """选择工作区文件夹并打开其索引"""
+        initial = os.path.dirname(self.current_file) if self.current_file else os.getcwd()
+        directory = filedialog.askdirectory(title="选择工作区文件夹", initialdir=initial)
+        if not directory:
+            return False
+        if self.workspace_index is not None:
+            self.workspace_index.close()
+        self.workspace_index = WorkspaceIndex(directory)
+        log_info(f"工作区: {directory}")
+        return True
+    
+    def _reindex_file(self, path):
+        """文件保存后在后台更新工作区索引"""
+        index = self.workspace_index
+        if index is None:
+            return
+        
+        def run():
+            try:
+                index.update_file(path)
+            except Exception as e:
+                log_error(f"更新工作区索引失败: {str(e)}")
+        
+        threading.Thread(target=run, name="WorkspaceIndex", daemon=True).start()
+    
+    def search_workspace(self):
+        """在工作区的所有Markdown和HTML文件中搜索"""
+        try:
+            log_info("执行工作区搜索操作")
+            if self.workspace_index is None and not self._choose_workspace():
+                return
+            
+            dialog = tk.Toplevel(self.root)
+            dialog.title("工作区搜索")
+            dialog.geometry("640x420")
+            dialog.transient(self.root)
+            
+            top_frame = ttk.Frame(dialog)
+            top_frame.pack(fill=tk.X, padx=5, pady=5)
+            ttk.Label(top_frame, text="搜索内容:").pack(side=tk.LEFT)
+            query_entry = ttk.Entry(top_frame)
+            query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+            query_entry.focus()
+            
+            status_label = ttk.Label(dialog, anchor=tk.W)
+            status_label.pack(fill=tk.X, padx=5)
+            
+            list_frame = ttk.Frame(dialog)
+            list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            scrollbar = ttk.Scrollbar(list_frame)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            result_list = tk.Listbox(list_frame, yscrollcommand=scrollbar.set, font=(self.font_family, 10))
+            result_list.pack(fill=tk.BOTH, expand=True)
+            scrollbar.config(command=result_list.yview)
+            results = []
+            
+            def refresh_index():
+                # 增量更新在后台线程进行，只重新索引修改过的文件
+                index = self.workspace_index
+                status_label.config(text=f"正在更新索引: {index.root}")
+                done = threading.Event()
+                
+                def run():
+                    try:
+                        index.update()
+                    except Exception as e:
+                        log_error(f"更新工作区索引失败: {str(e)}")
+                    done.set()
+                
+                def wait():
+                    # 更换了工作区时旧索引的更新已停止，状态由新的更新显示
+                    if not dialog.winfo_exists() or self.workspace_index is not index:
+                        return
+                    if done.is_set():
+                        status_label.config(text=f"工作区: {index.root}")
+                        if query_entry.get().strip():
+                            do_search()
+                    else:
+                        dialog.after(100, wait)
+                
+                threading.Thread(target=run, name="WorkspaceIndex", daemon=True).start()
+                wait()
+            
+            def do_search():
+                query = query_entry.get().strip()
+                if not query:
+                    return
+                try:
+                    found = self.workspace_index.search(query)
+                except Exception as e:
+                    log_error(f"工作区搜索失败: {str(e)}")
+                    messagebox.showerror("错误", f"搜索失败: {str(e)}", parent=dialog)
+                    return
+                results[:] = found
+                result_list.delete(0, tk.END)
+                for result in found:
+                    name = os.path.relpath(result.path, self.workspace_index.root)
+                    result_list.insert(tk.END, f"{name}:{result.line}  {result.snippet}")
+                status_label.config(text=f"找到 {len(found)} 个文件")
+            
+            def open_result(event=None):
+                selection = result_list.curselection()
+                if selection:
+                    result = results[selection[0]]
+                    self._open_location(result.path, result.line, result.column, result.length)
+            
+            def change_workspace():
+                if self._choose_workspace():
+                    result_list.delete(0, tk.END)
+                    refresh_index()
+            
+            ttk.Button(top_frame, text="搜索", command=do_search).pack(side=tk.LEFT)
+            ttk.Button(top_frame, text="更换文件夹...", command=change_workspace).pack(side=tk.LEFT, padx=5)
+            query_entry.bind("\u003cReturn\u003e", lambda event: do_search())
+            result_list.bind("\u003cDouble-Button-1\u003e", open_result)
+            result_list.bind("\u003cReturn\u003e", open_result)
+            
+            refresh_index()
+        except Exception as e:
+            log_error(f"创建工作区搜索对话框失败: {str(e)}")
+            messagebox.showerror("错误", f"打开工作区搜索失败: {str(e)}")
+    
+    def check_workspace_links(self):
+        """检查工作区中所有本地链接和锚点，在对话框中列出失效的链接"""
+        try:
+            log_info("执行链接检查操作")
+            if self.workspace_index is None and not self._choose_workspace():
+                return
+            root_dir = self.workspace_index.root
+            
+            dialog = tk.Toplevel(self.root)
+            dialog.title("链接检查")
+            dialog.geometry("640x420")
+            dialog.transient(self.root)
+            
+            status_label = ttk.Label(dialog, anchor=tk.W, text=f"正在检查: {root_dir}")
+            status_label.pack(fill=tk.X, padx=5, pady=5)
+            
+            list_frame = ttk.Frame(dialog)
+            list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            scrollbar = ttk.Scrollbar(list_frame)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            result_list = tk.Listbox(list_frame, yscrollcommand=scrollbar.set, font=(self.font_family, 10))
+            result_list.pack(fill=tk.BOTH, expand=True)
+            scrollbar.config(command=result_list.yview)
+            broken = []
+            outcome = {}
+            
+            # 解析在后台线程（及其进程池）中进行，只重新解析修改过的文件
+            def run():
+                try:
+                    graph = LinkGraph(root_dir)
+                    graph.update(executor=self.batch_executor, max_workers=self.batch_workers)
+                    outcome['broken'] = graph.check()
+                    outcome['files'] = len(graph.files)
+                except Exception as e:
+                    log_error(f"链接检查失败: {str(e)}")
+                    outcome['error'] = str(e)
+            
+            def wait():
+                if not dialog.winfo_exists():
+                    return
+                if worker.is_alive():
+                    dialog.after(100, wait)
+                    return
+                if 'error' in outcome:
+                    status_label.config(text=f"链接检查失败: {outcome['error']}")
+                    return
+                broken[:] = outcome['broken']
+                for item in broken:
+                    name = os.path.relpath(item.source, root_dir)
+                    result_list.insert(tk.END, f"{name}:{item.line or '?'}  {item.target}  {item.reason}")
+                status_label.config(text=f"检查了 {outcome['files']} 个文件，{len(broken)} 个失效链接")
+            
+            def open_result(event=None):
+                selection = result_list.curselection()
+                if selection:
+                    item = broken[selection[0]]
+                    self._open_location(item.source, item.line or 1)
+            
+            result_list.bind("\u003cDouble-Button-1\u003e", open_result)
+            result_list.bind("\u003cReturn\u003e", open_result)
+            
+            worker = threading.Thread(target=run, name="LinkCheck", daemon=True)
+            worker.start()
+            wait()
+        except Exception as e:
+            log_error(f"创建链接检查对话框失败: {str(e)}")
+            messagebox.showerror("错误", f"打开链接检查失败: {str(e)}")
+    
+    def _open_location(self, path, line, column=0, length=0):
+        """
+        打开文件并跳转到指定位置，用于搜索结果和链接检查结果
+        
+        Args:
+            path (str): 文件路径
+            line (int): 行号（从1开始）
+            column (int): 列号
+            length (int): 需要高亮的字符数
+        """
+        try:
+            content = read_text(path)
+            self._open_document(path, content)
+            
+            start = f"{line}.{column}"
+            end = f"{start}+{length}c"
+            self.text_editor.tag_remove("search", "1.0", tk.END)
+            if length:
+                self.text_editor.tag_add("search", start, end)
+                self.text_editor.tag_config("search", background="yellow", foreground="black")
+            self.text_editor.mark_set(tk.INSERT, end)
+            self.text_editor.see(start)
+            self.text_editor.focus_set()
+            log_debug(f"跳转到: {path}:{line}")
+        except Exception as e:
+            log_error(f"打开文件位置失败: {str(e)}")
+            messagebox.showerror("错误", f"无法打开文件: {str(e)}")
+    
+    def show_metrics(self):
+        """显示进程内性能指标（吞吐量、耗时分布、缓存命中和队列深度），每秒刷新"""
+        try:
+            log_info("显示性能统计")
+            dialog = tk.Toplevel(self.root)
+            dialog.title("性能统计")
+            dialog.geometry("760x460")
+            dialog.transient(self.root)
+            
+            columns = ("labels", "value")
+            tree = ttk.Treeview(dialog, columns=columns)
+            tree.heading("#0", text="指标")
+            tree.heading("labels", text="标签")
+            tree.heading("value", text="值")
+            tree.column("#0", width=300)
+            tree.column("labels", width=160)
+            tree.column("value", width=280)
+            scrollbar = ttk.Scrollbar(dialog, command=tree.yview)
+            tree.config(yscrollcommand=scrollbar.set)
+            
+            btn_frame = ttk.Frame(dialog)
+            btn_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            
+            def describe(metric):
+                if metric.kind != 'histogram':
+                    value = metric.value
+                    return f"{value:g}" if isinstance(value, float) else str(value)
+                sample = metric.sample()
+                if not sample['count']:
+                    return "无记录"
+                average = sample['sum'] / sample['count'] * 1000
+                return (f"{sample['count']} 次，平均 {average:.1f}ms，"
+                        f"p50 {metric.quantile(0.5) * 1000:.1f}ms，p95 {metric.quantile(0.95) * 1000:.1f}ms")
+            
+            def refresh():
+                if not dialog.winfo_exists():
+                    return
+                rows = {}
+                for metric in REGISTRY.metrics():
+                    labels = ", ".join(f"{key}={value}" for key, value in metric.labels)
+                    rows[f"{metric.name}|{labels}"] = (metric.name, labels, describe(metric))
+                for item in tree.get_children():
+                    if item not in rows:
+                        tree.delete(item)
+                for item, (name, labels, value) in rows.items():
+                    if tree.exists(item):
+                        tree.item(item, values=(labels, value))
+                    else:
+                        tree.insert("", tk.END, iid=item, text=name, values=(labels, value))
+                dialog.after(1000, refresh)
+            
+            def copy_prometheus():
+                self.root.clipboard_clear()
+                self.root.clipboard_append(REGISTRY.to_prometheus())
+            
+            def export():
+                path = filedialog.asksaveasfilename(
+                    parent=dialog,
+                    title="导出性能统计",
+                    defaultextension=".json",
+                    filetypes=[("JSON", "*.json"), ("Prometheus文本", "*.prom")]
+                )
+                if not path:
+                    return
+                try:
+                    REGISTRY.dump(path)
+                    log_info(f"性能统计已导出: {path}")
+                except Exception as e:
+                    log_error(f"导出性能统计失败: {str(e)}")
+                    messagebox.showerror("错误", f"导出失败: {str(e)}", parent=dialog)
+            
+            ttk.Button(btn_frame, text="复制为Prometheus文本", command=copy_prometheus).pack(side=tk.LEFT, padx=5)
+            ttk.Button(btn_frame, text="导出...", command=export).pack(side=tk.LEFT, padx=5)
+            ttk.Button(btn_frame, text="关闭", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+            
+            refresh()
+        except Exception as e:
+            log_error(f"显示性能统计失败: {str(e)}")
+            messagebox.showerror("错误", f"显示性能统计失败: {str(e)}")
+    
     def show_about(self):
         """显示关于对话框"""
         try:
@@ -0,0 +1,211 @@
+import sys
+import time
+from array import array
+from collections import deque
+from textdiff import common_affixes
+
+# 单个文档撤销历史的默认内存上限（字节）
+DEFAULT_UNDO_BUDGET = 8 * 1024 * 1024
+
+# 间隔小于该秒数的连续输入或删除合并为一个撤销步骤
+DEFAULT_COALESCE_SECONDS = 1.0
+
+# 每个撤销条目除文本外的固定开销估算
+_ENTRY_OVERHEAD = 200
+
+
+class UndoEntry:
+    """
+    一个撤销步骤
+    由若干差异片段组成，每个片段为 (起始偏移, 旧文本, 新文本)，按偏移升序排列，
+    偏移均相对于修改前的文档。
+    批量替换时所有片段的旧文本和新文本通常都相同，此时只保存一份文本和偏移数组
+    """
+
+    __slots__ = ('starts', 'olds', 'news', 'time', 'size')
+
+    def __init__(self, hunks):
+        self.starts = array('q', (start for start, _, _ in hunks))
+        olds = [old for _, old, _ in hunks]
+        news = [new for _, _, new in hunks]
+        # 所有片段相同的文本只保存一份
+        self.olds = olds[0] if olds.count(olds[0]) == len(olds) else olds
+        self.news = news[0] if news.count(news[0]) == len(news) else news
+        self.time = time.monotonic()
+
+        size = _ENTRY_OVERHEAD + sys.getsizeof(self.starts)
+        for texts in (self.olds, self.news):
+            if isinstance(texts, str):
+                size += sys.getsizeof(texts)
+            else:
+                size += sys.getsizeof(texts) + sum(sys.getsizeof(text) for text in texts)
+        self.size = size
+
+    @property
+    def hunks(self):
+        """展开为 (起始偏移, 旧文本, 新文本) 列表"""
+        count = len(self.starts)
+        olds = [self.olds] * count if isinstance(self.olds, str) else self.olds
+        news = [self.news] * count if isinstance(self.news, str) else self.news
+        return list(zip(self.starts, olds, news))
+
+    def inverted(self):
+        """
+        生成反向操作的片段，偏移换算为相对于修改后的文档
+
+        Returns:
+            list: (起始偏移, 旧文本, 新文本) 列表
+        """
+        hunks = []
+        shift = 0
+        for start, old, new in self.hunks:
+            hunks.append((start + shift, new, old))
+            shift += len(new) - len(old)
+        return hunks
+
+
+class UndoHistory:
+    """
+    有内存上限的撤销历史
+    条目只保存差异片段；连续的输入和删除会合并为一个步骤，
+    总占用超过上限时丢弃最早的条目
+    """
+
+    def __init__(self, max_bytes=DEFAULT_UNDO_BUDGET, coalesce_seconds=DEFAULT_COALESCE_SECONDS):
+        """
+        初始化撤销历史
+
+        Args:
+            max_bytes (int): 撤销和重做条目的内存上限（字节）
+            coalesce_seconds (float): 连续编辑合并的时间窗口
+        """
+        self.max_bytes = max_bytes
+        self.coalesce_seconds = coalesce_seconds
+        self._undo = deque()
+        self._redo = []
+        self.total_bytes = 0
+        self.evicted = 0
+
+    def record(self, old_text, new_text):
+        """
+        根据修改前后的文本记录一次编辑
+
+        Args:
+            old_text (str): 修改前的文本
+            new_text (str): 修改后的文本
+        """
+        if old_text == new_text:
+            return
+        prefix, suffix = common_affixes(old_text, new_text)
+        hunk = (prefix, old_text[prefix:len(old_text) - suffix], new_text[prefix:len(new_text) - suffix])
+        if not self._coalesce(hunk):
+            self._push(UndoEntry([hunk]))
+
+    def record_hunks(self, hunks):
+        """
+        记录由多个分散片段组成的批量修改，例如全部替换
+
+        Args:
+            hunks (list): (起始偏移, 旧文本, 新文本) 列表，偏移相对于修改前的文档并按升序排列
+        """
+        if hunks:
+            self._push(UndoEntry(hunks))
+
+    def _coalesce(self, hunk):
+        """尝试把连续的单字符输入或删除并入上一个步骤"""
+        if not self._undo or self._redo:
+            return False
+        last = self._undo[-1]
+        if len(last.starts) != 1 or time.monotonic() - last.time > self.coalesce_seconds:
+            return False
+
+        start, old, new = hunk
+        last_start, last_old, last_new = last.hunks[0]
+        if not old and not last_old and start == last_start + len(last_new) and '\n' not in new:
+            merged = (last_start, '', last_new + new)             # 连续输入
+        elif not new and not last_new and start + len(old) == last_start:
+            merged = (start, old + last_old, '')                  # 连续退格
+        elif not new and not last_new and start == last_start:
+            merged = (start, last_old + old, '')                  # 连续向后删除
+        else:
+            return False
+
+        self.total_bytes -= last.size
+        self._undo.pop()
+        entry = UndoEntry([merged])
+        self._undo.append(entry)
+        self.total_bytes += entry.size
+        return True
+
+    def _push(self, entry):
+        """加入新的撤销条目，清空重做栈并按内存上限淘汰最早的条目"""
+        for old_entry in self._redo:
+            self.total_bytes -= old_entry.size
+        self._redo.clear()
+        self._undo.append(entry)
+        self.total_bytes += entry.size
+        while self.total_bytes > self.max_bytes and len(self._undo) > 1:
+            self.total_bytes -= self._undo.popleft().size
+            self.evicted += 1
+
+    def undo(self):
+        """
+        撤销一步
+
+        Returns:
+            list: 需要应用到当前文档的片段，没有可撤销的操作时返回None
+        """
+        if not self._undo:
+            return None
+        entry = self._undo.pop()
+        self._redo.append(entry)
+        return entry.inverted()
+
+    def redo(self):
+        """
+        重做一步
+
+        Returns:
+            list: 需要应用到当前文档的片段，没有可重做的操作时返回None
+        """
+        if not self._redo:
+            return None
+        entry = self._redo.pop()
+        entry.time = 0  # 重做后的条目不再参与合并
+        self._undo.append(entry)
+        return list(entry.hunks)
+
+    def reset(self):
+        """清空撤销历史"""
+        self._undo.clear()
+        self._redo.clear()
+        self.total_bytes = 0
+
+    @property
+    def undo_count(self):
+        return len(self._undo)
+
+    @property
+    def redo_count(self):
+        return len(self._redo)
+
+
+def apply_hunks(text, hunks):
+    """
+    把片段应用到字符串上（片段偏移相对于应用前的文本）
+
+    Args:
+        text (str): 原文本
+        hunks (list): (起始偏移, 旧文本, 新文本) 列表，按偏移升序排列
+
+    Returns:
+        str: 应用后的文本
+    """
+    parts = []
+    pos = 0
+    for start, old, new in hunks:
+        parts.append(text[pos:start])
+        parts.append(new)
+        pos = start + len(old)
+    parts.append(text[pos:])
+    return ''.join(parts)